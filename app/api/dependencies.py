@@ -1,14 +1,46 @@
-from fastapi import Depends, HTTPException, status, Cookie
-from sqlalchemy.orm import Session
+from fastapi import Depends, HTTPException, status, Cookie, Query, Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 from typing import Optional
+from core.config import USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS, AUTH_CLAIMS_ONLY
+from core.instrumentation import route_metrics
 from models.model import UserMaster
 from schemas.common_schemas import UserToken
-from services.base_service import BaseService
+from services.base_service import AsyncBaseService
+from utils.cache import TTLCache
 from utils.security import verify_access_token
 
 # def get_user_master_crud():
 #     return CRUDBase()
 
+# Authenticated users keyed by (user_id, token jti/iat). Only active, unlocked users are cached.
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl_seconds=USER_CACHE_TTL_SECONDS)
+route_metrics.register_cache("user", user_cache)
+
+def invalidate_user(user_id) -> int:
+    """Drop every cached token of a user (call after locking, deleting or changing their role)."""
+    user_id = str(user_id)
+    return user_cache.invalidate_where(lambda key: key[0] == user_id)
+
+@event.listens_for(UserMaster, "after_update")
+@event.listens_for(UserMaster, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    """
+    Note the user for eviction once the change commits: evicting at flush would let a concurrent
+    request re-cache the old row before the commit. Other worker processes keep their entry
+    until USER_CACHE_TTL_SECONDS runs out.
+    """
+    object_session(target).info.setdefault("invalidated_users", set()).add(target.id)
+
+@event.listens_for(Session, "after_commit")
+def _evict_committed_users(session):
+    for user_id in session.info.pop("invalidated_users", ()):
+        invalidate_user(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session):
+    session.info.pop("invalidated_users", None)
+
 async def get_current_user(access_token: Optional[str] = Cookie(None)) -> UserToken:
     if access_token is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing access token")
@@ -21,17 +53,45 @@ async def get_current_user(access_token: Optional[str] = Cookie(None)) -> UserTo
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token missing subject (sub)")
 
-    user_master_crud = BaseService(UserMaster)
-    user = user_master_crud.get_by_id(obj_id=user_id)
+    if AUTH_CLAIMS_ONLY and all(payload.get(claim) is not None for claim in ("role", "tenant_id", "username")):
+        # Stateless path: the signature vouches for the claims, no central-DB read
+        return UserToken(id=user_id, tenant_id=payload["tenant_id"], username=payload["username"], role=payload["role"])
+
+    cache_key = (str(user_id), payload.get("jti") or payload.get("iat"))
+    cached = user_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    user_master_crud = AsyncBaseService(UserMaster)
+    user = await user_master_crud.get_by_id(obj_id=user_id)
     # user = db.query(UserMaster).filter(UserMaster.id == user_id).first()
-    if not user:
+    if not user or user.is_deleted:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User is inactive")
+    if user.is_account_lock:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Account is locked")
 
     # Map ORM model to schema
-    return UserToken.model_validate(user)
+    current_user = UserToken.model_validate(user)
+    user_cache.set(cache_key, current_user)
+    return current_user
+
+PAGINATION_PARAMS = {"limit", "cursor", "sort", "include_total"}
+
+async def pagination_params(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, description="Page size (capped by the service)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    sort: Optional[str] = Query(None, description="Sortable field, prefix with '-' for descending"),
+    include_total: bool = Query(False, description="Also return the total number of matching rows"),
+) -> dict:
+    """Common list parameters; any other query parameter is an equality filter checked by the service."""
+    filters = {key: value for key, value in request.query_params.items() if key not in PAGINATION_PARAMS}
+    return {"limit": limit, "cursor": cursor, "sort": sort, "filters": filters, "include_total": include_total}
 
 def require_roles(*roles: str):
-    def role_guard(UserToken: UserToken = Depends(get_current_user)) -> UserToken:
+    async def role_guard(UserToken: UserToken = Depends(get_current_user)) -> UserToken:
         if UserToken.role not in roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -42,3 +102,5 @@ def require_roles(*roles: str):
 
 
 
+
+
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
+from core.instrumentation import InstrumentedRoute
 from typing import List
 from uuid import UUID
 from schemas.class_subject_schemas import (
@@ -6,71 +7,86 @@ from schemas.class_subject_schemas import (
     ClassStudentCreate, ClassStudentResponse,
     ClassSubjectCreate, ClassSubjectResponse
 )
+from schemas.common_schemas import Page
 from services.class_service import ClassService
+from api.dependencies import pagination_params
 # from api.dependencies import require_roles
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
-@router.get("/", response_model=List[ClassResponse])
-def list_classes():
+@router.get("/", response_model=Page[ClassResponse])
+async def list_classes(page: dict = Depends(pagination_params)):
     service = ClassService(tenant_id="1")
-    result = service.get_all()
+    result = await service.get_page(**page)
     return result
 
 @router.get("/{class_id}", response_model=ClassResponse)
-def get_class(class_id: UUID):
+async def get_class(class_id: UUID):
     service = ClassService(tenant_id="1")
-    klass = service.get_by_id(class_id)
+    klass = await service.get_by_id(class_id)
     if not klass:
         raise HTTPException(status_code=404, detail="Class not found")
     return klass
 
 @router.post("/", response_model=ClassResponse)
-def create_class(class_in: ClassCreate):
+async def create_class(class_in: ClassCreate):
     service = ClassService(tenant_id="1")
-    klass = service.create(class_in)
+    klass = await service.create(class_in)
     return klass
 
 @router.put("/{class_id}", response_model=ClassResponse)
-def update_class(class_id: UUID, class_in: ClassUpdate):
+async def update_class(class_id: UUID, class_in: ClassUpdate):
     service = ClassService(tenant_id="1")
-    klass = service.update(class_id, class_in)
+    klass = await service.update(class_id, class_in)
     if not klass:
         raise HTTPException(status_code=404, detail="Class not found")
     return klass
 
 @router.delete("/{class_id}")
-def delete_class(class_id: UUID):
+async def delete_class(class_id: UUID):
     service = ClassService(tenant_id="1")
-    result = service.delete(class_id)
+    result = await service.delete(class_id)
     if not result:
         raise HTTPException(status_code=404, detail="Class not found")
     return {"message": "Class deleted successfully"}
 
 @router.post("/{class_id}/students/", response_model=List[ClassStudentResponse])
-def add_students_to_class(class_id: UUID, students: List[ClassStudentCreate]):
+async def add_students_to_class(class_id: UUID, students: List[ClassStudentCreate]):
     service = ClassService(tenant_id="1")  # Replace with real tenant_id in production
-    result = service.add_students(class_id, students)
+    result = await service.add_students(class_id, students)
     return result
 
 @router.delete("/{class_id}/students/{student_id}")
-def remove_student_from_class(class_id: UUID, student_id: int):
+async def remove_student_from_class(class_id: UUID, student_id: int):
     service = ClassService(tenant_id="1")
-    result = service.remove_student(class_id, student_id)
+    result = await service.remove_student(class_id, student_id)
     if not result:
         raise HTTPException(status_code=404, detail="Student not found in class")
     return {"message": "Student removed from class"}
 
+@router.post("/{class_id}/students/remove")
+async def remove_students_from_class(class_id: UUID, student_ids: List[int]):
+    """Bulk unenroll; returns the ids that were actually enrolled and have been removed."""
+    service = ClassService(tenant_id="1")
+    removed = await service.remove_students(class_id, student_ids)
+    return {"removed": removed, "message": f"{len(removed)} students removed from class"}
+
 @router.post("/{class_id}/subjects/", response_model=List[ClassSubjectResponse])
-def add_subjects_to_class(class_id: UUID, subjects: List[ClassSubjectCreate]):
+async def add_subjects_to_class(class_id: UUID, subjects: List[ClassSubjectCreate]):
     service = ClassService(tenant_id="1")
-    result = service.add_subjects(class_id, subjects)
+    result = await service.add_subjects(class_id, subjects)
     return result
 
 @router.delete("/{class_id}/subjects/{subject_id}")
-def remove_subject_from_class(class_id: UUID, subject_id: UUID):
+async def remove_subject_from_class(class_id: UUID, subject_id: UUID):
     service = ClassService(tenant_id="1")
-    result = service.remove_subject(class_id, subject_id)
+    result = await service.remove_subject(class_id, subject_id)
     if not result:
         raise HTTPException(status_code=404, detail="Subject not found in class")
-    return {"message": "Subject removed from class"} 
\ No newline at end of file
+    return {"message": "Subject removed from class"}
+
+@router.post("/{class_id}/subjects/remove")
+async def remove_subjects_from_class(class_id: UUID, subject_ids: List[UUID]):
+    service = ClassService(tenant_id="1")
+    removed = await service.remove_subjects(class_id, subject_ids)
+    return {"removed": removed, "message": f"{len(removed)} subjects removed from class"}
@@ -1,103 +1,174 @@
+from datetime import date as date_type
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import List, Optional
-from schemas.schedule import ScheduleCreate, ScheduleUpdate, ScheduleResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from core.instrumentation import InstrumentedRoute
+from typing import Dict, List, Optional
+from schemas.schedule import ScheduleCreate, ScheduleUpdate, ScheduleResponse, ScheduleConflict, TimetableGenerateRequest, TimetableJob, FreeSlot, SubstitutePlanRequest, SubstitutePlan, ScheduleSubstitutionResponse, ScheduleWeekEntry, ScheduleWeekResult
+from services.availability_service import AvailabilityService
+from services.substitute_service import SubstituteService
 from services.schedule_service import ScheduleService
+from services.timetable_service import TimetableService
 from api.dependencies import require_roles
 from schemas.common_schemas import UserToken
 from collections import defaultdict
-from utils.constants import DayOfWeekEnum
+from utils.constants import MAX_PERIOD_NUMBER, DayOfWeekEnum
 from models.model import Class
 from schemas.schedule import ScheduleGroupedResponse
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
 @router.get("/", response_model=List[ScheduleResponse])
-def list_schedules(
+async def list_schedules(
     class_id: Optional[UUID] = Query(None),
     day_of_week: Optional[str] = Query(None),
     current_user: UserToken = Depends(require_roles("admin", "teacher"))
 ):
     service = ScheduleService(current_user.tenant_id)
-    schedules = service.list(class_id=class_id, day_of_week=day_of_week)
+    schedules = await service.list(class_id=class_id, day_of_week=day_of_week)
     return schedules
 
+@router.post("/conflicts", response_model=List[ScheduleConflict])
+async def check_schedule_conflicts(entries: List[ScheduleCreate], current_user: UserToken = Depends(require_roles("admin", "teacher"))):
+    """Dry-run a batch of entries: every class, room or teacher double-booking, without saving anything."""
+    service = ScheduleService(current_user.tenant_id)
+    return await service.find_conflicts([entry.model_dump() for entry in entries])
+
+@router.get("/availability/teachers", response_model=List[UUID])
+async def get_free_teachers(
+    day_of_week: DayOfWeekEnum,
+    period_number: int = Query(..., ge=1, le=MAX_PERIOD_NUMBER),
+    subject_id: Optional[UUID] = Query(None, description="Only teachers assigned to this subject"),
+    current_user: UserToken = Depends(require_roles("admin", "teacher"))
+):
+    """Active teachers with nothing booked in the slot."""
+    service = AvailabilityService(current_user.tenant_id)
+    return await service.free_teachers(day_of_week, period_number, subject_id)
+
+@router.get("/availability/rooms", response_model=List[str])
+async def get_free_rooms(
+    day_of_week: DayOfWeekEnum,
+    period_number: int = Query(..., ge=1, le=MAX_PERIOD_NUMBER),
+    current_user: UserToken = Depends(require_roles("admin", "teacher"))
+):
+    service = AvailabilityService(current_user.tenant_id)
+    return await service.free_rooms(day_of_week, period_number)
+
+@router.get("/availability/common-slots", response_model=List[FreeSlot])
+async def get_common_free_slots(
+    teacher_ids: List[UUID] = Query(...),
+    days: Optional[List[DayOfWeekEnum]] = Query(None),
+    current_user: UserToken = Depends(require_roles("admin", "teacher"))
+):
+    """Slots in which every one of the teachers is free, e.g. for a meeting."""
+    service = AvailabilityService(current_user.tenant_id)
+    return await service.common_free_slots(teacher_ids, days)
+
+@router.post("/substitutes", response_model=SubstitutePlan)
+async def plan_substitutes(request_in: SubstitutePlanRequest, current_user: UserToken = Depends(require_roles("admin"))):
+    """Assign substitutes to every period of the absent teachers on that day (or just propose them with dry_run)."""
+    service = SubstituteService(current_user.tenant_id)
+    return await service.plan(request_in)
+
+@router.get("/substitutes", response_model=List[ScheduleSubstitutionResponse])
+async def list_substitutes(date: date_type, current_user: UserToken = Depends(require_roles("admin", "teacher"))):
+    """Substitutions made for a date, by period."""
+    service = SubstituteService(current_user.tenant_id)
+    return await service.list_for_date(date)
+
+@router.delete("/substitutes/{substitution_id}")
+async def remove_substitute(substitution_id: UUID, current_user: UserToken = Depends(require_roles("admin"))):
+    service = SubstituteService(current_user.tenant_id)
+    if not await service.remove(substitution_id):
+        raise HTTPException(status_code=404, detail="Substitution not found")
+    return {"message": "Substitution removed successfully"}
+
+@router.post("/generate", response_model=TimetableJob, status_code=202)
+async def generate_timetable(request_in: TimetableGenerateRequest, current_user: UserToken = Depends(require_roles("admin"))):
+    """Start generating a clash-free timetable for the classes; poll GET /schedules/generate/{job_id} for progress."""
+    service = TimetableService(current_user.tenant_id)
+    return await service.start(request_in)
+
+@router.get("/generate/{job_id}", response_model=TimetableJob)
+async def get_timetable_job(job_id: UUID, current_user: UserToken = Depends(require_roles("admin"))):
+    service = TimetableService(current_user.tenant_id)
+    return await service.get_job(job_id)
+
 @router.get("/{schedule_id}", response_model=ScheduleResponse)
-def get_schedule(schedule_id: UUID, current_user: UserToken = Depends(require_roles("admin", "teacher"))):
+async def get_schedule(schedule_id: UUID, current_user: UserToken = Depends(require_roles("admin", "teacher"))):
     service = ScheduleService(current_user.tenant_id)
-    schedule = service.get_by_id(schedule_id)
+    schedule = await service.get_by_id(schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule not found")
     return schedule
 
 @router.post("/", response_model=ScheduleResponse)
-def create_schedule(schedule_in: ScheduleCreate, current_user: UserToken = Depends(require_roles("admin"))):
+async def create_schedule(schedule_in: ScheduleCreate, current_user: UserToken = Depends(require_roles("admin"))):
     service = ScheduleService(current_user.tenant_id)
-    schedule = service.create(schedule_in)
+    schedule = await service.create(schedule_in)
     return schedule
 
 @router.put("/{schedule_id}", response_model=ScheduleResponse)
-def update_schedule(schedule_id: UUID, schedule_in: ScheduleUpdate, current_user: UserToken = Depends(require_roles("admin"))):
+async def update_schedule(schedule_id: UUID, schedule_in: ScheduleUpdate, current_user: UserToken = Depends(require_roles("admin"))):
     service = ScheduleService(current_user.tenant_id)
-    schedule = service.update(schedule_id, schedule_in)
+    schedule = await service.update(schedule_id, schedule_in)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule not found")
     return schedule
 
 @router.delete("/{schedule_id}")
-def delete_schedule(schedule_id: UUID, current_user: UserToken = Depends(require_roles("admin"))):
+async def delete_schedule(schedule_id: UUID, current_user: UserToken = Depends(require_roles("admin"))):
     service = ScheduleService(current_user.tenant_id)
-    result = service.delete(schedule_id)
+    result = await service.delete(schedule_id)
     if not result:
         raise HTTPException(status_code=404, detail="Schedule not found")
     return {"message": "Schedule deleted successfully"}
 
-@router.get("/class/{class_id}/timetable", response_model=ScheduleGroupedResponse)
-def get_class_schedule_grouped(
+@router.put("/class/{class_id}/week", response_model=ScheduleWeekResult)
+async def replace_class_week(class_id: UUID, entries: List[ScheduleWeekEntry], current_user: UserToken = Depends(require_roles("admin"))):
+    """Replace the class's whole weekly timetable; slots left out are removed."""
+    service = ScheduleService(current_user.tenant_id)
+    return await service.replace_week(class_id, entries)
+
+# The grids are served as cached JSON bytes, so the schema is documented rather than enforced
+TIMETABLE_RESPONSES = {200: {"model": ScheduleGroupedResponse, "description": "{day: {period_number: cell}}"}}
+
+@router.get("/class/{class_id}/timetable", response_class=Response, responses=TIMETABLE_RESPONSES)
+async def get_class_schedule_grouped(
     class_id: UUID,
     current_user: UserToken = Depends(require_roles("admin", "teacher"))
 ):
     """Get the full schedule for a class, grouped by day and ordered by period. Includes period timings from class config."""
     service = ScheduleService(current_user.tenant_id)
-    schedule_map = service.get_class_timetable(class_id)
-    # Fetch class to get period_times
-    klass = service.class_service.get_by_id(class_id)
-    period_times = klass.period_times if klass and klass.period_times else {}
-    result = {}
-    for day, periods in schedule_map.items():
-        result[day] = {}
-        for period_num, schedule in periods.items():
-            period_time = period_times.get(str(period_num))
-            if schedule is not None:
-                # Convert to dict and add period_time info
-                resp = ScheduleResponse.from_orm(schedule).dict()
-                if period_time:
-                    resp["start_time"] = period_time.get("start_time")
-                    resp["end_time"] = period_time.get("end_time")
-                result[day][period_num] = resp
-            else:
-                # No schedule, but still provide period_time if available
-                if period_time:
-                    result[day][period_num] = {"start_time": period_time.get("start_time"), "end_time": period_time.get("end_time")}
-                else:
-                    result[day][period_num] = None
-    return ScheduleGroupedResponse(result)
-
-# @router.get("/teacher/{teacher_id}/timetable", response_model=ScheduleGroupedResponse)
-def get_teacher_schedule_grouped(
+    return Response(content=await service.get_class_timetable(class_id), media_type="application/json")
+
+@router.get("/teacher/{teacher_id}/timetable", response_class=Response, responses=TIMETABLE_RESPONSES)
+async def get_teacher_schedule_grouped(
     teacher_id: UUID,
     current_user: UserToken = Depends(require_roles("admin", "teacher"))
 ):
-    """Get the full schedule for a teacher, grouped by day and ordered by period."""
+    """Get the full schedule for a teacher, including co-teaching and substitute periods (each cell has a `role`)."""
+    service = ScheduleService(current_user.tenant_id)
+    grids = await service.get_teacher_timetables([teacher_id])
+    if teacher_id not in grids:
+        raise HTTPException(status_code=404, detail="Teacher not found")
+    return Response(content=grids[teacher_id], media_type="application/json")
+
+@router.get(
+    "/teachers/timetable", response_class=Response,
+    responses={200: {"model": Dict[UUID, ScheduleGroupedResponse], "description": "{teacher_id: {day: {period_number: cell}}}"}},
+)
+async def get_teachers_schedules_grouped(
+    teacher_ids: Optional[List[UUID]] = Query(None),
+    department: Optional[str] = Query(None, description="All active teachers of the department"),
+    current_user: UserToken = Depends(require_roles("admin", "teacher"))
+):
+    """Timetables of many teachers at once, keyed by teacher id."""
+    if not teacher_ids and not department:
+        raise HTTPException(status_code=400, detail="Give teacher_ids or department")
     service = ScheduleService(current_user.tenant_id)
-    schedule_map = service.get_teacher_timetable(teacher_id)
-    # Convert to response schema - handle None values for empty periods
-    result = {}
-    for day, periods in schedule_map.items():
-        result[day] = {}
-        for period_num, schedule in periods.items():
-            if schedule is not None:
-                result[day][period_num] = ScheduleResponse.from_orm(schedule)
-            else:
-                result[day][period_num] = None
-    return ScheduleGroupedResponse(result) 
\ No newline at end of file
+    ids = list(teacher_ids or [])
+    if department:
+        ids += await service.department_teacher_ids(department)
+    grids = await service.get_teacher_timetables(ids)
+    body = b",".join(b'"%s":%s' % (str(teacher_id).encode(), grid) for teacher_id, grid in grids.items())
+    return Response(content=b"{" + body + b"}", media_type="application/json")
@@ -1,47 +1,60 @@
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from core.instrumentation import InstrumentedRoute
 from sqlalchemy.orm import Session
-from schemas.student import StudentCreate, StudentUpdate, StudentResponse, StudentResponseMessage
+from schemas.student import StudentCreate, StudentUpdate, StudentResponse, StudentResponseMessage, StudentImportReport
 from services.student_service import StudentService
-from api.dependencies import require_roles
-from schemas.common_schemas import UserToken
+from api.dependencies import require_roles, pagination_params
+from schemas.common_schemas import UserToken, Page
+from utils.file_utils import iter_table_rows
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
-@router.get("/", response_model=list[StudentResponse])
-def read_students(current_user: UserToken = Depends(require_roles("admin", "teacher"))):
+@router.get("/", response_model=Page[StudentResponse])
+async def read_students(page: dict = Depends(pagination_params), current_user: UserToken = Depends(require_roles("admin", "teacher"))):
     student_service = StudentService(current_user.tenant_id)
-    return student_service.get_all()
+    return await student_service.get_page(**page)
+
+@router.post("/import", response_model=StudentImportReport)
+async def import_students(
+    file: UploadFile = File(..., description="CSV or XLSX sheet, one student per row"),
+    dry_run: bool = Query(False, description="Validate everything but roll back the inserts"),
+    current_user: UserToken = Depends(require_roles("admin")),
+):
+    """Bulk admission import. Valid rows are created; the report lists the errors of every rejected row."""
+    student_service = StudentService(current_user.tenant_id)
+    rows = iter_table_rows(file.file, file.filename)
+    return await student_service.bulk_import(rows, dry_run=dry_run)
 
 @router.get("/{student_id}", response_model=StudentResponse)
-def read_student(student_id: int, current_user: UserToken = Depends(require_roles("admin", "teacher"))):
+async def read_student(student_id: int, current_user: UserToken = Depends(require_roles("admin", "teacher"))):
     student_service = StudentService(current_user.tenant_id)
-    student = student_service.get_by_id(student_id)
+    student = await student_service.get_by_id(student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     return student
 
 # @router.post("/", response_model=StudentResponse)
 @router.post("/", response_model=StudentResponseMessage)
-def create_new_student(student: StudentCreate, current_user: UserToken = Depends(require_roles("admin", "teacher"))):
+async def create_new_student(student: StudentCreate, current_user: UserToken = Depends(require_roles("admin", "teacher"))):
     student_service = StudentService(current_user.tenant_id)
-    student = student_service.create(student)
+    student = await student_service.create(student)
     return {"id":student.id, "message": "Student created successfully"}
 
 # @router.put("/{student_id}", response_model=StudentResponse)
 @router.put("/{student_id}", response_model=StudentResponseMessage)
-def update_existing_student(student_id: int, student: StudentUpdate, current_user: UserToken = Depends(require_roles("admin", "teacher"))):
+async def update_existing_student(student_id: int, student: StudentUpdate, current_user: UserToken = Depends(require_roles("admin", "teacher"))):
     student_service = StudentService(current_user.tenant_id)
-    updated_student = student_service.update(student_id, student)
+    updated_student = await student_service.update(student_id, student)
     if not updated_student:
         raise HTTPException(status_code=404, detail="Student not found")
     # return updated_student
     return {"id":updated_student.id, "message": "Student updated successfully"}
 
 @router.delete("/{student_id}")
-def delete_existing_student(student_id: int, current_user: UserToken = Depends(require_roles("admin", "teacher"))):
+async def delete_existing_student(student_id: int, current_user: UserToken = Depends(require_roles("admin", "teacher"))):
     student_service = StudentService(current_user.tenant_id)
-    deleted_student = student_service.delete(student_id)
+    deleted_student = await student_service.delete(student_id)
     if not deleted_student:
         raise HTTPException(status_code=404, detail="Student not found")
     return {"message": "Student deleted successfully"}
@@ -1,60 +1,62 @@
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException
+from core.instrumentation import InstrumentedRoute
 from sqlalchemy.orm import Session
 from schemas.teacher_schemas import TeacherCreate, TeacherUpdate, TeacherResponse, TeacherResponseMessage
 from services.teacher_service import TeacherService
-from api.dependencies import require_roles
-from schemas.common_schemas import UserToken
+from api.dependencies import require_roles, pagination_params
+from schemas.common_schemas import UserToken, Page
 from pydantic import UUID4
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
-@router.get("/", response_model=list[TeacherResponse])
-def read_teachers(
+@router.get("/", response_model=Page[TeacherResponse])
+async def read_teachers(
+    page: dict = Depends(pagination_params),
     # current_user: UserToken = Depends(require_roles("admin", "teacher"))
 ):
     teacher_service = TeacherService(tenant_id="1")  # Fixed tenant_id for testing
-    return teacher_service.get_all()
+    return await teacher_service.get_page(**page)
 
 @router.get("/{teacher_id}", response_model=TeacherResponse)
-def read_teacher(
+async def read_teacher(
     teacher_id: UUID4,
     # current_user: UserToken = Depends(require_roles("admin"))
 ):
     teacher_service = TeacherService(tenant_id="1")  # Fixed tenant_id for testing
-    teacher = teacher_service.get_by_id(teacher_id)
+    teacher = await teacher_service.get_by_id(teacher_id)
     if not teacher:
         raise HTTPException(status_code=404, detail="Teacher not found")
     return teacher
 
 @router.post("/", response_model=TeacherResponseMessage)
-def create_teacher(
+async def create_teacher(
     teacher: TeacherCreate,
     # current_user: UserToken = Depends(require_roles("admin"))
 ):
     teacher_service = TeacherService(tenant_id="1")  # Fixed tenant_id for testing
-    teacher = teacher_service.create(teacher)
+    teacher = await teacher_service.create(teacher)
     return {"id": teacher.id, "message": "Teacher created successfully"}
 
 @router.put("/{teacher_id}", response_model=TeacherResponse)
-def update_teacher(
+async def update_teacher(
     teacher_id: UUID4,
     teacher: TeacherUpdate,
     # current_user: UserToken = Depends(require_roles("admin"))
 ):
     teacher_service = TeacherService(tenant_id="1")  # Fixed tenant_id for testing
-    updated_teacher = teacher_service.update(teacher_id, teacher)
+    updated_teacher = await teacher_service.update(teacher_id, teacher)
     if not updated_teacher:
         raise HTTPException(status_code=404, detail="Teacher not found")
     return updated_teacher
 
 @router.delete("/{teacher_id}")
-def delete_teacher(
+async def delete_teacher(
     teacher_id: UUID4,
     # current_user: UserToken = Depends(require_roles("admin"))
 ):
     teacher_service = TeacherService(tenant_id="1")  # Fixed tenant_id for testing
-    deleted_teacher = teacher_service.delete(teacher_id)
+    deleted_teacher = await teacher_service.delete(teacher_id)
     if not deleted_teacher:
         raise HTTPException(status_code=404, detail="Teacher not found")
     return {"message": "Teacher deleted successfully"}
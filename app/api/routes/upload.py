@@ -1,15 +1,22 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from uuid import uuid4
+import asyncio
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File, Form
+from fastapi.responses import FileResponse, RedirectResponse
+from core.config import UPLOAD_CONCURRENCY, VIRUS_SCAN_ENABLED
+from core.storage import get_storage
+from core.instrumentation import InstrumentedRoute
+from uuid import UUID, uuid4
 from typing import List
 from services.upload_service import UploadService
-from schemas.upload import UploadCreate, UploadResponse, FileUploadRequest
-from utils.file_utils import save_and_get_metadata
-from utils.constants import FileCategoryEnum
-from api.dependencies import require_roles
+from services.upload_session_service import UploadSessionService
+from services.derivative_service import get_derivative
+from schemas.upload import UploadCreate, UploadResponse, FileUploadRequest, UploadSessionCreate, UploadSessionResponse
+from utils.file_utils import DERIVATIVE_FORMATS, remove_stored_files, save_and_get_metadata
+from utils.constants import FileCategoryEnum, VirusScanStatusEnum
+from api.dependencies import get_current_user, require_roles
 from schemas.common_schemas import UserToken
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
 @router.post("/", response_model= List[UploadResponse])
 async def upload_file(
@@ -21,26 +28,172 @@ async def upload_file(
     file_category = upload_data.file_category
     related_entity_id = upload_data.related_entity_id
 
-    uploaded_files = []
-    for file in files:
-        meta = await save_and_get_metadata(file, subdir=file_category)
+    # Receive and hash up to UPLOAD_CONCURRENCY files at a time, in worker threads
+    limit = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    async def store(file: UploadFile):
+        async with limit:
+            return await save_and_get_metadata(file, current_user.tenant_id)
 
-        upload_create = UploadCreate(
-            document_id = uuid4(),
-            original_filename = file.filename,
-            file_extension = meta['file_extension'],
-            content_type = file.content_type,
-            file_size = meta['file_size'],
-            checksum = meta['checksum'],
-            storage_path = meta['storage_path'],
-            file_category = file_category,
-            related_entity_id = related_entity_id,
-            is_active = True,
-        )
+    results = await asyncio.gather(*(store(file) for file in files), return_exceptions=True)
+    staged = {meta["staging_path"]: meta["storage_path"] for meta in results if isinstance(meta, dict)}
+    failure = next((result for result in results if isinstance(result, BaseException)), None)
+    if failure is not None:
+        remove_stored_files(staged)
+        raise failure
 
-        uploaded = upload_service.create_upload_record(upload_create)
-        uploaded_files.append(uploaded)
+    try:
+        upload_creates = [
+            UploadCreate(
+                document_id = uuid4(),
+                original_filename = file.filename,
+                file_extension = meta['file_extension'],
+                content_type = file.content_type,
+                file_size = meta['file_size'],
+                checksum = meta['checksum'],
+                storage_path = meta['storage_path'],
+                file_category = file_category,
+                related_entity_id = related_entity_id,
+                is_active = True,
+            )
+            for file, meta in zip(files, results)
+        ]
+        return await upload_service.create_upload_records(upload_creates, staged)
+    except Exception:
+        # Nothing of a failed request is kept on disk (placed blobs are removed by the service)
+        remove_stored_files(staged)
+        raise
 
-    return uploaded_files
+# Resumable uploads: create a session, PUT its chunks in order (GET it to find where to resume), then complete it
 
+@router.post("/sessions", response_model=UploadSessionResponse, status_code=201)
+async def create_upload_session(
+    session_in: UploadSessionCreate,
+    current_user: UserToken = Depends(require_roles("admin", "teacher"))
+):
+    return await UploadSessionService(current_user.tenant_id).create_session(session_in, current_user.id)
+
+@router.get("/sessions/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    session_id: UUID,
+    current_user: UserToken = Depends(require_roles("admin", "teacher"))
+):
+    return await UploadSessionService(current_user.tenant_id).get_state(session_id, current_user.id)
+
+@router.put("/sessions/{session_id}/chunks/{index}", response_model=UploadSessionResponse)
+async def put_upload_chunk(
+    session_id: UUID,
+    index: int,
+    request: Request,
+    current_user: UserToken = Depends(require_roles("admin", "teacher"))
+):
+    """The request body is the raw chunk (application/octet-stream)."""
+    return await UploadSessionService(current_user.tenant_id).put_chunk(session_id, index, current_user.id, request.stream())
+
+@router.post("/sessions/{session_id}/complete", response_model=UploadResponse)
+async def complete_upload_session(
+    session_id: UUID,
+    current_user: UserToken = Depends(require_roles("admin", "teacher"))
+):
+    return await UploadSessionService(current_user.tenant_id).complete(session_id, current_user.id)
+
+@router.delete("/sessions/{session_id}")
+async def abort_upload_session(
+    session_id: UUID,
+    current_user: UserToken = Depends(require_roles("admin", "teacher"))
+):
+    await UploadSessionService(current_user.tenant_id).abort(session_id, current_user.id)
+    return {"message": "Upload session aborted"}
+
+@router.delete("/{document_id}")
+async def delete_upload(
+    document_id: UUID,
+    current_user: UserToken = Depends(require_roles("admin"))
+):
+    upload_service = UploadService(current_user.tenant_id)
+    if not await upload_service.delete_upload(document_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return {"message": "Upload deleted successfully"}
+
+@router.api_route("/{document_id}", methods=["GET", "HEAD"])
+async def download_upload(
+    document_id: UUID,
+    request: Request,
+    download: bool = False,
+    current_user: UserToken = Depends(get_current_user)
+):
+    """
+    Serve an uploaded file. Supports Range requests (video seeking, resumed downloads) and
+    answers If-None-Match with 304, the checksum being the strong ETag. Local files are sent
+    with the ASGI pathsend extension (zero-copy) when the server supports it; files in remote
+    storage are redirected to a presigned URL.
+    """
+    entry = await _authorized_entry(document_id, current_user)
+    etag = f'"{entry.checksum}"'
+    headers = {"etag": etag, "cache-control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    storage = get_storage()
+    path = storage.local_path(entry.storage_path)
+    if path is None:
+        url = storage.presigned_url(entry.storage_path, entry.original_filename, entry.content_type, inline=not download)
+        return RedirectResponse(url, status_code=307, headers={"cache-control": "private, no-store"})
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return FileResponse(
+        path,
+        stat_result=stat_result,
+        media_type=entry.content_type,
+        filename=entry.original_filename,
+        headers=headers,
+        content_disposition_type="attachment" if download else "inline",
+    )
+
+@router.get("/{document_id}/preview")
+async def preview_upload(
+    document_id: UUID,
+    request: Request,
+    size: int = 320,
+    format: str = "webp",
+    current_user: UserToken = Depends(get_current_user)
+):
+    """
+    A thumbnail of an image, or of the first page of a PDF, at most `size` px on its longest side
+    (one of DERIVATIVE_SIZES). Rendered on first request and stored next to the file; a variant
+    never changes for a given ETag, so clients may cache it for good.
+    """
+    entry = await _authorized_entry(document_id, current_user)
+    etag = f'"{entry.checksum}-{size}.{format}"'
+    headers = {"etag": etag, "cache-control": "private, max-age=31536000, immutable"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    key = await get_derivative(entry, size, format)
+    storage = get_storage()
+    path = storage.local_path(key)
+    if path is None:
+        url = storage.presigned_url(key, f"{document_id}-{size}.{format}", DERIVATIVE_FORMATS[format])
+        return RedirectResponse(url, status_code=307, headers={"cache-control": "private, no-store"})
+    return FileResponse(path, media_type=DERIVATIVE_FORMATS[format], headers=headers)
+
+async def _authorized_entry(document_id: UUID, current_user: UserToken):
+    entry = await UploadService(current_user.tenant_id).resolve_download(document_id)
+    if entry.is_private and current_user.role not in ("admin", "teacher"):
+        raise HTTPException(status_code=403, detail="This file is private")
+    if VIRUS_SCAN_ENABLED:
+        _check_scan_status(entry.virus_scan_status, current_user)
+    return entry
+
+def _check_scan_status(scan_status: VirusScanStatusEnum, current_user: UserToken):
+    """Files are served once scanned clean; admins may also fetch the ones the scanner could not check."""
+    if scan_status == VirusScanStatusEnum.pending:
+        raise HTTPException(status_code=409, detail="This file is still being scanned for viruses", headers={"Retry-After": "30"})
+    if scan_status == VirusScanStatusEnum.infected:
+        raise HTTPException(status_code=403, detail="This file failed the virus scan")
+    if scan_status == VirusScanStatusEnum.failed and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="This file could not be scanned for viruses")
 
+def _etag_matches(if_none_match, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
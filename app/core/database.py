@@ -1,8 +1,18 @@
+import asyncio
 import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from core.config import DATABASE_URL
+from core.instrumentation import TimedQueuePool, TimedAsyncQueuePool
+from core.config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    TENANT_ENGINE_CACHE_SIZE, TENANT_ENGINE_IDLE_SECONDS,
+)
 
 engine = create_engine(DATABASE_URL)
 Base = declarative_base()
@@ -12,21 +22,158 @@ def init_db():
         # Base.metadata.drop_all(conn)  # WARNING: This deletes all data!
         Base.metadata.create_all(conn)
 
-def custom_create_engine(user, password, host, port, db_name):
+def custom_create_engine(user, password, host, port, db_name, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW):
     DATABASE_URL = f"postgresql://{user}:{password}@{host}:{port}/{db_name}"
     # return create_engine(DATABASE_URL, connect_args={"check_same_thread": False, "connect_timeout": 10})
-    return create_engine(DATABASE_URL, connect_args={"connect_timeout": 10})
+    return create_engine(
+        DATABASE_URL,
+        connect_args={"connect_timeout": 10},
+        poolclass=TimedQueuePool,  # reports checkout wait to the request instrumentation
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,  # long-lived pools must survive server restarts / idle disconnects
+    )
 
+def custom_create_async_engine(user, password, host, port, db_name, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW):
+    """asyncpg-backed counterpart of custom_create_engine, used by the async services."""
+    DATABASE_URL = f"postgresql+asyncpg://{user}:{password}@{host}:{port}/{db_name}"
+    return create_async_engine(
+        DATABASE_URL,
+        connect_args={"timeout": 10},
+        poolclass=TimedAsyncQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+def _central_db_settings() -> dict:
+    return {
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", "root"),
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": os.getenv("DB_PORT", "5432"),
+        "db_name": os.getenv("DB_NAME", "sms_central"),
+    }
+
+@lru_cache(maxsize=None)
 def get_central_db():
-    user = os.getenv("DB_USER", "postgres")
-    password = os.getenv("DB_PASSWORD", "root")
-    host = os.getenv("DB_HOST", "localhost")
-    port = os.getenv("DB_PORT", "5432")
-    db_name = os.getenv("DB_NAME", "sms_central")
-    return custom_create_engine(
-        user=user,
-        password=password,
-        host=host,
-        port=port,
-        db_name=db_name
-    )       
+    """Return the process-wide engine for the central database (created once)."""
+    return custom_create_engine(**_central_db_settings())
+
+@lru_cache(maxsize=None)
+def get_central_async_db():
+    """Return the process-wide async engine for the central database (created once)."""
+    return custom_create_async_engine(**_central_db_settings())
+
+def dispose_engine(db):
+    if not isinstance(db, AsyncEngine):
+        db.dispose()
+        return
+    try:
+        # asyncpg connections must be closed on the loop that owns them
+        asyncio.get_running_loop().create_task(db.dispose())
+    except RuntimeError:
+        db.sync_engine.dispose(close=False)
+
+
+class TenantEngineRegistry:
+    """
+    Process-wide registry owning one pooled engine per tenant.
+
+    Engines are created on first use from the tenant's directory record and reused by
+    every later request. At most `max_engines` tenant pools stay open: the least recently
+    used one is disposed when the cap is exceeded, and pools unused for `idle_seconds` are
+    disposed on the next access. Call `invalidate(tenant_id)` whenever the tenant's
+    connection record changes.
+    """
+    def __init__(self, engine_factory=custom_create_engine, max_engines: int = TENANT_ENGINE_CACHE_SIZE,
+                 idle_seconds: int = TENANT_ENGINE_IDLE_SECONDS, pool_size: int = DB_POOL_SIZE,
+                 max_overflow: int = DB_MAX_OVERFLOW):
+        self.engine_factory = engine_factory
+        self.max_engines = max_engines
+        self.idle_seconds = idle_seconds
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self._engines = OrderedDict()  # tenant_id -> (engine, last_used)
+        self._lock = threading.Lock()
+
+    def get_engine(self, tenant_id):
+        key = str(tenant_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._engines.get(key)
+            if entry is not None:
+                self._engines[key] = (entry[0], now)
+                self._engines.move_to_end(key)
+                self._evict_idle(now)
+                return entry[0]
+
+        # Build outside the lock so a slow tenant lookup does not block other tenants
+        new_engine = self._create_engine(key)
+
+        with self._lock:
+            entry = self._engines.get(key)
+            if entry is not None:
+                # Another thread won the race; keep its engine
+                dispose_engine(new_engine)
+                self._engines.move_to_end(key)
+                return entry[0]
+            self._engines[key] = (new_engine, now)
+            self._evict_idle(now)
+            while len(self._engines) > self.max_engines:
+                _, (evicted, _) = self._engines.popitem(last=False)
+                dispose_engine(evicted)
+            return new_engine
+
+    def invalidate(self, tenant_id) -> bool:
+        """Dispose the tenant's pool so the next request reconnects with fresh settings."""
+        with self._lock:
+            entry = self._engines.pop(str(tenant_id), None)
+        if entry is None:
+            return False
+        dispose_engine(entry[0])
+        return True
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._engines.values())
+            self._engines.clear()
+        for tenant_engine, _ in entries:
+            dispose_engine(tenant_engine)
+
+    async def aclear(self):
+        """clear() for async engines, waiting until every connection is closed (use on shutdown)."""
+        with self._lock:
+            entries = list(self._engines.values())
+            self._engines.clear()
+        for tenant_engine, _ in entries:
+            await tenant_engine.dispose()
+
+    def _evict_idle(self, now: float):
+        if not self.idle_seconds:
+            return
+        # OrderedDict is kept in LRU order, so idle engines are always at the front
+        while self._engines:
+            key, (tenant_engine, last_used) = next(iter(self._engines.items()))
+            if now - last_used < self.idle_seconds:
+                break
+            del self._engines[key]
+            dispose_engine(tenant_engine)
+
+    def _create_engine(self, tenant_id: str):
+        from core.tenant_directory import tenant_directory  # the directory itself imports this module
+
+        tenant = tenant_directory.get(tenant_id)
+        if not tenant:
+            raise ValueError(f"Tenant not found for tenant_id: {tenant_id}")
+        return self.engine_factory(
+            user=tenant.db_user, password=tenant.db_password, host=tenant.db_host, port=tenant.db_port,
+            db_name=tenant.db_name, pool_size=self.pool_size, max_overflow=self.max_overflow
+        )
+
+tenant_engines = TenantEngineRegistry()
+async_tenant_engines = TenantEngineRegistry(engine_factory=custom_create_async_engine)
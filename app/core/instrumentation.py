@@ -0,0 +1,239 @@
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from core.config import DEBUG, SQL_BUDGETS, SQL_BUDGET_DEFAULT, SQL_BUDGET_MODE
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised (SQL_BUDGET_MODE=raise, e.g. in tests) when a route runs more statements than its budget."""
+
+
+class RequestStats:
+    __slots__ = ("route", "statements", "db_time", "rows", "pool_wait", "endpoint_end", "serialization_time")
+
+    def __init__(self):
+        self.route = None
+        self.statements = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.pool_wait = 0.0
+        self.endpoint_end = None
+        self.serialization_time = 0.0
+
+
+_current_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _current_stats.get()
+
+
+# --- SQLAlchemy hooks (registered for every engine: central, tenant and init_db) ---
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats.get() is not None:
+        context._query_started = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    started = getattr(context, "_query_started", None)
+    if stats is None or started is None:
+        return
+    stats.statements += 1
+    stats.db_time += time.perf_counter() - started
+    if cursor.rowcount and cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that charges the time spent waiting for (or opening) a connection to the request."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            stats = _current_stats.get()
+            if stats is not None:
+                stats.pool_wait += time.perf_counter() - started
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Async-engine variant of TimedQueuePool."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            stats = _current_stats.get()
+            if stats is not None:
+                stats.pool_wait += time.perf_counter() - started
+
+
+# --- Aggregated metrics, exported in Prometheus text format ---
+
+class RouteMetrics:
+    FIELDS = (
+        ("requests_total", "Requests handled"),
+        ("request_seconds_total", "Wall time spent in the route handler"),
+        ("db_statements_total", "SQL statements executed"),
+        ("db_seconds_total", "Time spent executing SQL"),
+        ("db_rows_total", "Rows returned or affected by SQL statements"),
+        ("db_pool_wait_seconds_total", "Time spent waiting for a pooled connection"),
+        ("serialization_seconds_total", "Time spent serializing responses"),
+        ("sql_budget_exceeded_total", "Requests that exceeded their SQL statement budget"),
+    )
+
+    CACHE_FIELDS = (
+        ("hits", "counter", "Cache lookups that found a live entry"),
+        ("misses", "counter", "Cache lookups that found nothing or an expired entry"),
+        ("evictions", "counter", "Entries dropped to stay within the cache size"),
+        ("size", "gauge", "Entries currently cached"),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._max_statements = {}
+        self._caches = {}
+
+    def register_cache(self, name: str, cache):
+        """Export the hit/miss/eviction counters of a TTLCache (utils/cache.py) under `name`."""
+        self._caches[name] = cache
+
+    def observe(self, stats: RequestStats, elapsed: float, over_budget: bool):
+        values = (1, elapsed, stats.statements, stats.db_time, stats.rows, stats.pool_wait,
+                  stats.serialization_time, int(over_budget))
+        with self._lock:
+            totals = self._routes.setdefault(stats.route, [0] * len(values))
+            for i, value in enumerate(values):
+                totals[i] += value
+            self._max_statements[stats.route] = max(self._max_statements.get(stats.route, 0), stats.statements)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            routes = {route: list(totals) for route, totals in self._routes.items()}
+            maxima = dict(self._max_statements)
+        for i, (name, help_text) in enumerate(self.FIELDS):
+            lines.append(f"# HELP sms_http_{name} {help_text}")
+            lines.append(f"# TYPE sms_http_{name} counter")
+            for route, totals in routes.items():
+                lines.append(f'sms_http_{name}{{route="{route}"}} {totals[i]}')
+        lines.append("# HELP sms_http_db_statements_max Most SQL statements executed by one request")
+        lines.append("# TYPE sms_http_db_statements_max gauge")
+        for route, value in maxima.items():
+            lines.append(f'sms_http_db_statements_max{{route="{route}"}} {value}')
+        caches = {name: cache.stats() for name, cache in self._caches.items()}
+        for field, kind, help_text in self.CACHE_FIELDS:
+            name = f"sms_cache_{field}_total" if kind == "counter" else f"sms_cache_{field}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for cache_name, stats in caches.items():
+                lines.append(f'{name}{{cache="{cache_name}"}} {stats[field]}')
+        return "\n".join(lines) + "\n"
+
+
+route_metrics = RouteMetrics()
+
+
+def sql_budget(route: str) -> Optional[int]:
+    return SQL_BUDGETS.get(route, SQL_BUDGET_DEFAULT or None)
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    # Marks when the endpoint returned, so the rest of the handler counts as serialization
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _mark_endpoint_end()
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _mark_endpoint_end()
+    return wrapper
+
+def _mark_endpoint_end():
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.endpoint_end = time.perf_counter()
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    APIRoute that records per-request SQL statement count, DB time, rows, pool wait and
+    serialization time, enforces SQL_BUDGETS and, in DEBUG, reports them as response headers.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        methods = ",".join(sorted(self.methods))
+
+        async def instrumented_handler(request: Request) -> Response:
+            route_name = f"{methods} {self._template(request)}"
+            stats = RequestStats()
+            stats.route = route_name
+            token = _current_stats.set(stats)
+            started = time.perf_counter()
+            try:
+                response = await handler(request)
+            finally:
+                _current_stats.reset(token)
+            finished = time.perf_counter()
+            if stats.endpoint_end is not None:
+                stats.serialization_time = finished - stats.endpoint_end
+
+            budget = sql_budget(route_name)
+            over_budget = budget is not None and stats.statements > budget
+            route_metrics.observe(stats, finished - started, over_budget)
+            if over_budget:
+                message = f"{route_name} executed {stats.statements} SQL statements (budget {budget})"
+                if SQL_BUDGET_MODE == "raise":
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+
+            if DEBUG:
+                response.headers["X-SQL-Statements"] = str(stats.statements)
+                response.headers["Server-Timing"] = (
+                    f"db;dur={stats.db_time * 1000:.2f}, pool;dur={stats.pool_wait * 1000:.2f}, "
+                    f"serialize;dur={stats.serialization_time * 1000:.2f}, total;dur={(finished - started) * 1000:.2f}"
+                )
+                response.headers["X-DB-Rows"] = str(stats.rows)
+            return response
+
+        return instrumented_handler
+
+    def _template(self, request: Request) -> str:
+        # Depending on the FastAPI version self.path may or may not carry the include_router prefix;
+        # recover it from the concrete path so metrics and budgets use the full route template.
+        try:
+            tail = self.path_format.format(**request.path_params)
+        except (KeyError, IndexError, ValueError):
+            return self.path
+        path = request.scope["path"]
+        if tail != path and path.endswith(tail):
+            return path[: len(path) - len(tail)] + self.path
+        return self.path
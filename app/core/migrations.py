@@ -0,0 +1,335 @@
+"""
+Idempotent schema upgrades for tenant databases created before a model change.
+
+Base.metadata.create_all only creates missing tables, so columns, constraints and indexes
+added to existing tables are applied here. A step is a SQL statement (run in autocommit mode,
+so CREATE INDEX CONCURRENTLY works) or a data-migration function taking the engine and the
+tenant id. Every step is safe to re-run. Run for all tenants with:
+
+    python -m core.migrations
+"""
+import asyncio
+import logging
+import shutil
+import uuid
+from pathlib import Path
+from sqlalchemy import bindparam, delete, exists, select, text, update
+from sqlalchemy.orm import sessionmaker
+from core.database import tenant_engines
+from utils.address_utils import ADDRESS_KEY_FIELDS, address_dedup_key
+
+logger = logging.getLogger(__name__)
+
+
+def _unique_pair_steps(table: str, first: str, second: str):
+    constraint = f"uq_{table}_{first}_{second}"
+    return [
+        # Keep the oldest row of every duplicated pair so the constraint can be added
+        f"""
+        DELETE FROM {table} t USING {table} d
+        WHERE t.{first} = d.{first} AND t.{second} = d.{second} AND t.id > d.id
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = '{constraint}')
+        """,
+        f"""
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = '{constraint}') THEN
+                ALTER TABLE {table} ADD CONSTRAINT {constraint} UNIQUE ({first}, {second});
+            END IF;
+        END $$
+        """,
+    ]
+
+
+def backfill_address_keys(db, tenant_id=None, batch_size: int = 5000) -> dict:
+    """
+    Fill addresses.dedup_key for rows created before the column existed. Rows whose key is
+    already taken are duplicates: their person links move to the surviving row and they are
+    deleted. Walks the table in id order with one committed transaction per batch, so it can
+    be interrupted and re-run.
+    """
+    from models.model import Address, PersonAddress  # models import core.database
+
+    addresses, links = Address.__table__, PersonAddress.__table__
+    SessionLocal = sessionmaker(bind=db)
+    stats = {"keyed": 0, "merged": 0}
+    last_id = 0
+    while True:
+        with SessionLocal() as session:
+            rows = session.execute(
+                select(addresses.c.id, *[addresses.c[field] for field in ADDRESS_KEY_FIELDS])
+                .where(addresses.c.dedup_key.is_(None), addresses.c.id > last_id)
+                .order_by(addresses.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return stats
+            last_id = rows[-1].id
+            keys = {row.id: address_dedup_key(dict(row._mapping)) for row in rows}
+            survivors = dict(session.execute(
+                select(addresses.c.dedup_key, addresses.c.id).where(addresses.c.dedup_key.in_(set(keys.values())))
+            ).all())
+
+            keyed, merged = [], []
+            for address_id, key in keys.items():
+                if key in survivors:
+                    merged.append({"duplicate_id": address_id, "survivor_id": survivors[key]})
+                else:
+                    survivors[key] = address_id
+                    keyed.append({"address_id": address_id, "key": key})
+            if keyed:
+                session.execute(
+                    update(addresses).where(addresses.c.id == bindparam("address_id")).values(dedup_key=bindparam("key")),
+                    keyed,
+                )
+            if merged:
+                session.execute(
+                    update(links).where(links.c.address_id == bindparam("duplicate_id")).values(address_id=bindparam("survivor_id")),
+                    merged,
+                )
+                session.execute(delete(addresses).where(addresses.c.id.in_([m["duplicate_id"] for m in merged])))
+            session.commit()
+            stats["keyed"] += len(keyed)
+            stats["merged"] += len(merged)
+            logger.info("Address keys: %d keyed, %d duplicates merged (up to id %d)", stats["keyed"], stats["merged"], last_id)
+
+
+SCHEDULE_SLOT_INDEXES = [
+    # (name, columns, unique, predicate)
+    ("uq_schedules_class_slot", "class_id, day_of_week, period_number", True, "is_active"),
+    ("uq_schedules_teacher_slot", "teacher_id, day_of_week, period_number", True, "is_active"),
+    ("uq_schedules_room_slot", "room, day_of_week, period_number", True, "is_active AND room IS NOT NULL"),
+    ("ix_schedules_co_teacher_slot", "co_teacher_id, day_of_week, period_number", False, None),
+    ("ix_schedules_substitute_slot", "substitute_teacher_id, day_of_week, period_number", False, None),
+]
+
+def create_schedule_slot_indexes(db, tenant_id=None):
+    """
+    Build the schedule slot indexes. A unique index is skipped (with a warning) while existing
+    double-bookings would violate it; resolve them and re-run. Leftovers of an interrupted
+    concurrent build (invalid indexes) are dropped and rebuilt.
+    """
+    with db.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, columns, unique, predicate in SCHEDULE_SLOT_INDEXES:
+            invalid = conn.execute(text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name AND NOT i.indisvalid"
+            ), {"name": name}).first()
+            if invalid:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY {name}"))
+            where = f" WHERE {predicate}" if predicate else ""
+            if unique:
+                clashes = conn.execute(text(
+                    f"SELECT count(*) FROM (SELECT 1 FROM schedules{where} GROUP BY {columns} HAVING count(*) > 1) d"
+                )).scalar()
+                if clashes:
+                    logger.warning("Skipping %s: %d double-booked slots must be resolved first", name, clashes)
+                    continue
+            conn.execute(text(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {name} ON schedules ({columns}){where}"
+            ))
+
+
+def install_timetable_version_triggers(db, tenant_id=None):
+    from models.model import TIMETABLE_VERSION_DDL
+
+    with db.begin() as conn:
+        for statement in TIMETABLE_VERSION_DDL:
+            conn.execute(text(statement))
+
+
+def migrate_legacy_uploads(db, tenant_id, batch_size: int = 500) -> dict:
+    """
+    Move the files of uploads stored before the blob store (storage_path relative to the working
+    directory, no upload_blobs row) into the storage backend as blobs, so downloads, previews and
+    deletes resolve them like every other upload. Run it on the node holding those files. New
+    blobs enter the scan queue like fresh uploads, and an upload sharing an existing blob takes
+    its verdict. A file is copied and removed only once its rows are committed, so the step can
+    be interrupted and re-run. Uploads whose file is missing are logged and, while still pending
+    a scan nothing would ever run, marked failed.
+    """
+    from core.config import VIRUS_SCAN_ENABLED
+    from core.storage import get_storage
+    from models.model import Upload, UploadBlob
+    from utils.constants import VirusScanStatusEnum
+    from utils.file_utils import STAGING_DIR, blob_path, hash_file, remove_stored_files, staging_path
+
+    uploads, blobs = Upload.__table__, UploadBlob.__table__
+    new_status = VirusScanStatusEnum.pending if VIRUS_SCAN_ENABLED else VirusScanStatusEnum.skipped
+    storage = get_storage()
+    SessionLocal = sessionmaker(bind=db)
+    stats = {"moved": 0, "shared": 0, "missing": 0}
+    last_id = 0
+    while True:
+        with SessionLocal() as session:
+            rows = session.execute(
+                select(uploads.c.id, uploads.c.storage_path, uploads.c.checksum)
+                .where(uploads.c.id > last_id, ~exists().where(
+                    blobs.c.checksum == uploads.c.checksum, blobs.c.storage_path == uploads.c.storage_path,
+                ))
+                .order_by(uploads.c.id)
+                .limit(batch_size)
+            ).all()
+        if not rows:
+            return stats
+        last_id = rows[-1].id
+        for row in rows:
+            source = Path(row.storage_path)
+            if not source.is_file():
+                logger.warning("Upload %s: %s is missing, left unmigrated", row.id, source)
+                with SessionLocal() as session, session.begin():
+                    session.execute(
+                        update(uploads)
+                        .where(uploads.c.id == row.id, uploads.c.virus_scan_status == VirusScanStatusEnum.pending)
+                        .values(virus_scan_status=VirusScanStatusEnum.failed)
+                    )
+                stats["missing"] += 1
+                continue
+            checksum = row.checksum or hash_file(source)
+            key = blob_path(tenant_id, checksum)
+            with SessionLocal() as session, session.begin():
+                blob = session.execute(select(blobs.c.scan_status).where(blobs.c.checksum == checksum).with_for_update()).first()
+                if blob is None:
+                    # A copy is handed over, so the original survives until the rows below are committed
+                    STAGING_DIR.mkdir(parents=True, exist_ok=True)
+                    copy = staging_path(uuid.uuid4())
+                    shutil.copyfile(source, copy)
+                    asyncio.run(storage.put_file(key, str(copy)))
+                    session.execute(blobs.insert().values(
+                        checksum=checksum, storage_path=key, file_size=source.stat().st_size, ref_count=1,
+                        scan_status=new_status,
+                    ))
+                    scan_status = new_status
+                    stats["moved"] += 1
+                else:
+                    session.execute(update(blobs).where(blobs.c.checksum == checksum).values(ref_count=blobs.c.ref_count + 1))
+                    scan_status = blob.scan_status
+                    stats["shared"] += 1
+                session.execute(update(uploads).where(uploads.c.id == row.id).values(
+                    storage_path=key, checksum=checksum, virus_scan_status=scan_status,
+                ))
+            remove_stored_files([source])
+        logger.info("Legacy uploads: %d moved, %d shared an existing blob, %d missing (up to id %d)",
+                    stats["moved"], stats["shared"], stats["missing"], last_id)
+
+
+# (description, steps) in the order they must run
+UPGRADES = [
+    ("unique association pairs", [
+        *_unique_pair_steps("class_students", "class_id", "student_id"),
+        *_unique_pair_steps("class_subjects", "class_id", "subject_id"),
+        *_unique_pair_steps("subject_teachers", "subject_id", "teacher_id"),
+    ]),
+    ("address dedup key", [
+        "ALTER TABLE addresses ADD COLUMN IF NOT EXISTS dedup_key varchar(64)",
+        backfill_address_keys,
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_addresses_dedup_key ON addresses (dedup_key)",
+    ]),
+    ("schedule slot indexes", [create_schedule_slot_indexes]),
+    ("class subject weekly quota", ["ALTER TABLE class_subjects ADD COLUMN IF NOT EXISTS periods_per_week integer"]),
+    ("timetable version triggers", [
+        "CREATE TABLE IF NOT EXISTS timetable_grid_versions (kind varchar, id uuid, version bigint NOT NULL DEFAULT 0, PRIMARY KEY (kind, id))",
+        install_timetable_version_triggers,
+    ]),
+    ("upload blobs", [
+        """
+        CREATE TABLE IF NOT EXISTS upload_blobs (
+            checksum varchar(64) PRIMARY KEY,
+            storage_path varchar NOT NULL,
+            file_size bigint NOT NULL,
+            ref_count integer NOT NULL DEFAULT 0,
+            created_at timestamp DEFAULT now()
+        )
+        """,
+    ]),
+    ("upload sessions", [
+        # filecategoryenum already exists: the upload table uses it
+        """
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id uuid PRIMARY KEY,
+            original_filename varchar NOT NULL,
+            file_extension varchar NOT NULL,
+            content_type varchar NOT NULL,
+            file_category filecategoryenum NOT NULL,
+            related_entity_id integer,
+            file_size bigint NOT NULL,
+            chunk_size integer NOT NULL,
+            received bigint NOT NULL DEFAULT 0,
+            finalizing boolean NOT NULL DEFAULT false,
+            created_by_id uuid NOT NULL,
+            created_at timestamp DEFAULT now(),
+            expires_at timestamp NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_upload_sessions_expires_at ON upload_sessions (expires_at)",
+    ]),
+    ("upload session owner node", [
+        "ALTER TABLE upload_sessions ADD COLUMN IF NOT EXISTS node_id varchar",
+        "CREATE INDEX IF NOT EXISTS ix_upload_sessions_node_id ON upload_sessions (node_id)",
+    ]),
+    ("upload blob virus scan queue", [
+        # virusscanstatusenum already exists: the upload table uses it
+        "ALTER TABLE upload_blobs ADD COLUMN IF NOT EXISTS scan_status virusscanstatusenum NOT NULL DEFAULT 'pending'",
+        "ALTER TABLE upload_blobs ADD COLUMN IF NOT EXISTS scan_result varchar",
+        "ALTER TABLE upload_blobs ADD COLUMN IF NOT EXISTS scan_attempts integer NOT NULL DEFAULT 0",
+        "ALTER TABLE upload_blobs ADD COLUMN IF NOT EXISTS scan_available_at timestamp NOT NULL DEFAULT now()",
+        "ALTER TABLE upload_blobs ADD COLUMN IF NOT EXISTS scan_claimed_until timestamp",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_upload_blobs_scan_queue ON upload_blobs (scan_available_at) WHERE scan_status = 'pending'",
+    ]),
+    ("timetable jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS timetable_jobs (
+            id uuid PRIMARY KEY,
+            status varchar NOT NULL,
+            seed integer NOT NULL,
+            dry_run boolean NOT NULL,
+            progress jsonb NOT NULL,
+            result jsonb,
+            error jsonb,
+            created_at timestamp NOT NULL DEFAULT now(),
+            updated_at timestamp NOT NULL DEFAULT now()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_timetable_jobs_created_at ON timetable_jobs (created_at)",
+    ]),
+    ("date-scoped substitutions", [
+        """
+        CREATE TABLE IF NOT EXISTS schedule_substitutions (
+            id uuid PRIMARY KEY,
+            schedule_id uuid NOT NULL REFERENCES schedules (id) ON DELETE CASCADE,
+            date date NOT NULL,
+            period_number integer NOT NULL,
+            teacher_id uuid NOT NULL REFERENCES teachers (id),
+            created_at timestamp NOT NULL DEFAULT now(),
+            CONSTRAINT uq_schedule_substitutions_schedule_date UNIQUE (schedule_id, date),
+            CONSTRAINT uq_schedule_substitutions_teacher_slot UNIQUE (teacher_id, date, period_number)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_schedule_substitutions_date ON schedule_substitutions (date)",
+    ]),
+    ("legacy uploads into the blob store", [migrate_legacy_uploads]),
+]
+
+
+def upgrade_schema(db, tenant_id):
+    """Apply every upgrade to one tenant's database engine."""
+    for description, steps in UPGRADES:
+        for step in steps:
+            if callable(step):
+                step(db, tenant_id)
+                continue
+            with db.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(step))
+        logger.info("Applied schema upgrade: %s", description)
+
+
+def upgrade_all_tenants():
+    from core.tenant_directory import tenant_directory
+
+    for tenant_id in tenant_directory.tenant_ids():
+        logger.info("Upgrading tenant %s", tenant_id)
+        upgrade_schema(tenant_engines.get_engine(tenant_id), tenant_id)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    import models.model  # noqa: F401  (registers the models before tenant engines are used)
+    upgrade_all_tenants()
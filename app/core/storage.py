@@ -0,0 +1,191 @@
+"""
+Where uploaded files are kept. A key is a POSIX path such as "uploads/blobs/<tenant>/<aa>/<sha256>"
+and is what Upload.storage_path holds. LocalStorage keeps files on this node's disk; S3Storage keeps
+them in an S3-compatible bucket (AWS S3, MinIO, ...), so every app node sees the same files without
+a shared filesystem. Incoming files are received into local staging files first and handed over
+complete through put_file. Select the driver with STORAGE_BACKEND.
+"""
+import errno
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
+from fastapi.concurrency import run_in_threadpool
+from core.config import (
+    S3_ACCESS_KEY_ID, S3_BUCKET, S3_ENDPOINT_URL, S3_MAX_CONCURRENCY, S3_PART_SIZE, S3_PRESIGN_SECONDS,
+    S3_REGION, S3_SECRET_ACCESS_KEY, STORAGE_BACKEND, STORAGE_LOCAL_ROOT,
+)
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class StorageBackend(ABC):
+    @abstractmethod
+    async def put_file(self, key: str, local_path: str):
+        """Store a complete local file under `key`; the local file is consumed."""
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Remove `key`; a missing key is not an error."""
+
+    @abstractmethod
+    async def move(self, key: str, new_key: str):
+        ...
+
+    @abstractmethod
+    def iter_bytes(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """The file's content in chunks; implemented as an async generator."""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """A filesystem path the file can be served from, or None when it must be fetched remotely."""
+        return None
+
+    def presigned_url(self, key: str, filename: str, content_type: str, inline: bool = True) -> str:
+        """A short-lived URL a client can GET the file from directly; needed when local_path() is None."""
+        raise NotImplementedError(f"{type(self).__name__} serves files from local_path()")
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str = "."):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    async def put_file(self, key: str, local_path: str):
+        await run_in_threadpool(_replace, local_path, self.path(key))
+
+    async def exists(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    async def delete(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+
+    async def move(self, key: str, new_key: str):
+        await run_in_threadpool(_replace, self.path(key), self.path(new_key))
+
+    async def iter_bytes(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        source = await run_in_threadpool(open, self.path(key), "rb")
+        try:
+            while chunk := await run_in_threadpool(source.read, chunk_size):
+                yield chunk
+        finally:
+            source.close()
+
+    def local_path(self, key: str) -> Optional[str]:
+        return str(self.path(key))
+
+
+def _replace(source, target: Path):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(source, target)  # atomic, so a key only ever holds a complete file
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Staging is on another filesystem than STORAGE_LOCAL_ROOT: copy next to the target first,
+        # so the file still appears under its key in one rename
+        partial = target.with_name(f"{target.name}.{uuid.uuid4().hex}.part")
+        try:
+            shutil.copyfile(source, partial)
+            os.replace(partial, target)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        os.unlink(source)
+
+
+class S3Storage(StorageBackend):
+    """
+    Files in an S3-compatible bucket. put_file uploads in S3_PART_SIZE parts, S3_MAX_CONCURRENCY
+    at a time (boto3's managed transfer); downloads are redirected to presigned GET URLs, which
+    serve Range requests themselves. boto3 is imported only when this driver is configured.
+    """
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None,
+                 access_key_id: Optional[str] = None, secret_access_key: Optional[str] = None,
+                 part_size: int = S3_PART_SIZE, max_concurrency: int = S3_MAX_CONCURRENCY,
+                 presign_seconds: int = S3_PRESIGN_SECONDS):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        self.bucket = bucket
+        self.presign_seconds = presign_seconds
+        self._client_error = ClientError
+        self.client = boto3.client(
+            "s3", endpoint_url=endpoint_url, region_name=region,
+            aws_access_key_id=access_key_id, aws_secret_access_key=secret_access_key,
+            config=Config(signature_version="s3v4", max_pool_connections=max(10, max_concurrency * 2)),
+        )
+        self.transfer = TransferConfig(
+            multipart_threshold=part_size, multipart_chunksize=part_size, max_concurrency=max_concurrency,
+        )
+
+    async def put_file(self, key: str, local_path: str):
+        await run_in_threadpool(self.client.upload_file, str(local_path), self.bucket, key, Config=self.transfer)
+        Path(local_path).unlink(missing_ok=True)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await run_in_threadpool(self.client.head_object, Bucket=self.bucket, Key=key)
+            return True
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    async def move(self, key: str, new_key: str):
+        # Server-side copy (multipart for large objects); the bytes do not pass through this node
+        await run_in_threadpool(
+            self.client.copy, {"Bucket": self.bucket, "Key": key}, self.bucket, new_key, Config=self.transfer,
+        )
+        await self.delete(key)
+
+    async def iter_bytes(self, key: str, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        body = (await run_in_threadpool(self.client.get_object, Bucket=self.bucket, Key=key))["Body"]
+        try:
+            while chunk := await run_in_threadpool(body.read, chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def presigned_url(self, key: str, filename: str, content_type: str, inline: bool = True) -> str:
+        disposition = f"{'inline' if inline else 'attachment'}; filename*=utf-8''{quote(filename or '')}"
+        return self.client.generate_presigned_url("get_object", ExpiresIn=self.presign_seconds, Params={
+            "Bucket": self.bucket, "Key": key,
+            "ResponseContentType": content_type, "ResponseContentDisposition": disposition,
+        })
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """The configured driver, created on first use."""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "s3":
+            _storage = S3Storage(
+                S3_BUCKET, endpoint_url=S3_ENDPOINT_URL, region=S3_REGION,
+                access_key_id=S3_ACCESS_KEY_ID, secret_access_key=S3_SECRET_ACCESS_KEY,
+            )
+        elif STORAGE_BACKEND == "local":
+            _storage = LocalStorage(STORAGE_LOCAL_ROOT)
+        else:
+            raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _storage
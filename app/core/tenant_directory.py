@@ -0,0 +1,174 @@
+import logging
+import select
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from core.config import TENANT_DIRECTORY_TTL_SECONDS, TENANT_DIRECTORY_LISTEN
+from core.database import get_central_db, tenant_engines, async_tenant_engines
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "tenant_db_master_changed"
+
+
+class TenantConnection(NamedTuple):
+    tenant_id: str
+    db_user: str
+    db_password: str
+    db_host: str
+    db_port: str
+    db_name: str
+
+
+class TenantDirectory:
+    """
+    In-memory copy of Tenant_db_Master so tenant resolution costs no round trip.
+
+    All rows are loaded once at startup and refreshed every `ttl_seconds` by a background
+    thread (or lazily on the next lookup when the thread is not running). With `listen`
+    enabled, a Postgres LISTEN on `tenant_db_master_changed` triggers an immediate refresh.
+    Tenants whose connection record changed have their pooled engine disposed.
+    """
+    def __init__(self, ttl_seconds: int = TENANT_DIRECTORY_TTL_SECONDS, listen: bool = TENANT_DIRECTORY_LISTEN):
+        self.ttl_seconds = ttl_seconds
+        self.listen = listen
+        self._records: Dict[str, TenantConnection] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def get(self, tenant_id) -> Optional[TenantConnection]:
+        key = str(tenant_id)
+        if self._loaded_at is None or (not self._threads and time.monotonic() - self._loaded_at > self.ttl_seconds):
+            self.refresh()
+        record = self._records.get(key)
+        if record is None:
+            # Tenant provisioned since the last refresh: fetch just that row
+            record = self._load_one(key)
+        return record
+
+    def tenant_ids(self):
+        """Ids of every known tenant, e.g. for jobs that run against each tenant database."""
+        if self._loaded_at is None:
+            self.refresh()
+        return list(self._records)
+
+    def refresh(self):
+        """Reload every tenant record and dispose engines whose connection settings changed."""
+        records = {record.tenant_id: record for record in self._load_all()}
+        with self._lock:
+            previous = self._records
+            self._records = records
+            self._loaded_at = time.monotonic()
+        for key, old in previous.items():
+            if records.get(key) != old:
+                tenant_engines.invalidate(key)
+                async_tenant_engines.invalidate(key)
+
+    def invalidate(self, tenant_id):
+        """Forget one tenant so the next lookup re-reads its row from the central database."""
+        with self._lock:
+            self._records.pop(str(tenant_id), None)
+        tenant_engines.invalidate(tenant_id)
+        async_tenant_engines.invalidate(tenant_id)
+
+    def start(self):
+        """Load the directory and start the background refresh (and LISTEN) threads."""
+        self.refresh()
+        self._stop.clear()
+        targets = [self._refresh_loop]
+        if self.listen:
+            install_notify_trigger()
+            targets.append(self._listen_loop)
+        for target in targets:
+            thread = threading.Thread(target=target, name=f"tenant-directory-{target.__name__}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.ttl_seconds):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Tenant directory refresh failed; serving cached records")
+
+    def _listen_loop(self):
+        while not self._stop.is_set():
+            try:
+                raw = get_central_db().raw_connection()
+                conn = raw.driver_connection
+                raw.detach()  # a dedicated connection, never returned to the pool
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                try:
+                    while not self._stop.is_set():
+                        if select.select([conn], [], [], 5) == ([], [], []):
+                            continue
+                        conn.poll()
+                        if conn.notifies:
+                            conn.notifies.clear()
+                            self.refresh()
+                finally:
+                    raw.close()
+            except Exception:
+                logger.exception("Tenant directory LISTEN connection lost; retrying")
+                self._stop.wait(5)
+
+    def _load_all(self):
+        from models.model import Tenant_db_Master  # models import core.database
+
+        SessionLocal = sessionmaker(bind=get_central_db())
+        with SessionLocal() as session:
+            return [_to_connection(row) for row in session.query(Tenant_db_Master).all()]
+
+    def _load_one(self, tenant_id: str) -> Optional[TenantConnection]:
+        from models.model import Tenant_db_Master
+
+        SessionLocal = sessionmaker(bind=get_central_db())
+        with SessionLocal() as session:
+            row = session.query(Tenant_db_Master).filter(Tenant_db_Master.tenant_id == tenant_id).first()
+        if not row:
+            return None
+        record = _to_connection(row)
+        with self._lock:
+            self._records[record.tenant_id] = record
+        return record
+
+
+def _to_connection(row) -> TenantConnection:
+    return TenantConnection(
+        tenant_id=str(row.tenant_id), db_user=row.db_user, db_password=row.db_password,
+        db_host=row.db_host, db_port=row.db_port, db_name=row.db_name
+    )
+
+
+def install_notify_trigger():
+    """Create the trigger that publishes Tenant_db_Master changes on NOTIFY_CHANNEL (idempotent)."""
+    with get_central_db().begin() as conn:
+        conn.execute(text(f"""
+            CREATE OR REPLACE FUNCTION notify_tenant_db_master_changed() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('{NOTIFY_CHANNEL}', COALESCE(NEW.tenant_id, OLD.tenant_id)::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """))
+        conn.execute(text("DROP TRIGGER IF EXISTS tenant_db_master_changed ON tenant_db_master"))
+        conn.execute(text("""
+            CREATE TRIGGER tenant_db_master_changed
+            AFTER INSERT OR UPDATE OR DELETE ON tenant_db_master
+            FOR EACH ROW EXECUTE FUNCTION notify_tenant_db_master_changed()
+        """))
+
+
+tenant_directory = TenantDirectory()
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from api.routes.students import router as student_router
 from api.routes.parents import router as parent_router
@@ -7,7 +8,11 @@ from api.routes.classes import router as class_router
 from api.routes.subjects import router as subject_router
 from api.routes.schedules import router as schedule_router
 from fastapi.middleware.cors import CORSMiddleware
-from core.database import init_db
+from fastapi.responses import PlainTextResponse
+from core.database import init_db, tenant_engines, async_tenant_engines, get_central_async_db
+from core.tenant_directory import tenant_directory
+from core.instrumentation import route_metrics
+from services import derivative_service, timetable_service, upload_session_service
 # from core.exceptions import api_exception_handler, APIException
 
 app = FastAPI()
@@ -31,6 +36,31 @@ app.include_router(class_router, prefix="/classes", tags=["Classes"])
 app.include_router(subject_router, prefix="/subjects", tags=["Subjects"])
 app.include_router(schedule_router, prefix="/schedules", tags=["Schedules"])
 
+@app.get("/metrics", include_in_schema=False, response_class=PlainTextResponse)
+def metrics():
+    """Per-route SQL/latency counters in Prometheus text format."""
+    return route_metrics.render()
+
+@app.on_event("startup")
+def load_tenant_directory():
+    tenant_directory.start()
+
+@app.on_event("startup")
+async def start_upload_session_purger():
+    app.state.purger_stop = asyncio.Event()
+    app.state.purger = asyncio.create_task(upload_session_service.run_purger(app.state.purger_stop))
+
+@app.on_event("shutdown")
+async def dispose_tenant_engines():
+    app.state.purger_stop.set()
+    await app.state.purger
+    tenant_directory.stop()
+    tenant_engines.clear()
+    await async_tenant_engines.aclear()
+    await get_central_async_db().dispose()
+    derivative_service.shutdown_pool()
+    timetable_service.shutdown_pool()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="localhost", port=8000, reload=True)
@@ -1,16 +1,20 @@
 from core.database import Base
+from core.tenant_directory import tenant_directory
 import uuid
 from sqlalchemy.dialects.postgresql import UUID, ARRAY, JSONB
 
-from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Boolean, Text, JSON, Enum, BigInteger, text, Float, Time, Enum as SAEnum
+from sqlalchemy import event, Column, Index, UniqueConstraint, Integer, String, Date, DateTime, ForeignKey, Boolean, Text, JSON, Enum, BigInteger, text, Float, Time, Enum as SAEnum
 import enum
 
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from typing import List, Optional
 from sqlalchemy.sql import func
+from utils.address_utils import address_dedup_key
 from utils.constants import RelatedEntityEnum, FileCategoryEnum, FileTypeEnum, UserRoleEnum, FileStatusEnum, VirusScanStatusEnum, DayOfWeekEnum, EventTypeEnum
 
 
+# Relationships are lazy='raise': services declare the eager-load graph each endpoint needs
+# (see the *_RESPONSE_GRAPH loader options) instead of cascading selectin loads.
 # Enum for Gender / Blood Group / Caste:
 # remove nulable true 
 # Use RS256 (RSA keypair):
@@ -23,8 +27,8 @@ class StudentParent(Base):
     parent_id = Column(Integer, ForeignKey("parents.id", ondelete="CASCADE"), nullable=False)
     relationship_type = Column(String, nullable=False)  # E.g., "Father", "Mother", "Guardian"
 
-    student = relationship("Student", back_populates="parent_associations", lazy='selectin')
-    parent = relationship("Parent", back_populates="student_associations", lazy='selectin')
+    student = relationship("Student", back_populates="parent_associations", lazy='raise')
+    parent = relationship("Parent", back_populates="student_associations", lazy='raise')
 
 
 class PersonAddress(Base):
@@ -37,14 +41,15 @@ class PersonAddress(Base):
     address_id = Column(Integer, ForeignKey("addresses.id"), nullable=False)
     address_type = Column(String, nullable=False)
 
-    address = relationship("Address", back_populates="persons", lazy='selectin')
-    parent = relationship("Parent", back_populates="addresses", lazy='selectin')
-    student = relationship("Student", back_populates="addresses", lazy='selectin')
-    teacher = relationship("Teacher", back_populates="addresses", lazy='selectin')
+    address = relationship("Address", back_populates="persons", lazy='raise')
+    parent = relationship("Parent", back_populates="addresses", lazy='raise')
+    student = relationship("Student", back_populates="addresses", lazy='raise')
+    teacher = relationship("Teacher", back_populates="addresses", lazy='raise')
 
 
 class Address(Base):
     __tablename__ = "addresses"
+    __table_args__ = (Index("uq_addresses_dedup_key", "dedup_key", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     house_no = Column(String, nullable=False)
@@ -54,8 +59,15 @@ class Address(Base):
     state = Column(String, nullable=False)
     zip_code = Column(String, nullable=False)
     country = Column(String, nullable=False)
+    # Hash of the canonicalized fields (utils.address_utils); NULL only until the backfill has run
+    dedup_key = Column(String(64), nullable=True)
 
-    persons = relationship("PersonAddress", back_populates="address", lazy='selectin')
+    persons = relationship("PersonAddress", back_populates="address", lazy='raise')
+
+@event.listens_for(Address, "before_insert")
+@event.listens_for(Address, "before_update")
+def _set_address_dedup_key(mapper, connection, target):
+    target.dedup_key = address_dedup_key(target)
 
 
 class Parent(Base):
@@ -94,10 +106,10 @@ class Parent(Base):
     preferred_language = Column(String, nullable=True)
     communication_preference = Column(String, nullable=True)
 
-    students = relationship("Student", secondary="student_parents", back_populates="parents", viewonly=True, lazy='selectin')
-    student_associations  = relationship("StudentParent", back_populates="parent", lazy='selectin')
+    students = relationship("Student", secondary="student_parents", back_populates="parents", viewonly=True, lazy='raise')
+    student_associations  = relationship("StudentParent", back_populates="parent", lazy='raise')
 
-    addresses = relationship("PersonAddress", back_populates="parent", cascade="all, delete-orphan", lazy='selectin')
+    addresses = relationship("PersonAddress", back_populates="parent", cascade="all, delete-orphan", lazy='raise')
 
 
 class Student(Base):
@@ -143,19 +155,19 @@ class Student(Base):
     parent_photo = Column(String, nullable=True)  # Will store file path
     
     # Relationships
-    medical_details = relationship("MedicalDetail", back_populates="student", uselist=False, lazy='selectin')
-    transport_details = relationship("TransportDetail", back_populates="student", uselist=False, lazy='selectin')
+    medical_details = relationship("MedicalDetail", back_populates="student", uselist=False, lazy='raise')
+    transport_details = relationship("TransportDetail", back_populates="student", uselist=False, lazy='raise')
 
     # Relationship with parents via association table
-    parent_associations = relationship("StudentParent", back_populates="student", cascade="all, delete-orphan", lazy='selectin')
-    parents = relationship("Parent", secondary="student_parents", back_populates="students", viewonly=True, lazy='selectin')
+    parent_associations = relationship("StudentParent", back_populates="student", cascade="all, delete-orphan", passive_deletes=True, lazy='raise')
+    parents = relationship("Parent", secondary="student_parents", back_populates="students", viewonly=True, lazy='raise')
 
-    addresses = relationship("PersonAddress", back_populates="student", cascade="all, delete-orphan", lazy='selectin')
+    addresses = relationship("PersonAddress", back_populates="student", cascade="all, delete-orphan", lazy='raise')
 
     # --- Classes and Subjects ---
 
-    class_associations = relationship("ClassStudent", back_populates="student", cascade="all, delete-orphan", lazy='selectin')
-    classes = relationship("Class", secondary="class_students", back_populates="students", viewonly=True, lazy='selectin')
+    class_associations = relationship("ClassStudent", back_populates="student", cascade="all, delete-orphan", passive_deletes=True, lazy='raise')
+    classes = relationship("Class", secondary="class_students", back_populates="students", viewonly=True, lazy='raise')
 
 
 class MedicalDetail(Base):
@@ -169,7 +181,7 @@ class MedicalDetail(Base):
     doctor_contact = Column(String, nullable=True)
     health_insurance_details = Column(String, nullable=True)
 
-    student = relationship("Student", back_populates="medical_details", lazy='selectin')
+    student = relationship("Student", back_populates="medical_details", lazy='raise')
 
 
 class TransportDetail(Base):
@@ -184,7 +196,7 @@ class TransportDetail(Base):
     pickup_location = Column(String, nullable=True)
     bus_route_number = Column(String, nullable=True)
 
-    student = relationship("Student", back_populates="transport_details", lazy='selectin')
+    student = relationship("Student", back_populates="transport_details", lazy='raise')
 
 
 class Upload(Base):
@@ -226,7 +238,53 @@ class Upload(Base):
     # tags = Column(ARRAY(String))
     # metadata = Column(JSONB)
 
-    # app.mount("/static", StaticFiles(directory="uploads"), name="static")
+    # Served by GET /upload/{document_id}, which checks is_private; do not mount "uploads" as static files
+
+
+class UploadBlob(Base):
+    """
+    One stored file per distinct content of a tenant, shared by every Upload row with the same
+    checksum. ref_count is the number of those rows; the file is removed when it drops to zero.
+    """
+    __tablename__ = "upload_blobs"
+
+    __table_args__ = (
+        # The virus-scan queue: blobs waiting for a worker
+        Index("ix_upload_blobs_scan_queue", "scan_available_at", postgresql_where=text("scan_status = 'pending'")),
+    )
+
+    checksum = Column(String(64), primary_key=True)  # SHA-256 hex
+    storage_path = Column(String, nullable=False)
+    file_size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+
+    # Scanned once per content; the result is copied to Upload.virus_scan_status of every referencing row
+    scan_status = Column(Enum(VirusScanStatusEnum), nullable=False, default=VirusScanStatusEnum.pending)
+    scan_result = Column(String, nullable=True)  # signature found, or the last scan error
+    scan_attempts = Column(Integer, nullable=False, default=0)
+    scan_available_at = Column(DateTime, nullable=False, server_default=func.now())  # retry backoff
+    scan_claimed_until = Column(DateTime, nullable=True)  # lease of the worker scanning it
+
+
+class UploadSession(Base):
+    """A resumable upload in progress: chunks are written into a staging file until `received` reaches `file_size`."""
+    __tablename__ = "upload_sessions"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    original_filename = Column(String, nullable=False)
+    file_extension = Column(String, nullable=False)
+    content_type = Column(String, nullable=False)
+    file_category = Column(Enum(FileCategoryEnum), nullable=False)
+    related_entity_id = Column(Integer, nullable=True)
+    file_size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    received = Column(BigInteger, nullable=False, default=0)  # bytes written, always a whole number of chunks
+    finalizing = Column(Boolean, nullable=False, default=False)
+    created_by_id = Column(UUID(as_uuid=True), nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)  # naive UTC, pushed back by every chunk
+    node_id = Column(String, nullable=True, index=True)  # NODE_ID holding the staging file; NULL for older sessions
 
 
 class Tenant_db_Master(Base):
@@ -241,6 +299,13 @@ class Tenant_db_Master(Base):
     db_name = mapped_column(String, unique=True, nullable=False)
 
 
+@event.listens_for(Tenant_db_Master, "after_update")
+@event.listens_for(Tenant_db_Master, "after_delete")
+def _invalidate_tenant_engine(mapper, connection, target):
+    # Connection settings changed: drop the cached record and the pooled engine built from it
+    tenant_directory.invalidate(target.tenant_id)
+
+
 class UserMaster(Base):
     __tablename__ = "user_master"
     
@@ -329,9 +394,9 @@ class Teacher(Base):
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
     # Relationships
-    addresses = relationship("PersonAddress", back_populates="teacher", cascade="all, delete-orphan", lazy='selectin')
-    subject_associations = relationship("SubjectTeacher", back_populates="teacher", cascade="all, delete-orphan", lazy='selectin')
-    subjects = relationship("Subject", secondary="subject_teachers", back_populates="teachers", viewonly=True, lazy='selectin')
+    addresses = relationship("PersonAddress", back_populates="teacher", cascade="all, delete-orphan", lazy='raise')
+    subject_associations = relationship("SubjectTeacher", back_populates="teacher", cascade="all, delete-orphan", passive_deletes=True, lazy='raise')
+    subjects = relationship("Subject", secondary="subject_teachers", back_populates="teachers", viewonly=True, lazy='raise')
 
     # def __repr__(self):
     #     return f"<Teacher {self.first_name} {self.last_name}>"
@@ -355,10 +420,10 @@ class Class(Base):
     created_by = Column(String, nullable=True)
     updated_by = Column(String, nullable=True)
 
-    student_associations = relationship("ClassStudent", back_populates="klass", cascade="all, delete-orphan", lazy='selectin')
-    students = relationship("Student", secondary="class_students", back_populates="classes", viewonly=True, lazy='selectin')
-    subject_associations = relationship("ClassSubject", back_populates="klass", cascade="all, delete-orphan", lazy='selectin')
-    subjects = relationship("Subject", secondary="class_subjects", back_populates="classes", viewonly=True, lazy='selectin')
+    student_associations = relationship("ClassStudent", back_populates="klass", cascade="all, delete-orphan", passive_deletes=True, lazy='raise')
+    students = relationship("Student", secondary="class_students", back_populates="classes", viewonly=True, lazy='raise')
+    subject_associations = relationship("ClassSubject", back_populates="klass", cascade="all, delete-orphan", passive_deletes=True, lazy='raise')
+    subjects = relationship("Subject", secondary="class_subjects", back_populates="classes", viewonly=True, lazy='raise')
 
 class Subject(Base):
     __tablename__ = "subjects"
@@ -379,13 +444,14 @@ class Subject(Base):
     created_by = Column(String, nullable=True)
     updated_by = Column(String, nullable=True)
 
-    class_associations = relationship("ClassSubject", back_populates="subject", cascade="all, delete-orphan", lazy='selectin')
-    classes = relationship("Class", secondary="class_subjects", back_populates="subjects", viewonly=True, lazy='selectin')
-    teacher_associations = relationship("SubjectTeacher", back_populates="subject", cascade="all, delete-orphan", lazy='selectin')
-    teachers = relationship("Teacher", secondary="subject_teachers", back_populates="subjects", viewonly=True, lazy='selectin')
+    class_associations = relationship("ClassSubject", back_populates="subject", cascade="all, delete-orphan", passive_deletes=True, lazy='raise')
+    classes = relationship("Class", secondary="class_subjects", back_populates="subjects", viewonly=True, lazy='raise')
+    teacher_associations = relationship("SubjectTeacher", back_populates="subject", cascade="all, delete-orphan", passive_deletes=True, lazy='raise')
+    teachers = relationship("Teacher", secondary="subject_teachers", back_populates="subjects", viewonly=True, lazy='raise')
 
 class ClassStudent(Base):
     __tablename__ = "class_students"
+    __table_args__ = (UniqueConstraint("class_id", "student_id", name="uq_class_students_class_id_student_id"),)
     id = Column(Integer, primary_key=True, index=True)
     class_id = Column(UUID(as_uuid=True), ForeignKey("classes.id", ondelete="CASCADE"), nullable=False)
     student_id = Column(Integer, ForeignKey("students.id", ondelete="CASCADE"), nullable=False)
@@ -396,27 +462,30 @@ class ClassStudent(Base):
     created_by = Column(String, nullable=True)
     updated_by = Column(String, nullable=True)
 
-    student = relationship("Student", back_populates="class_associations", lazy='selectin')
-    klass = relationship("Class", back_populates="student_associations", lazy='selectin')
+    student = relationship("Student", back_populates="class_associations", lazy='raise')
+    klass = relationship("Class", back_populates="student_associations", lazy='raise')
 
 class ClassSubject(Base):
     __tablename__ = "class_subjects"
+    __table_args__ = (UniqueConstraint("class_id", "subject_id", name="uq_class_subjects_class_id_subject_id"),)
     id = Column(Integer, primary_key=True, index=True)
     class_id = Column(UUID(as_uuid=True), ForeignKey("classes.id", ondelete="CASCADE"), nullable=False)
     subject_id = Column(UUID(as_uuid=True), ForeignKey("subjects.id", ondelete="CASCADE"), nullable=False)
     assigned_date = Column(Date, nullable=True)
     is_optional = Column(Boolean, default=False)
+    periods_per_week = Column(Integer, nullable=True)  # weekly quota used by the timetable generator
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
     created_by = Column(String, nullable=True)
     updated_by = Column(String, nullable=True)
 
-    klass = relationship("Class", back_populates="subject_associations", lazy='selectin')
-    subject = relationship("Subject", back_populates="class_associations", lazy='selectin')
+    klass = relationship("Class", back_populates="subject_associations", lazy='raise')
+    subject = relationship("Subject", back_populates="class_associations", lazy='raise')
 
 class SubjectTeacher(Base):
     __tablename__ = "subject_teachers"
+    __table_args__ = (UniqueConstraint("subject_id", "teacher_id", name="uq_subject_teachers_subject_id_teacher_id"),)
     id = Column(Integer, primary_key=True, index=True)
     subject_id = Column(UUID(as_uuid=True), ForeignKey("subjects.id", ondelete="CASCADE"), nullable=False)
     teacher_id = Column(UUID(as_uuid=True), ForeignKey("teachers.id", ondelete="CASCADE"), nullable=False)
@@ -428,11 +497,20 @@ class SubjectTeacher(Base):
     created_by = Column(String, nullable=True)
     updated_by = Column(String, nullable=True)
 
-    subject = relationship("Subject", back_populates="teacher_associations", lazy='selectin')
-    teacher = relationship("Teacher", back_populates="subject_associations", lazy='selectin')
+    subject = relationship("Subject", back_populates="teacher_associations", lazy='raise')
+    teacher = relationship("Teacher", back_populates="subject_associations", lazy='raise')
 
 class Schedule(Base):
     __tablename__ = "schedules"
+    __table_args__ = (
+        # At most one active entry per class slot, and a teacher or room in one place per slot
+        Index("uq_schedules_class_slot", "class_id", "day_of_week", "period_number", unique=True, postgresql_where=text("is_active")),
+        Index("uq_schedules_teacher_slot", "teacher_id", "day_of_week", "period_number", unique=True, postgresql_where=text("is_active")),
+        Index("uq_schedules_room_slot", "room", "day_of_week", "period_number", unique=True, postgresql_where=text("is_active AND room IS NOT NULL")),
+        # Co-teacher / substitute bookings are checked by ScheduleService.find_conflicts through these
+        Index("ix_schedules_co_teacher_slot", "co_teacher_id", "day_of_week", "period_number"),
+        Index("ix_schedules_substitute_slot", "substitute_teacher_id", "day_of_week", "period_number"),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, server_default=func.uuid_generate_v4(), index=True, nullable=False)
     class_id = Column(UUID(as_uuid=True), ForeignKey("classes.id"), nullable=False)
     day_of_week = Column(SAEnum(DayOfWeekEnum), nullable=False)
@@ -456,8 +534,119 @@ class Schedule(Base):
     online_link = Column(String, nullable=True)
 
     # Relationships (optional, for easy joins)
-    klass = relationship("Class", lazy='selectin')
-    subject = relationship("Subject", lazy='selectin')
-    teacher = relationship("Teacher", foreign_keys=[teacher_id], lazy='selectin')
-    co_teacher = relationship("Teacher", foreign_keys=[co_teacher_id], lazy='selectin')
-    substitute_teacher = relationship("Teacher", foreign_keys=[substitute_teacher_id], lazy='selectin')
\ No newline at end of file
+    klass = relationship("Class", lazy='raise')
+    subject = relationship("Subject", lazy='raise')
+    teacher = relationship("Teacher", foreign_keys=[teacher_id], lazy='raise')
+    co_teacher = relationship("Teacher", foreign_keys=[co_teacher_id], lazy='raise')
+    substitute_teacher = relationship("Teacher", foreign_keys=[substitute_teacher_id], lazy='raise')
+
+class ScheduleSubstitution(Base):
+    """A substitute covering one schedule entry on one date (SubstituteService); the weekly entry is unchanged."""
+    __tablename__ = "schedule_substitutions"
+    __table_args__ = (
+        UniqueConstraint("schedule_id", "date", name="uq_schedule_substitutions_schedule_date"),
+        # A substitute covers one class per period of a day
+        UniqueConstraint("teacher_id", "date", "period_number", name="uq_schedule_substitutions_teacher_slot"),
+    )
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    schedule_id = Column(UUID(as_uuid=True), ForeignKey("schedules.id", ondelete="CASCADE"), nullable=False)
+    date = Column(Date, nullable=False, index=True)
+    period_number = Column(Integer, nullable=False)  # the schedule's, copied for the slot constraint
+    teacher_id = Column(UUID(as_uuid=True), ForeignKey("teachers.id"), nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+class TimetableGenerationJob(Base):
+    """A timetable generator run (services/timetable_service.py); any worker can report its state."""
+    __tablename__ = "timetable_jobs"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    status = Column(String, nullable=False)  # "running", "completed", "incomplete" or "failed"
+    seed = Column(Integer, nullable=False)
+    dry_run = Column(Boolean, nullable=False)
+    progress = Column(JSONB, nullable=False)
+    result = Column(JSONB, nullable=True)
+    error = Column(JSONB, nullable=True)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
+    updated_at = Column(DateTime, server_default=func.now(), nullable=False)  # heartbeat of the worker running it
+
+class TimetableVersion(Base):
+    """
+    Write counter of one class or teacher, bumped by triggers on schedules/classes writes; keys the
+    cached timetable grids. Per class and teacher, so writers only lock the rows of what they touch.
+    """
+    __tablename__ = "timetable_grid_versions"
+    kind = Column(String, primary_key=True)  # "class" or "teacher"
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+def _bump_versions(rows: str, scopes: str) -> str:
+    # Sorted, so concurrent writers lock the version rows they share in the same order
+    return f"""
+        INSERT INTO timetable_grid_versions (kind, id, version)
+        SELECT DISTINCT scope.kind, scope.id, 1 FROM {rows} AS changed, LATERAL (VALUES {scopes}) AS scope (kind, id)
+        WHERE scope.id IS NOT NULL ORDER BY scope.kind, scope.id
+        ON CONFLICT (kind, id) DO UPDATE SET version = timetable_grid_versions.version + 1;
+    """
+
+
+def _version_trigger_function(name: str, scopes: str) -> str:
+    return f"""
+    CREATE OR REPLACE FUNCTION {name}() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {_bump_versions("new_rows", scopes)}
+        ELSIF TG_OP = 'UPDATE' THEN
+            {_bump_versions("(SELECT * FROM old_rows UNION ALL SELECT * FROM new_rows)", scopes)}
+        ELSIF TG_OP = 'DELETE' THEN
+            {_bump_versions("old_rows", scopes)}
+        ELSE
+            UPDATE timetable_grid_versions SET version = version + 1;  -- TRUNCATE
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """
+
+
+# Statement-level triggers with transition tables, so a bulk write bumps each class and teacher it
+# touches once. A schedule write bumps its class and teachers (old and new values); a class write
+# bumps the class, whose period times the teachers' grids re-check. Idempotent; also run by core.migrations.
+TIMETABLE_VERSION_DDL = [
+    _version_trigger_function(
+        "bump_schedule_timetable_versions",
+        "('class', changed.class_id), ('teacher', changed.teacher_id), "
+        "('teacher', changed.co_teacher_id), ('teacher', changed.substitute_teacher_id)",
+    ),
+    _version_trigger_function("bump_class_timetable_versions", "('class', changed.id)"),
+    *[
+        statement
+        for table, function in (("schedules", "bump_schedule_timetable_versions"), ("classes", "bump_class_timetable_versions"))
+        for statement in (
+            f"DROP TRIGGER IF EXISTS {table}_timetable_version ON {table}",  # single-counter trigger it replaces
+            *[
+                statement
+                for event, transition in (
+                    ("INSERT", "NEW TABLE AS new_rows"),
+                    ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+                    ("DELETE", "OLD TABLE AS old_rows"),
+                )
+                for statement in (
+                    f"DROP TRIGGER IF EXISTS {table}_timetable_version_{event.lower()} ON {table}",
+                    f"CREATE TRIGGER {table}_timetable_version_{event.lower()} AFTER {event} ON {table} "
+                    f"REFERENCING {transition} FOR EACH STATEMENT EXECUTE FUNCTION {function}()",
+                )
+            ],
+            f"DROP TRIGGER IF EXISTS {table}_timetable_version_truncate ON {table}",
+            f"CREATE TRIGGER {table}_timetable_version_truncate AFTER TRUNCATE ON {table} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION {function}()",
+        )
+    ],
+    "DROP FUNCTION IF EXISTS bump_timetable_version()",
+    "DROP TABLE IF EXISTS timetable_versions",
+]
+
+@event.listens_for(Base.metadata, "after_create")
+def _install_timetable_version_triggers(target, connection, **kw):
+    if connection.dialect.name == "postgresql" and TimetableVersion.__tablename__ in target.tables:
+        for statement in TIMETABLE_VERSION_DDL:
+            connection.execute(text(statement))
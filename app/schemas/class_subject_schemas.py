@@ -156,6 +156,7 @@ class ClassSubjectBase(CamelCaseModel):
     subject_id: UUID
     assigned_date: Optional[date] = None
     is_optional: Optional[bool] = False
+    periods_per_week: Optional[int] = Field(None, ge=0)
     is_active: Optional[bool] = True
 
 class ClassSubjectCreate(ClassSubjectBase):
@@ -164,6 +165,7 @@ class ClassSubjectCreate(ClassSubjectBase):
 class ClassSubjectUpdate(CamelCaseModel):
     assigned_date: Optional[date] = None
     is_optional: Optional[bool] = None
+    periods_per_week: Optional[int] = Field(None, ge=0)
     is_active: Optional[bool] = None
 
 class ClassSubjectResponse(ClassSubjectBase):
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List, Generic, TypeVar
 from utils.constants import RoleEnum
 from uuid import UUID
 
@@ -11,6 +11,15 @@ class CamelCaseModel(BaseModel):
         populate_by_name = True
         from_attributes = True  # No harm in keeping this for all schemas
 
+T = TypeVar("T")
+
+class Page(CamelCaseModel, Generic[T]):
+    """One page of a keyset-paginated list; pass next_cursor back as `cursor` for the next page."""
+    items: List[T]
+    next_cursor: Optional[str] = None
+    limit: int
+    total: Optional[int] = None  # only computed when include_total=true
+
 class AddressBase(CamelCaseModel):
     house_no: str
     street_address: str
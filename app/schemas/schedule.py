@@ -1,13 +1,13 @@
 from pydantic import BaseModel, Field, RootModel
-from typing import Optional, Dict, List, Union
+from typing import Any, Optional, Dict, List, Union
 from uuid import UUID
-from datetime import time, datetime
-from utils.constants import DayOfWeekEnum
+from datetime import time, datetime, date as date_type
+from utils.constants import MAX_PERIOD_NUMBER, DayOfWeekEnum
 
 class ScheduleBase(BaseModel):
     class_id: UUID
     day_of_week: DayOfWeekEnum
-    period_number: int
+    period_number: int = Field(..., ge=1, le=MAX_PERIOD_NUMBER)
     subject_id: UUID
     teacher_id: UUID
     room: Optional[str] = None
@@ -22,7 +22,7 @@ class ScheduleCreate(ScheduleBase):
 
 class ScheduleUpdate(BaseModel):
     day_of_week: Optional[DayOfWeekEnum] = None
-    period_number: Optional[int] = None
+    period_number: Optional[int] = Field(None, ge=1, le=MAX_PERIOD_NUMBER)
     subject_id: Optional[UUID] = None
     teacher_id: Optional[UUID] = None
     room: Optional[str] = None
@@ -32,7 +32,68 @@ class ScheduleUpdate(BaseModel):
     notification_sent: Optional[bool] = None
     online_link: Optional[str] = None
 
+class ScheduleWeekEntry(BaseModel):
+    """One slot of a class's week for PUT /schedules/class/{class_id}/week (the class comes from the path)."""
+    day_of_week: DayOfWeekEnum
+    period_number: int = Field(..., ge=1, le=MAX_PERIOD_NUMBER)
+    subject_id: UUID
+    teacher_id: UUID
+    room: Optional[str] = None
+    co_teacher_id: Optional[UUID] = None
+    substitute_teacher_id: Optional[UUID] = None
+    attendance_taken: Optional[bool] = False
+    notification_sent: Optional[bool] = False
+    online_link: Optional[str] = None
+
+class ScheduleConflict(BaseModel):
+    index: int  # position of the checked entry in the request
+    kind: str  # "class", "room" or "teacher"
+    resource: str  # the class id, room or teacher id that is double-booked
+    day_of_week: DayOfWeekEnum
+    period_number: int
+    schedule_id: Optional[UUID] = None  # existing entry it clashes with
+    other_index: Optional[int] = None  # or another entry of the same request
+
+class FreeSlot(BaseModel):
+    day_of_week: DayOfWeekEnum
+    period_number: int
+
+class SubstitutePlanRequest(BaseModel):
+    absent_teacher_ids: List[UUID] = Field(..., min_length=1)
+    date: Optional[date_type] = None  # required unless dry_run; a dry run may give day_of_week instead
+    day_of_week: Optional[DayOfWeekEnum] = None
+    overwrite: bool = False  # also re-plan periods that already have a substitute
+    dry_run: bool = False
+
+class SubstituteAssignment(BaseModel):
+    schedule_id: UUID
+    class_id: UUID
+    period_number: int
+    subject_id: UUID
+    absent_teacher_id: UUID
+    substitute_teacher_id: Optional[UUID] = None  # None in `unfilled`
+    subject_match: bool = False  # the substitute teaches the subject
+
+class SubstitutePlan(BaseModel):
+    date: Optional[date_type] = None
+    day_of_week: DayOfWeekEnum
+    dry_run: bool
+    written: int
+    assignments: List[SubstituteAssignment]
+    unfilled: List[SubstituteAssignment]
+
+class ScheduleSubstitutionResponse(BaseModel):
+    id: UUID
+    schedule_id: UUID
+    date: date_type
+    period_number: int
+    class_id: UUID
+    subject_id: UUID
+    absent_teacher_id: UUID
+    substitute_teacher_id: UUID
+
 class ScheduleResponse(ScheduleBase):
+    period_number: int  # not bounded here, so rows stored before the check are still listed
     id: UUID
     created_at: datetime
     updated_at: datetime
@@ -40,6 +101,60 @@ class ScheduleResponse(ScheduleBase):
     class Config:
         from_attributes = True
 
-# New structure: {day: {period_number: ScheduleResponse | None}}
-class ScheduleGroupedResponse(RootModel[Dict[str, Dict[str, Optional[ScheduleResponse]]]]):
-    pass 
\ No newline at end of file
+class ScheduleWeekResult(BaseModel):
+    inserted: int
+    updated: int
+    deleted: int
+    schedules: List[ScheduleResponse]  # the class's week after the change
+
+class TimetablePeriod(BaseModel):
+    """A free period of a grid, with its timing from the class's period_times when it has one."""
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+
+class TimetableCell(ScheduleResponse):
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    role: Optional[str] = None  # teacher grids: "teacher", "co_teacher" or "substitute_teacher"
+
+# New structure: {day: {period_number: TimetableCell | TimetablePeriod | None}}
+class ScheduleGroupedResponse(RootModel[Dict[str, Dict[str, Optional[Union[TimetableCell, TimetablePeriod]]]]]):
+    pass 
+
+# --- Timetable generation ---
+
+class TimetableGenerateRequest(BaseModel):
+    class_ids: Optional[List[UUID]] = None  # default: every active class
+    days: Optional[List[DayOfWeekEnum]] = None  # default: TIMETABLE_DAYS
+    periods_per_week: Dict[UUID, int] = Field(default_factory=dict)  # subject_id -> quota, overrides ClassSubject
+    seed: int = 0
+    time_limit_seconds: float = Field(30, gt=0)
+    dry_run: bool = False
+
+class TimetableProgress(BaseModel):
+    placed: int = 0
+    total: int = 0
+    iterations: int = 0
+    elapsed_seconds: float = 0
+
+class UnplacedLesson(BaseModel):
+    class_id: UUID
+    subject_id: UUID
+    teacher_id: UUID
+    periods: int
+
+class TimetableGenerateResult(BaseModel):
+    complete: bool
+    soft_cost: int  # periods beyond the ideal per-day spread of their subject
+    unplaced: List[UnplacedLesson] = []
+    written: int = 0  # schedules saved (0 on dry runs and incomplete results)
+    entries: Optional[List[ScheduleCreate]] = None  # proposed timetable, on dry runs
+
+class TimetableJob(BaseModel):
+    job_id: UUID
+    status: str  # "running", "completed", "incomplete" or "failed"
+    seed: int
+    dry_run: bool
+    progress: TimetableProgress
+    result: Optional[TimetableGenerateResult] = None
+    error: Optional[Any] = None
@@ -109,6 +109,17 @@ class StudentResponseMessage(BaseModel):
     id: int
     message: str
 
+class StudentImportRowError(CamelCaseModel):
+    row: int  # spreadsheet row number, the header being row 1
+    errors: List[str]
+
+class StudentImportReport(CamelCaseModel):
+    total_rows: int
+    created: int
+    failed: int
+    dry_run: bool = False
+    errors: List[StudentImportRowError] = []
+
 
 
 
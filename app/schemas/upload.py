@@ -15,7 +15,8 @@ class BaseUpload(BaseModel):
     file_category: FileCategoryEnum = FileCategoryEnum.miscellaneous
     file_type: FileTypeEnum = FileTypeEnum.other
     url: Optional[HttpUrl] = None
-    expiry_at: Optional[datetime] = Field(default_factory=lambda: datetime.now(timezone.utc) + timedelta(days=30))
+    # Naive UTC, like the upload.expiry_at column (TIMESTAMP WITHOUT TIME ZONE)
+    expiry_at: Optional[datetime] = Field(default_factory=lambda: datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(days=30))
     is_private: bool = True
     status: FileStatusEnum = FileStatusEnum.archived
     virus_scan_status: VirusScanStatusEnum = VirusScanStatusEnum.pending
@@ -38,3 +39,20 @@ class UploadResponse(BaseUpload):
 class FileUploadRequest(BaseModel):
     file_category: FileCategoryEnum = Field(..., description="The category of the file being uploaded")
     related_entity_id: int = Field(..., description="ID of the related entity")
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., min_length=1)
+    content_type: ContentTypeEnum
+    file_size: int = Field(..., gt=0, description="Total size of the file in bytes")
+    file_category: FileCategoryEnum
+    related_entity_id: int
+
+class UploadSessionResponse(BaseModel):
+    id: UUID
+    original_filename: str
+    file_size: int
+    chunk_size: int
+    chunk_count: int
+    received: int = Field(..., description="Bytes stored so far; resume from this offset")
+    next_chunk: Optional[int] = Field(None, description="Index of the next chunk to PUT, None once every chunk is stored")
+    expires_at: datetime
@@ -0,0 +1,49 @@
+from typing import Dict, Iterable
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.model import Address
+from utils.address_utils import ADDRESS_KEY_FIELDS, address_dedup_key
+
+INSERT_BATCH_SIZE = 1000  # keeps each multi-row INSERT well under the driver's bind-parameter limit
+
+
+async def resolve_addresses(session: AsyncSession, addresses: Iterable) -> Dict[str, int]:
+    """
+    Map the dedup key of every given address (AddressBase or dict) to an `addresses` id,
+    inserting the ones that do not exist yet.
+
+    Lookups go through the unique dedup_key index, so the cost per address does not grow
+    with the table: one INSERT ... ON CONFLICT (dedup_key) DO NOTHING RETURNING per batch,
+    then one indexed SELECT for the keys that were already present. Runs in the caller's
+    transaction; use `address_dedup_key(address)` to find an address's id in the result.
+    """
+    wanted = {}
+    for address in addresses:
+        wanted.setdefault(address_dedup_key(address), address)
+    if not wanted:
+        return {}
+
+    ids = {}
+    keys = list(wanted)
+    for start in range(0, len(keys), INSERT_BATCH_SIZE):
+        rows = [dict(_address_values(wanted[key]), dedup_key=key) for key in keys[start:start + INSERT_BATCH_SIZE]]
+        inserted = await session.execute(
+            pg_insert(Address)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=[Address.dedup_key])
+            .returning(Address.dedup_key, Address.id)
+        )
+        ids.update(inserted.all())
+
+    existing = [key for key in keys if key not in ids]
+    if existing:
+        found = await session.execute(select(Address.dedup_key, Address.id).where(Address.dedup_key.in_(existing)))
+        ids.update(found.all())
+    return ids
+
+
+def _address_values(address) -> dict:
+    values = address if isinstance(address, dict) else address.model_dump()
+    # Every column is NOT NULL; a missing optional part (landmark) is stored as ""
+    return {field: values.get(field) if values.get(field) is not None else "" for field in ADDRESS_KEY_FIELDS}
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+from uuid import UUID
+from sqlalchemy import select
+from core.config import AVAILABILITY_TTL_SECONDS, TIMETABLE_DAYS
+from models.model import Class, Schedule, SubjectTeacher, Teacher
+from schemas.schedule import ScheduleCreate
+from services.base_service import AsyncBaseService
+from utils.constants import MAX_PERIOD_NUMBER, DayOfWeekEnum
+
+logger = logging.getLogger(__name__)
+
+DAYS = list(DayOfWeekEnum)
+DAY_INDEX = {day: index for index, day in enumerate(DAYS)}
+PERIOD_BITS = MAX_PERIOD_NUMBER  # bits reserved per day; period_number n of a day is bit n - 1
+# Every teacher column of an entry occupies that teacher for the slot
+TEACHER_ROLES = ("teacher_id", "co_teacher_id", "substitute_teacher_id")
+
+
+def slot_bit(day_of_week, period_number: int) -> int:
+    return 1 << (DAY_INDEX[DayOfWeekEnum(day_of_week)] * PERIOD_BITS + period_number - 1)
+
+
+class AvailabilityIndex:
+    """
+    Busy slots of one tenant's teachers, rooms and classes as week x period bitsets, so "is X
+    free at day/period" is a single bit test. Built from the active schedules and kept up to
+    date by add/discard on every schedule write of this process.
+    """
+    def __init__(self, teacher_ids: Iterable[UUID], class_periods: Dict[UUID, int], rooms: Iterable[str]):
+        self.teacher_ids = list(teacher_ids)  # active teachers, in a stable order
+        self.class_periods = dict(class_periods)
+        self.rooms = set(rooms)
+        self.built_at = time.monotonic()
+        self._masks = {"teacher": defaultdict(int), "room": defaultdict(int), "class": defaultdict(int)}
+        self._bookings = {}  # schedule_id -> (bit, [(kind, key)])
+        self._by_resource = defaultdict(set)  # (kind, key) -> schedule ids, to rebuild a mask on removal
+
+    @property
+    def periods_per_day(self) -> int:
+        return max(self.class_periods.values(), default=0)
+
+    def add(self, schedule_id, day_of_week, period_number: int, class_id, room=None, teacher_ids=()):
+        self.discard(schedule_id)
+        if not 1 <= period_number <= PERIOD_BITS:
+            # Only rows stored before period_number was validated; they have no slot to occupy
+            logger.warning("Schedule %s has period %s outside 1..%d and is left out of availability",
+                           schedule_id, period_number, PERIOD_BITS)
+            return
+        bit = slot_bit(day_of_week, period_number)
+        resources = [("class", class_id)] + [("teacher", teacher) for teacher in teacher_ids if teacher]
+        if room:
+            resources.append(("room", room))
+            self.rooms.add(room)
+        self._bookings[schedule_id] = (bit, resources)
+        for kind, key in resources:
+            self._masks[kind][key] |= bit
+            self._by_resource[(kind, key)].add(schedule_id)
+
+    def add_schedule(self, schedule):
+        """Record an ORM Schedule (or drop it from the index when it is no longer active)."""
+        if schedule.is_active is False:
+            self.discard(schedule.id)
+            return
+        self.add(schedule.id, schedule.day_of_week, schedule.period_number, schedule.class_id, schedule.room,
+                 [getattr(schedule, role) for role in TEACHER_ROLES])
+
+    def discard(self, schedule_id):
+        booking = self._bookings.pop(schedule_id, None)
+        if booking is None:
+            return
+        for resource in booking[1]:
+            # Rebuilt rather than cleared: a pre-existing double-booking may share the bit
+            remaining = self._by_resource[resource]
+            remaining.discard(schedule_id)
+            mask = 0
+            for other in remaining:
+                mask |= self._bookings[other][0]
+            self._masks[resource[0]][resource[1]] = mask
+
+    def busy_mask(self, kind: str, key) -> int:
+        return self._masks[kind].get(key, 0)
+
+    def is_free(self, kind: str, key, day_of_week, period_number: int) -> bool:
+        return not self.busy_mask(kind, key) & slot_bit(day_of_week, period_number)
+
+    def free_teachers(self, day_of_week, period_number: int, candidates: Optional[Iterable[UUID]] = None) -> List[UUID]:
+        bit = slot_bit(day_of_week, period_number)
+        masks = self._masks["teacher"]
+        return [teacher for teacher in (self.teacher_ids if candidates is None else candidates) if not masks.get(teacher, 0) & bit]
+
+    def free_rooms(self, day_of_week, period_number: int) -> List[str]:
+        bit = slot_bit(day_of_week, period_number)
+        masks = self._masks["room"]
+        return sorted(room for room in self.rooms if not masks.get(room, 0) & bit)
+
+    def common_free_slots(self, teacher_ids: Iterable[UUID], days: Iterable[DayOfWeekEnum], periods: int) -> List[dict]:
+        """(day_of_week, period_number) slots, up to `periods` a day, in which every one of the teachers is free."""
+        busy = 0
+        for teacher in teacher_ids:
+            busy |= self.busy_mask("teacher", teacher)
+        return [
+            {"day_of_week": day, "period_number": period}
+            for day in days for period in range(1, periods + 1)
+            if not busy & slot_bit(day, period)
+        ]
+
+
+class AvailabilityRegistry:
+    """
+    One AvailabilityIndex per tenant, built on first use. Writes made through this process
+    update it in place; writes made by other processes are picked up when it is rebuilt
+    after `ttl_seconds`.
+    """
+    def __init__(self, ttl_seconds: float = AVAILABILITY_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._indexes: Dict[str, AvailabilityIndex] = {}
+        self._locks = defaultdict(asyncio.Lock)
+
+    def loaded(self, tenant_id) -> Optional[AvailabilityIndex]:
+        index = self._indexes.get(str(tenant_id))
+        if index is not None and time.monotonic() - index.built_at > self.ttl_seconds:
+            return None
+        return index
+
+    async def get(self, tenant_id, sessionmaker) -> AvailabilityIndex:
+        index = self.loaded(tenant_id)
+        if index is not None:
+            return index
+        async with self._locks[str(tenant_id)]:
+            index = self.loaded(tenant_id)
+            if index is None:
+                index = await _build_index(sessionmaker)
+                self._indexes[str(tenant_id)] = index
+            return index
+
+    def record(self, tenant_id, schedule):
+        index = self._indexes.get(str(tenant_id))
+        if index is not None:
+            index.add_schedule(schedule)
+
+    def forget(self, tenant_id, schedule_id):
+        index = self._indexes.get(str(tenant_id))
+        if index is not None:
+            index.discard(schedule_id)
+
+    def invalidate(self, tenant_id):
+        """Drop a tenant's index, e.g. after a bulk write; it is rebuilt on the next query."""
+        self._indexes.pop(str(tenant_id), None)
+
+
+async def _build_index(sessionmaker) -> AvailabilityIndex:
+    async with sessionmaker() as session:
+        teacher_ids = (await session.scalars(
+            select(Teacher.id).where(Teacher.is_active.is_(True), Teacher.is_deleted.is_not(True)).order_by(Teacher.id)
+        )).all()
+        classes = (await session.execute(
+            select(Class.id, Class.total_periods, Class.room_number).where(Class.is_active.is_(True))
+        )).all()
+        schedules = (await session.execute(
+            select(Schedule.id, Schedule.day_of_week, Schedule.period_number, Schedule.class_id, Schedule.room,
+                   *[getattr(Schedule, role) for role in TEACHER_ROLES])
+            .where(Schedule.is_active.is_(True))
+        )).all()
+    index = AvailabilityIndex(teacher_ids, {klass.id: klass.total_periods for klass in classes},
+                              [klass.room_number for klass in classes if klass.room_number])
+    for row in schedules:
+        index.add(row.id, row.day_of_week, row.period_number, row.class_id, row.room,
+                  [getattr(row, role) for role in TEACHER_ROLES])
+    return index
+
+
+availability_indexes = AvailabilityRegistry()
+
+
+class AvailabilityService(AsyncBaseService[Schedule, ScheduleCreate]):
+    """Free-slot queries answered from the tenant's AvailabilityIndex."""
+    def __init__(self, tenant_id: str):
+        super().__init__(Schedule, tenant_id)
+
+    async def index(self) -> AvailabilityIndex:
+        return await availability_indexes.get(self.tenant_id, self.sessionmaker)
+
+    async def free_teachers(self, day_of_week: DayOfWeekEnum, period_number: int, subject_id: Optional[UUID] = None) -> List[UUID]:
+        """Active teachers with nothing booked in the slot, optionally only those who teach `subject_id`."""
+        index = await self.index()
+        candidates = None
+        if subject_id is not None:
+            async with self.sessionmaker() as session:
+                candidates = (await session.scalars(
+                    select(SubjectTeacher.teacher_id)
+                    .where(SubjectTeacher.subject_id == subject_id, SubjectTeacher.is_active.is_(True))
+                    .order_by(SubjectTeacher.teacher_id)
+                )).all()
+            active = set(index.teacher_ids)
+            candidates = [teacher for teacher in candidates if teacher in active]
+        return index.free_teachers(day_of_week, period_number, candidates)
+
+    async def free_rooms(self, day_of_week: DayOfWeekEnum, period_number: int) -> List[str]:
+        """Class rooms and rooms used by schedules that are not booked in the slot."""
+        return (await self.index()).free_rooms(day_of_week, period_number)
+
+    async def common_free_slots(self, teacher_ids: List[UUID], days: Optional[List[DayOfWeekEnum]] = None) -> List[dict]:
+        """Slots in which all the teachers are free, e.g. for planning a meeting."""
+        index = await self.index()
+        days = days or [DayOfWeekEnum(day) for day in TIMETABLE_DAYS]
+        return index.common_free_slots(teacher_ids, days, index.periods_per_day)
@@ -1,56 +1,141 @@
+import base64
+import json
+import uuid
+from datetime import date, datetime
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker, selectinload
 from sqlalchemy.exc import IntegrityError
-from typing import TypeVar, Generic, Type
+from typing import TypeVar, Generic, Type, Optional, Dict, List
 from pydantic import BaseModel, EmailStr
 from fastapi import HTTPException
-from core.database import Base, get_central_db, custom_create_engine
-from models.model import Tenant_db_Master
+from core.database import Base, get_central_db, get_central_async_db, tenant_engines, async_tenant_engines
 
 # Generic Type Variables
 ModelType = TypeVar("ModelType", bound=[Base])
 SchemaType = TypeVar("SchemaType", bound=BaseModel)
 
-class BaseService(Generic[ModelType, SchemaType]):
+class _ServiceBase(Generic[ModelType, SchemaType]):
+    """Listing configuration and statement builders shared by BaseService and AsyncBaseService."""
+    # Columns list endpoints may filter (equality) and sort on; the primary key is always sortable
+    filterable_fields: tuple = ()
+    sortable_fields: tuple = ()
+    default_page_size = 50
+    max_page_size = 200
+    # Loader options (eager-load graph) for what each read path returns. Relationships are
+    # lazy='raise', so every relationship a response schema reads must be listed here.
+    detail_options: tuple = ()
+    list_options: tuple = ()
+
+    def _email_statement(self, email: str, exclude_id=None):
+        stmt = select(self.model).where(self.model.email == email)
+        if exclude_id is not None:
+            stmt = stmt.where(self.model.id != exclude_id)
+        return stmt.limit(1)
+
+    def _load_statement(self, obj_id, options=()):
+        return (
+            select(self.model)
+            .options(*options)
+            .where(self.model.id == obj_id)
+            .execution_options(populate_existing=True)
+        )
+
+    def _page_statements(self, limit: Optional[int], cursor: Optional[str], sort: Optional[str],
+                         filters: Optional[Dict[str, str]]):
+        """Return (page statement, count statement, keyset columns, effective limit) for get_page."""
+        pk = self.model.__mapper__.primary_key[0]
+        limit = min(limit or self.default_page_size, self.max_page_size)
+        descending = bool(sort) and sort.startswith("-")
+        sort_name = sort.lstrip("-") if sort else pk.key
+        if sort_name != pk.key and sort_name not in self.sortable_fields:
+            raise HTTPException(status_code=400, detail=f"Cannot sort by '{sort_name}'")
+        sort_col = getattr(self.model, sort_name)
+        pk_col = getattr(self.model, pk.key)
+        keys = [pk_col] if sort_name == pk.key else [sort_col, pk_col]
+
+        conditions = []
+        for name, raw in (filters or {}).items():
+            if name not in self.filterable_fields:
+                raise HTTPException(status_code=400, detail=f"Cannot filter by '{name}'")
+            column = getattr(self.model, name)
+            conditions.append(column == _coerce(column, raw))
+        count_stmt = select(func.count(pk_col)).where(*conditions)
+
+        if cursor:
+            values = [_coerce(key, raw) for key, raw in zip(keys, _decode_cursor(cursor, len(keys)))]
+            if len(keys) == 1:
+                conditions.append(pk_col < values[0] if descending else pk_col > values[0])
+            else:
+                conditions.append(tuple_(*keys) < tuple_(*values) if descending else tuple_(*keys) > tuple_(*values))
+        stmt = (
+            select(self.model)
+            .options(*self.list_options)
+            .where(*conditions)
+            .order_by(*[key.desc() if descending else key.asc() for key in keys])
+            .limit(limit + 1)
+        )
+        return stmt, count_stmt, keys, limit
+
+    @staticmethod
+    def _page_result(items, keys, limit: int, total: Optional[int]) -> dict:
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = _encode_cursor([getattr(items[-1], key.key) for key in keys])
+        return {"items": items, "next_cursor": next_cursor, "limit": limit, "total": total}
+
+
+class BaseService(_ServiceBase[ModelType, SchemaType]):
+    """
+    Blocking (psycopg2) CRUD service. Request handlers use AsyncBaseService; this one remains
+    for background threads and scripts that have no event loop.
+    """
     def __init__(self, model: Type[ModelType], tenant_id: str = None):
         self.model = model
         self.tenant_id = tenant_id  # Store tenant_id for use in subclasses
         if tenant_id:
-            db = self.__get_tenant_db(tenant_id=tenant_id)
+            db = tenant_engines.get_engine(tenant_id)
         else:
             db = get_central_db()
         self.sessionmaker = sessionmaker(bind=db, expire_on_commit=False)  # just store the maker, not session
     
-    def __get_tenant_db(self, tenant_id: str):
-        central_db = get_central_db()
-        SessionLocal = sessionmaker(bind=central_db)
-        with SessionLocal() as session:
-            tenant = session.query(Tenant_db_Master).filter(Tenant_db_Master.tenant_id == tenant_id).first()
-        if tenant:
-            return custom_create_engine(user=tenant.db_user, password=tenant.db_password, host=tenant.db_host, port=tenant.db_port, db_name=tenant.db_name)
-        else:
-            raise ValueError(f"Tenant not found for tenant_id: {tenant_id}")
-    
     def validate_email(self, email: str, exclude_id: int = None):
         """
         Check email uniqueness, excluding the current record if exclude_id is provided
         """
         with self.sessionmaker() as session:
-            query = session.query(self.model).filter(self.model.email == email)
-            if exclude_id is not None:
-                query = query.filter(self.model.id != exclude_id)
-            existing_record = query.first()
+            existing_record = session.scalars(self._email_statement(email, exclude_id)).first()
             
             if existing_record:
                 raise HTTPException(status_code=400, detail="Email already registered")
         
     def get_all(self):
         with self.sessionmaker() as session:
-            return session.query(self.model).all()
+            return session.scalars(select(self.model).options(*self.list_options)).all()
+
+    def get_page(self, limit: Optional[int] = None, cursor: Optional[str] = None, sort: Optional[str] = None,
+                 filters: Optional[Dict[str, str]] = None, include_total: bool = False):
+        """
+        Keyset-paginated listing. `sort` is a whitelisted column, prefixed with "-" for descending;
+        ties (and the default order) are broken by primary key. Pass the returned `next_cursor`
+        back to fetch the following page.
+        """
+        stmt, count_stmt, keys, limit = self._page_statements(limit, cursor, sort, filters)
+        with self.sessionmaker() as session:
+            total = session.scalar(count_stmt) if include_total else None
+            items = session.scalars(stmt).all()
+            return self._page_result(items, keys, limit, total)
 
     def get_by_id(self, obj_id: int):
         with self.sessionmaker() as session:
-            return session.query(self.model).filter(self.model.id == obj_id).first()
+            return self.load(session, obj_id, self.detail_options)
+
+    def load(self, session: Session, obj_id, options=()):
+        """Fetch one row with the given loader options, overwriting any stale copy in the session."""
+        return session.scalars(self._load_statement(obj_id, options)).first()
 
     def create(self, obj_in: SchemaType):
         with self.sessionmaker() as session:
@@ -66,20 +151,188 @@ class BaseService(Generic[ModelType, SchemaType]):
 
     def update(self, obj_id: int, obj_in: SchemaType):
         with self.sessionmaker() as session:
-            db_obj = session.query(self.model).filter(self.model.id == obj_id).first()
+            db_obj = session.get(self.model, obj_id)
             if not db_obj:
                 return None
             for key, value in obj_in.model_dump(exclude_unset=True).items():
                 setattr(db_obj, key, value)
             session.commit()
-            session.refresh(db_obj)
-            return db_obj
+            return self.load(session, obj_id, self.detail_options)
 
     def delete(self, obj_id: int):
         with self.sessionmaker() as session:
-            db_obj = session.query(self.model).filter(self.model.id == obj_id).first()
+            db_obj = session.get(self.model, obj_id)
             if not db_obj:
                 return None
             session.delete(db_obj)
             session.commit()
-            return db_obj 
\ No newline at end of file
+            return db_obj 
+
+
+class AsyncBaseService(_ServiceBase[ModelType, SchemaType]):
+    """
+    CRUD service on the asyncpg engines, for async route handlers. Same interface as
+    BaseService with coroutine methods; relationships must come from the loader options
+    (detail_options / list_options), since nothing can lazy-load on an AsyncSession.
+    """
+    def __init__(self, model: Type[ModelType], tenant_id: str = None):
+        self.model = model
+        self.tenant_id = tenant_id
+        if tenant_id:
+            db = async_tenant_engines.get_engine(tenant_id)
+        else:
+            db = get_central_async_db()
+        self.sessionmaker = async_sessionmaker(bind=db, expire_on_commit=False)
+
+    async def validate_email(self, email: str, exclude_id: int = None):
+        """
+        Check email uniqueness, excluding the current record if exclude_id is provided
+        """
+        async with self.sessionmaker() as session:
+            existing_record = (await session.scalars(self._email_statement(email, exclude_id))).first()
+            if existing_record:
+                raise HTTPException(status_code=400, detail="Email already registered")
+
+    async def get_all(self):
+        async with self.sessionmaker() as session:
+            return (await session.scalars(select(self.model).options(*self.list_options))).all()
+
+    async def get_page(self, limit: Optional[int] = None, cursor: Optional[str] = None, sort: Optional[str] = None,
+                       filters: Optional[Dict[str, str]] = None, include_total: bool = False):
+        """Keyset-paginated listing; see BaseService.get_page."""
+        stmt, count_stmt, keys, limit = self._page_statements(limit, cursor, sort, filters)
+        async with self.sessionmaker() as session:
+            total = await session.scalar(count_stmt) if include_total else None
+            items = (await session.scalars(stmt)).all()
+            return self._page_result(items, keys, limit, total)
+
+    async def get_by_id(self, obj_id: int):
+        async with self.sessionmaker() as session:
+            return await self.load(session, obj_id, self.detail_options)
+
+    async def load(self, session: AsyncSession, obj_id, options=()):
+        """Fetch one row with the given loader options, overwriting any stale copy in the session."""
+        return (await session.scalars(self._load_statement(obj_id, options))).first()
+
+    async def create(self, obj_in: SchemaType):
+        async with self.sessionmaker() as session:
+            db_obj = self.model(**obj_in.model_dump(exclude_unset=True))
+            session.add(db_obj)
+            try:
+                await session.commit()
+                await session.refresh(db_obj)
+            except IntegrityError:
+                await session.rollback()
+                raise
+            return db_obj
+
+    async def update(self, obj_id: int, obj_in: SchemaType):
+        async with self.sessionmaker() as session:
+            db_obj = await session.get(self.model, obj_id)
+            if not db_obj:
+                return None
+            for key, value in obj_in.model_dump(exclude_unset=True).items():
+                setattr(db_obj, key, value)
+            await session.commit()
+            return await self.load(session, obj_id, self.detail_options)
+
+    async def delete(self, obj_id: int):
+        async with self.sessionmaker() as session:
+            db_obj = await session.get(self.model, obj_id)
+            if not db_obj:
+                return None
+            await session.delete(db_obj)
+            await session.commit()
+            return db_obj
+
+    async def add_links(self, owner_id, link_model, rows: List[dict], conflict_columns, target_model,
+                        target_label: str, options=()) -> list:
+        """
+        Create association rows for one owner (an instance of self.model) in a constant number of
+        round trips: owner and target existence checks, one INSERT ... ON CONFLICT DO NOTHING on
+        `conflict_columns` (owner column first, target column second), and one load of the new
+        rows with `options`. Returns only the associations that were created.
+        """
+        try:
+            async with self.sessionmaker() as session:
+                if not await session.get(self.model, owner_id):
+                    raise HTTPException(status_code=404, detail=f"{self.model.__name__} not found")
+                await self.require_ids(session, target_model, [row[conflict_columns[1]] for row in rows], target_label)
+                new_ids = await self.insert_ignoring_conflicts(session, link_model, rows, conflict_columns)
+                await session.commit()
+                if not new_ids:
+                    return []
+                return (await session.scalars(
+                    select(link_model).options(*options).where(link_model.id.in_(new_ids))
+                )).all()
+        except IntegrityError:
+            raise HTTPException(status_code=400, detail="Database integrity error.")
+
+    async def remove_links(self, link_model, owner_clause, target_column, target_ids) -> list:
+        """Delete the owner's associations to `target_ids` in one statement; returns the target ids removed."""
+        if not target_ids:
+            return []
+        async with self.sessionmaker() as session:
+            removed = (await session.scalars(
+                delete(link_model).where(owner_clause, target_column.in_(set(target_ids))).returning(target_column)
+            )).all()
+            await session.commit()
+            return removed
+
+    async def require_ids(self, session: AsyncSession, model, ids, label: str):
+        """Raise 400 unless every id exists in `model` (one query for the whole set)."""
+        ids = set(ids)
+        if not ids:
+            return
+        found = set((await session.scalars(select(model.id).where(model.id.in_(ids)))).all())
+        missing = ids - found
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Some {label} IDs do not exist: {', '.join(sorted(map(str, missing)))}")
+
+    async def insert_ignoring_conflicts(self, session: AsyncSession, model, rows: List[dict], conflict_columns) -> list:
+        """
+        Insert many rows in one INSERT ... ON CONFLICT (conflict_columns) DO NOTHING statement.
+        Returns the ids of the rows actually inserted (rows that already existed are skipped).
+        """
+        if not rows:
+            return []
+        stmt = (
+            pg_insert(model)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=[getattr(model, column) for column in conflict_columns])
+            .returning(model.id)
+        )
+        return (await session.scalars(stmt)).all()
+
+
+def _encode_cursor(values) -> str:
+    raw = json.dumps([value.isoformat() if isinstance(value, (date, datetime)) else str(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def _coerce(column, raw: str):
+    """Convert a query-string/cursor value to the column's Python type."""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return raw
+    try:
+        if python_type is bool:
+            if raw.lower() not in ("true", "false", "1", "0"):
+                raise ValueError(raw)
+            return raw.lower() in ("true", "1")
+        if python_type in (date, datetime):
+            return python_type.fromisoformat(raw)
+        if python_type is uuid.UUID:
+            return uuid.UUID(raw)
+        return python_type(raw)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Invalid value for '{column.key}': {raw}")
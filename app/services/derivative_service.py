@@ -0,0 +1,97 @@
+"""
+Thumbnails of uploaded images and first-page previews of PDFs. A variant (size x format) is
+rendered the first time it is requested, in a process pool so resizing never holds the event
+loop or the GIL, and is stored next to its blob under derivative_key(). Variants are keyed by the
+blob, so every upload of the same content shares them, and they are removed with the blob.
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from core.config import DERIVATIVE_SIZES, DERIVATIVE_WORKERS
+from core.storage import get_storage
+from utils.file_utils import DERIVATIVE_FORMATS, STAGING_DIR, derivative_key, remove_stored_files, staging_path
+from utils.thumbnails import render_derivative
+import uuid
+
+logger = logging.getLogger(__name__)
+
+PREVIEWABLE_TYPES = {"image/jpeg", "image/png", "application/pdf"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_inflight: Dict[str, asyncio.Future] = {}  # derivative key -> render in progress, so each variant is rendered once
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: the workers only import utils.thumbnails, not a copy of the app's engines and sockets
+        _pool = ProcessPoolExecutor(DERIVATIVE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def get_derivative(entry, size: int, fmt: str) -> str:
+    """Storage key of the `size`/`fmt` variant of a DownloadEntry, rendering it on first use."""
+    if size not in DERIVATIVE_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unsupported preview size, use one of {DERIVATIVE_SIZES}")
+    if fmt not in DERIVATIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported preview format, use one of {list(DERIVATIVE_FORMATS)}")
+    if entry.content_type not in PREVIEWABLE_TYPES:
+        raise HTTPException(status_code=415, detail="No preview is available for this file type")
+
+    key = derivative_key(entry.storage_path, size, fmt)
+    render = _inflight.get(key)
+    if render is None:
+        if await get_storage().exists(key):
+            return key
+        render = _inflight.get(key)  # may have started while exists() was awaited
+        if render is None:
+            render = _inflight[key] = asyncio.ensure_future(_render(entry, key, size, fmt))
+            render.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: a client hanging up does not cancel a render other requests may be waiting for
+    await asyncio.shield(render)
+    return key
+
+
+async def _render(entry, key: str, size: int, fmt: str):
+    storage = get_storage()
+    source = storage.local_path(entry.storage_path)
+    fetched, target = None, str(staging_path(uuid.uuid4()))
+    STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        if source is None:
+            # Remote storage: the renderer needs a local copy of the original
+            fetched = source = str(staging_path(uuid.uuid4()))
+            f = await run_in_threadpool(open, fetched, "wb")
+            try:
+                async for chunk in storage.iter_bytes(entry.storage_path):
+                    await run_in_threadpool(f.write, chunk)
+            finally:
+                f.close()
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                _get_pool(), render_derivative, source, entry.content_type, size, fmt, target,
+            )
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        except BrokenProcessPool:
+            shutdown_pool()  # a worker died (out of memory on a huge image?): start a fresh pool next time
+            logger.exception("Could not render preview %s", key)
+            raise HTTPException(status_code=503, detail="Preview generation is unavailable, please retry")
+        except Exception:
+            logger.exception("Could not render preview %s", key)
+            raise HTTPException(status_code=422, detail="A preview could not be generated for this file")
+        await storage.put_file(key, target)
+    finally:
+        remove_stored_files([path for path in (fetched, target) if path])
@@ -1,76 +1,47 @@
 from sqlalchemy.orm import Session, selectinload
 from fastapi import HTTPException
 from sqlalchemy.exc import IntegrityError
-from services.base_service import BaseService
-from models.model import Parent, PersonAddress, Address
+from services.base_service import AsyncBaseService
+from services.address_service import resolve_addresses
+from models.model import Parent, PersonAddress
 from schemas.parent import ParentCreate, ParentUpdate
 from typing import List, Optional
 from pydantic import EmailStr
+from utils.address_utils import address_dedup_key
+
+# ParentResponse: the parent's addresses with their Address rows
+PARENT_RESPONSE_GRAPH = (
+    selectinload(Parent.addresses).joinedload(PersonAddress.address),
+)
+
+class ParentService(AsyncBaseService[Parent, ParentCreate]):
+    detail_options = PARENT_RESPONSE_GRAPH
+    list_options = PARENT_RESPONSE_GRAPH
+    filterable_fields = ("gender", "occupation", "nationality", "phone", "email")
+    sortable_fields = ("first_name",)
 
-class ParentService(BaseService[Parent, ParentCreate]):
     def __init__(self, tenant_id: str):
         super().__init__(Parent, tenant_id)
 
-    def create(self, obj_in: ParentCreate):
+    async def create(self, obj_in: ParentCreate):
         try:
             # Validate email before proceeding
-            self.validate_email(obj_in.email)
+            await self.validate_email(obj_in.email)
             
-            with self.sessionmaker() as session:
-                # Extract addresses from input
-                address_data = obj_in.addresses
-                
-                new_addresses = []
-                parent_address_associations = []
-
-                if address_data:
-                    for addr_data in address_data:
-                        address_type = addr_data.address_type
-                        addr = addr_data.address
-
-                        # Check if the same address exists
-                        existing_address = (
-                            session.query(Address)
-                            .filter(
-                                Address.house_no == addr.house_no,
-                                Address.street_address == addr.street_address,
-                                Address.landmark == addr.landmark,
-                                Address.city == addr.city,
-                                Address.state == addr.state,
-                                Address.zip_code == addr.zip_code,
-                                Address.country == addr.country,
-                            )
-                            .first()
-                        )
-
-                        if existing_address:
-                            address = existing_address
-                        else:
-                            address = Address(**addr.model_dump())
-                            session.add(address)
-                            new_addresses.append(address)
+            async with self.sessionmaker() as session:
+                address_data = obj_in.addresses or []
+                # One round trip for all addresses, deduplicated by their hashed key
+                address_ids = await resolve_addresses(session, [addr_data.address for addr_data in address_data])
 
-                        session.flush()  # Make sure address has an ID
-
-                        # Create PersonAddress entry
-                        parent_address = PersonAddress(
-                            address_id=address.id,
-                            address_type=address_type,
-                        )
-                        parent_address_associations.append(parent_address)
-
-                # Create parent without addresses
                 parent = Parent(**obj_in.model_dump(exclude={"addresses"}))
+                parent.addresses = [
+                    PersonAddress(address_id=address_ids[address_dedup_key(addr_data.address)], address_type=addr_data.address_type)
+                    for addr_data in address_data
+                ]
                 session.add(parent)
-                session.flush()
-
-                # Link addresses
-                for pa in parent_address_associations:
-                    pa.parent_id = parent.id
-                    session.add(pa)
 
-                session.commit()    
-                session.refresh(parent)
+                await session.commit()    
+                await session.refresh(parent)
                 return parent
 
         except IntegrityError:
@@ -78,10 +49,10 @@ class ParentService(BaseService[Parent, ParentCreate]):
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
-    def update(self, parent_id: int, obj_in: ParentUpdate):
+    async def update(self, parent_id: int, obj_in: ParentUpdate):
         try:
-            with self.sessionmaker() as session:
-                parent = session.query(Parent).filter(Parent.id == parent_id).first()
+            async with self.sessionmaker() as session:
+                parent = await self.load(session, parent_id, PARENT_RESPONSE_GRAPH)
                 if not parent:
                     raise HTTPException(status_code=404, detail="Parent not found")
 
@@ -90,37 +61,27 @@ class ParentService(BaseService[Parent, ParentCreate]):
                 
                 # If email is being updated, validate it
                 if "email" in update_data:
-                    self.validate_email(update_data["email"], exclude_id=parent_id)
+                    await self.validate_email(update_data["email"], exclude_id=parent_id)
 
                 # Update parent fields except addresses
                 for key, value in update_data.items():
                     setattr(parent, key, value)
 
-                # Handle address updates if present
+                # Handle address updates if present. Addresses are shared between people, so a
+                # changed address re-points this parent's link instead of editing the shared row.
                 if obj_in.addresses:
-                    # existing_addresses keyed by address_type for quick lookup
-                    existing_addresses = {pa.address_type: pa.address for pa in parent.addresses}
+                    existing_links = {pa.address_type: pa for pa in parent.addresses}
+                    address_ids = await resolve_addresses(session, [addr_data.address for addr_data in obj_in.addresses])
 
                     for addr_data in obj_in.addresses:
-                        address_type = addr_data.address_type
-                        new_address_data = addr_data.address
-
-                        if address_type in existing_addresses:
-                            existing_address = existing_addresses[address_type]
-                            for field, new_value in new_address_data.model_dump().items():
-                                setattr(existing_address, field, new_value)
+                        address_id = address_ids[address_dedup_key(addr_data.address)]
+                        if addr_data.address_type in existing_links:
+                            existing_links[addr_data.address_type].address_id = address_id
                         else:
-                            # Create new address and association
-                            new_address = Address(**new_address_data.model_dump())
-                            session.add(new_address)
-                            session.flush()  # Get new_address.id
-
-                            new_pa = PersonAddress(parent_id=parent.id, address_id=new_address.id, address_type=address_type)
-                            session.add(new_pa)
+                            session.add(PersonAddress(parent_id=parent.id, address_id=address_id, address_type=addr_data.address_type))
 
-                session.commit()
-                session.refresh(parent)
-                return parent
+                await session.commit()
+                return await self.load(session, parent_id, PARENT_RESPONSE_GRAPH)
 
         except IntegrityError:
             raise HTTPException(status_code=400, detail="Database integrity error.")
@@ -1,86 +1,309 @@
-from typing import List, Optional
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
 from uuid import UUID
-from models.model import Schedule
-from schemas.schedule import ScheduleCreate
-from services.base_service import BaseService
+from core.config import TIMETABLE_CACHE_SIZE, TIMETABLE_CACHE_TTL_SECONDS
+from models.model import Class, Schedule, Subject, Teacher, TimetableVersion
+from schemas.schedule import ScheduleCreate, ScheduleUpdate, ScheduleResponse, ScheduleWeekEntry
+from sqlalchemy import Integer, String, and_, any_, bindparam, column, delete, func, insert, or_, select, update, values
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from services.base_service import AsyncBaseService
 from utils.constants import DayOfWeekEnum
+from services.availability_service import TEACHER_ROLES, availability_indexes
 from services.class_service import ClassService
 from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from utils.cache import TTLCache
 
-class ScheduleService(BaseService[Schedule, ScheduleCreate]):
+# Serialized timetable grids: (tenant_id, "class", id) -> (class version, JSON bytes) and
+# (tenant_id, "teacher", id) -> (teacher version, {class id: version}, JSON bytes)
+timetable_grids = TTLCache(maxsize=TIMETABLE_CACHE_SIZE, ttl_seconds=TIMETABLE_CACHE_TTL_SECONDS)
+
+class ScheduleService(AsyncBaseService[Schedule, ScheduleCreate]):
     """
     Service layer for Schedule entity, with multi-tenancy support.
-    Inherits CRUD from BaseService.
+    Inherits CRUD from AsyncBaseService.
     """
     def __init__(self, tenant_id: str):
         super().__init__(Schedule, tenant_id)
 
-    def list(self, class_id: Optional[UUID] = None, day_of_week: Optional[str] = None, teacher_id: Optional[UUID] = None) -> List[Schedule]:
+    async def list(self, class_id: Optional[UUID] = None, day_of_week: Optional[str] = None, teacher_id: Optional[UUID] = None) -> List[Schedule]:
         """List schedule entries, optionally filter by class_id and day_of_week."""
-        with self.sessionmaker() as session:
-            query = session.query(Schedule)
+        async with self.sessionmaker() as session:
+            query = select(Schedule)
             if class_id:
-                query = query.filter(Schedule.class_id == class_id)
+                query = query.where(Schedule.class_id == class_id)
             if day_of_week:
-                query = query.filter(Schedule.day_of_week == day_of_week)
+                query = query.where(Schedule.day_of_week == day_of_week)
             if teacher_id:
-                query = query.filter(Schedule.teacher_id == teacher_id)
-            return query.all()
+                query = query.where(Schedule.teacher_id == teacher_id)
+            return (await session.scalars(query)).all()
 
-    def get_class_timetable(self, class_id: UUID) -> dict:
-        """Return a dict of days to sorted list of Schedule objects for the class, or raise 404 if class not found."""
-        class_service = ClassService(self.tenant_id)
-        klass = class_service.get_by_id(class_id)
-        if not klass:
-            raise HTTPException(status_code=404, detail="Class not found")
-        
-        schedules = self.list(class_id=class_id)
-        days = [d.value for d in DayOfWeekEnum]
-        periods = list(range(1, klass.total_periods + 1))  # Get period range from class configuration
-        
-        # Initialize timetable with all days and periods
-        timetable = {}
-        for day in days:
-            timetable[day] = {}
-            for period in periods:
-                timetable[day][str(period)] = None  # None indicates no schedule for this period
-        
-        # Fill in actual schedule entries
-        for sched in schedules:
-            if sched.day_of_week in timetable and str(sched.period_number) in timetable[sched.day_of_week]:
-                timetable[sched.day_of_week][str(sched.period_number)] = sched
-        
-        return timetable
+    async def find_conflicts(self, entries: List[dict], exclude_ids: Iterable[UUID] = (),
+                             session: Optional[AsyncSession] = None) -> List[dict]:
+        """
+        Report every double-booking of a batch of prospective entries (dicts with the
+        ScheduleBase fields) in one round trip: against active schedules, and between the
+        entries themselves. A class, room or teacher (in any of TEACHER_ROLES) clashes when it
+        is used twice in the same day_of_week/period_number. `exclude_ids` are entries being
+        replaced or updated. Pass `session` to check inside an open transaction.
+        """
+        if not entries:
+            return []
+        if session is None:
+            async with self.sessionmaker() as session:
+                return await self.find_conflicts(entries, exclude_ids, session)
 
-    def get_teacher_timetable(self, teacher_id: UUID) -> dict:
-        """Return a dict of days to sorted list of Schedule objects for the teacher."""
-        schedules = self.list(teacher_id=teacher_id)
-        days = [d.value for d in DayOfWeekEnum]
-        
-        # For teacher timetable, we need to get periods from all classes they teach
-        # For now, we'll use a default range, but this could be enhanced to show
-        # the actual period ranges for each class they teach
-        periods = list(range(1, 9))  # Default 8 periods for teacher view
-        
-        # Initialize timetable with all days and periods
-        timetable = {}
-        for day in days:
-            timetable[day] = {}
-            for period in periods:
-                timetable[day][str(period)] = None  # None indicates no schedule for this period
-        
-        # Fill in actual schedule entries
-        for sched in schedules:
-            if sched.day_of_week in timetable and str(sched.period_number) in timetable[sched.day_of_week]:
-                timetable[sched.day_of_week][str(sched.period_number)] = sched
-        
-        return timetable
+        candidates = values(
+            column("idx", Integer), column("day_of_week", Schedule.day_of_week.type), column("period_number", Integer),
+            column("class_id", PG_UUID(as_uuid=True)), column("room", String),
+            column("teacher_ids", ARRAY(PG_UUID(as_uuid=True))),
+            name="candidates",
+        ).data([
+            (idx, entry["day_of_week"], entry["period_number"], entry["class_id"], entry.get("room"), _teachers(entry))
+            for idx, entry in enumerate(entries)
+        ])
+        # Each OR branch is served by one of the (resource, day_of_week, period_number) indexes
+        clash = or_(
+            Schedule.class_id == candidates.c.class_id,
+            Schedule.room == candidates.c.room,
+            *[getattr(Schedule, role) == any_(candidates.c.teacher_ids) for role in TEACHER_ROLES],
+        )
+        stmt = (
+            select(candidates.c.idx, Schedule.id, Schedule.class_id, Schedule.room, *[getattr(Schedule, role) for role in TEACHER_ROLES])
+            .select_from(candidates)
+            .join(Schedule, and_(
+                Schedule.day_of_week == candidates.c.day_of_week,
+                Schedule.period_number == candidates.c.period_number,
+                Schedule.is_active.is_(True),
+                clash,
+            ))
+        )
+        exclude_ids = list(exclude_ids)
+        if exclude_ids:
+            stmt = stmt.where(Schedule.id.not_in(exclude_ids))
+
+        conflicts = []
+        for row in await session.execute(stmt):
+            booked = {"class_id": row.class_id, "room": row.room, "teachers": {getattr(row, role) for role in TEACHER_ROLES}}
+            conflicts.extend(_clashes(row.idx, entries[row.idx], booked, schedule_id=row.id))
+
+        # Clashes inside the batch itself
+        by_slot = defaultdict(list)
+        for idx, entry in enumerate(entries):
+            by_slot[(entry["day_of_week"], entry["period_number"])].append(idx)
+        for indexes in by_slot.values():
+            for position, idx in enumerate(indexes):
+                for other in indexes[:position]:
+                    other_entry = entries[other]
+                    booked = {"class_id": other_entry["class_id"], "room": other_entry.get("room"), "teachers": set(_teachers(other_entry))}
+                    conflicts.extend(_clashes(idx, entries[idx], booked, other_index=other))
+        return sorted(conflicts, key=lambda conflict: conflict["index"])
+
+    async def ensure_no_conflicts(self, entries: List[dict], exclude_ids: Iterable[UUID] = (),
+                                  session: Optional[AsyncSession] = None):
+        conflicts = await self.find_conflicts(entries, exclude_ids, session)
+        if conflicts:
+            raise HTTPException(status_code=409, detail={
+                "message": "Schedule conflicts with existing entries",
+                "conflicts": jsonable_encoder(conflicts),
+            })
+
+    async def get_class_timetable(self, class_id: UUID) -> bytes:
+        """
+        The class's week grid as JSON: {day: {period: entry with start/end time | times only | None}}
+        for periods 1..total_periods. Grids are cached and served while the class's timetable
+        version (bumped by triggers on writes of its schedules and its class row) is unchanged.
+        """
+        async with self.sessionmaker() as session:
+            # Read the version before the data: a concurrent write then at worst makes the entry stale early
+            version = await session.scalar(
+                select(TimetableVersion.version).where(TimetableVersion.kind == "class", TimetableVersion.id == class_id)
+            ) or 0  # no row: not written since the triggers were installed
+            key = (str(self.tenant_id), "class", str(class_id))
+            cached = timetable_grids.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+            klass = (await session.execute(
+                select(Class.total_periods, Class.period_times).where(Class.id == class_id)
+            )).first()
+            if not klass:
+                raise HTTPException(status_code=404, detail="Class not found")
+            schedules = (await session.scalars(
+                select(Schedule).where(Schedule.class_id == class_id, Schedule.is_active.is_(True))
+            )).all()
+
+        period_times = klass.period_times or {}
+        grid = _empty_grid(klass.total_periods)
+        for schedule in schedules:
+            cells = grid[schedule.day_of_week.value]
+            if str(schedule.period_number) in cells:
+                cells[str(schedule.period_number)] = _cell(schedule, period_times)
+        for cells in grid.values():
+            for period, cell in cells.items():
+                period_time = period_times.get(period)
+                if cell is None and period_time:
+                    cells[period] = {"start_time": period_time.get("start_time"), "end_time": period_time.get("end_time")}
+        payload = json.dumps(jsonable_encoder(grid)).encode()
+        timetable_grids.set(key, (version, payload))
+        return payload
+
+    async def get_teacher_timetables(self, teacher_ids: Iterable[UUID]) -> Dict[UUID, bytes]:
+        """
+        Week grids (JSON) of several teachers, with every slot they teach, co-teach or substitute
+        in; each cell carries its `role` and its class's period times. A grid spans the most
+        periods of the classes the teacher has entries in. A cached grid is served while the
+        teacher's version and those of the classes in it (whose period times it shows) are
+        unchanged; the grids that are not cached are built from one indexed query. Unknown ids
+        are left out.
+        """
+        teacher_ids = list(dict.fromkeys(teacher_ids))
+        grids = {}
+        async with self.sessionmaker() as session:
+            cached = {}
+            for teacher_id in teacher_ids:
+                entry = timetable_grids.get((str(self.tenant_id), "teacher", str(teacher_id)))
+                if entry is not None:
+                    cached[teacher_id] = entry
+            class_ids = {class_id for _, class_versions, _ in cached.values() for class_id in class_versions}
+            # Read the versions before the data: a concurrent write then at worst makes an entry stale early
+            versions = {
+                (row.kind, row.id): row.version
+                for row in await session.execute(
+                    select(TimetableVersion.kind, TimetableVersion.id, TimetableVersion.version).where(or_(
+                        and_(TimetableVersion.kind == "teacher", TimetableVersion.id.in_(teacher_ids)),
+                        and_(TimetableVersion.kind == "class", TimetableVersion.id.in_(class_ids)),
+                    ))
+                )
+            }
+            missing = []
+            for teacher_id in teacher_ids:
+                entry = cached.get(teacher_id)
+                if entry is not None and entry[0] == versions.get(("teacher", teacher_id), 0) and all(
+                    version == versions.get(("class", class_id), 0) for class_id, version in entry[1].items()
+                ):
+                    grids[teacher_id] = entry[2]
+                else:
+                    missing.append(teacher_id)
+            if not missing:
+                return grids
+
+            missing = set((await session.scalars(select(Teacher.id).where(Teacher.id.in_(missing)))).all())
+            class_version = (
+                select(TimetableVersion.version)
+                .where(TimetableVersion.kind == "class", TimetableVersion.id == Class.id)
+                .scalar_subquery()
+            )
+            rows = (await session.execute(
+                # The class versions come from the same snapshot as the period times they vouch for
+                select(Schedule, Class.total_periods, Class.period_times, func.coalesce(class_version, 0).label("class_version"))
+                .join(Class, Class.id == Schedule.class_id)
+                # Each branch is served by its (teacher column, day_of_week, period_number) index
+                .where(Schedule.is_active.is_(True), or_(*[getattr(Schedule, role).in_(missing) for role in TEACHER_ROLES]))
+                .order_by(Schedule.day_of_week, Schedule.period_number)
+            )).all() if missing else []
+
+        entries = defaultdict(list)
+        for row in rows:
+            for role in TEACHER_ROLES:
+                teacher_id = getattr(row.Schedule, role)
+                if teacher_id in missing:
+                    entries[teacher_id].append((row, role))
+        for teacher_id in missing:
+            grid = _empty_grid(max((row.total_periods for row, _ in entries[teacher_id]), default=0))
+            for row, role in entries[teacher_id]:
+                cells = grid[row.Schedule.day_of_week.value]
+                # First role wins if a slot is double-booked: teacher, then co-teacher, then substitute
+                if cells.get(str(row.Schedule.period_number), False) is None:
+                    cells[str(row.Schedule.period_number)] = _cell(row.Schedule, row.period_times or {}, role=role.removesuffix("_id"))
+            payload = json.dumps(jsonable_encoder(grid)).encode()
+            class_versions = {row.Schedule.class_id: row.class_version for row, _ in entries[teacher_id]}
+            timetable_grids.set(
+                (str(self.tenant_id), "teacher", str(teacher_id)),
+                (versions.get(("teacher", teacher_id), 0), class_versions, payload),
+            )
+            grids[teacher_id] = payload
+        return {teacher_id: grids[teacher_id] for teacher_id in teacher_ids if teacher_id in grids}
+
+    async def department_teacher_ids(self, department: str) -> List[UUID]:
+        async with self.sessionmaker() as session:
+            return (await session.scalars(
+                select(Teacher.id)
+                .where(Teacher.department == department, Teacher.is_active.is_(True), Teacher.is_deleted.is_not(True))
+                .order_by(Teacher.id)
+            )).all()
+
+    async def replace_week(self, class_id: UUID, entries: List[ScheduleWeekEntry]) -> dict:
+        """
+        Make `entries` the class's complete set of active schedules in one transaction. Every slot
+        is checked against total_periods and for conflicts in one pass, then the difference to
+        the current rows is applied as one DELETE, one executemany UPDATE and one INSERT.
+        """
+        slots = [(entry.day_of_week, entry.period_number) for entry in entries]
+        duplicates = sorted({slot for slot in slots if slots.count(slot) > 1})
+        if duplicates:
+            raise HTTPException(status_code=400, detail=f"Slots given more than once: {[f'{day.value} {period}' for day, period in duplicates]}")
+
+        async with self.sessionmaker() as session:
+            try:
+                async with session.begin():
+                    # Row lock: concurrent replacements of the same class run one after the other
+                    total_periods = await session.scalar(select(Class.total_periods).where(Class.id == class_id).with_for_update())
+                    if total_periods is None:
+                        raise HTTPException(status_code=404, detail="Class not found")
+                    out_of_range = [f"{day.value} {period}" for day, period in slots if not 1 <= period <= total_periods]
+                    if out_of_range:
+                        raise HTTPException(status_code=400, detail=f"Periods outside 1..{total_periods} for this class: {out_of_range}")
+                    await self.require_ids(session, Subject, {entry.subject_id for entry in entries}, "subject")
+                    await self.require_ids(session, Teacher, {
+                        getattr(entry, role) for entry in entries for role in TEACHER_ROLES if getattr(entry, role)
+                    }, "teacher")
+
+                    existing = {
+                        (schedule.day_of_week, schedule.period_number): schedule
+                        for schedule in (await session.scalars(
+                            select(Schedule).where(Schedule.class_id == class_id, Schedule.is_active.is_(True))
+                        )).all()
+                    }
+                    wanted = {(entry.day_of_week, entry.period_number): {**entry.model_dump(), "class_id": class_id} for entry in entries}
+                    await self.ensure_no_conflicts(list(wanted.values()), exclude_ids=[s.id for s in existing.values()], session=session)
+
+                    deletes = [schedule.id for slot, schedule in existing.items() if slot not in wanted]
+                    inserts = [values for slot, values in wanted.items() if slot not in existing]
+                    updates = [
+                        {"schedule_id": existing[slot].id, **values}
+                        for slot, values in wanted.items()
+                        if slot in existing and any(getattr(existing[slot], field) != value for field, value in values.items())
+                    ]
+                    table = Schedule.__table__
+                    if deletes:
+                        await session.execute(delete(table).where(table.c.id.in_(deletes)))
+                    if updates:
+                        await session.execute(
+                            update(table).where(table.c.id == bindparam("schedule_id"))
+                            .values({field: bindparam(field) for field in ScheduleWeekEntry.model_fields}),
+                            updates,
+                        )
+                    if inserts:
+                        await session.execute(insert(table), inserts)
+            except IntegrityError:
+                raise HTTPException(status_code=409, detail="Schedule slot was booked concurrently, please retry")
+
+            schedules = (await session.scalars(
+                select(Schedule).where(Schedule.class_id == class_id, Schedule.is_active.is_(True))
+                .order_by(Schedule.day_of_week, Schedule.period_number)
+            )).all()
+        availability_indexes.invalidate(self.tenant_id)
+        return {"inserted": len(inserts), "updated": len(updates), "deleted": len(deletes), "schedules": schedules}
 
-    def create(self, schedule_data: ScheduleCreate) -> Schedule:
+    async def create(self, schedule_data: ScheduleCreate) -> Schedule:
         """Create a new schedule entry with period validation."""
         # Validate period number against class configuration
         class_service = ClassService(self.tenant_id)
-        klass = class_service.get_by_id(schedule_data.class_id)
+        klass = await class_service.get_by_id(schedule_data.class_id)
         if not klass:
             raise HTTPException(status_code=404, detail="Class not found")
         
@@ -90,26 +313,80 @@ class ScheduleService(BaseService[Schedule, ScheduleCreate]):
                 detail=f"Period number {schedule_data.period_number} exceeds the configured total periods ({klass.total_periods}) for this class"
             )
         
-        return super().create(schedule_data)
+        await self.ensure_no_conflicts([schedule_data.model_dump()])
+        try:
+            schedule = await super().create(schedule_data)
+        except IntegrityError:
+            # Lost a race for the slot; the unique slot indexes caught it
+            raise HTTPException(status_code=409, detail="Schedule slot was booked concurrently, please retry")
+        availability_indexes.record(self.tenant_id, schedule)
+        return schedule
 
-    def update(self, schedule_id: UUID, schedule_data: dict) -> Schedule:
-        """Update a schedule entry with period validation."""
+    async def update(self, schedule_id: UUID, schedule_data: ScheduleUpdate) -> Schedule:
+        """Update a schedule entry with period validation and conflict checks."""
         # Get the current schedule to check class_id
-        current_schedule = self.get_by_id(schedule_id)
+        current_schedule = await self.get_by_id(schedule_id)
         if not current_schedule:
             raise HTTPException(status_code=404, detail="Schedule not found")
-        
+
+        changes = schedule_data.model_dump(exclude_unset=True)
         # Validate period number if it's being updated
-        if 'period_number' in schedule_data:
+        if changes.get("period_number") is not None:
             class_service = ClassService(self.tenant_id)
-            klass = class_service.get_by_id(current_schedule.class_id)
+            klass = await class_service.get_by_id(current_schedule.class_id)
             if not klass:
                 raise HTTPException(status_code=404, detail="Class not found")
             
-            if schedule_data['period_number'] > klass.total_periods:
+            if changes["period_number"] > klass.total_periods:
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Period number {schedule_data['period_number']} exceeds the configured total periods ({klass.total_periods}) for this class"
+                    detail=f"Period number {changes['period_number']} exceeds the configured total periods ({klass.total_periods}) for this class"
                 )
-        
-        return super().update(schedule_id, schedule_data) 
\ No newline at end of file
+
+        merged = {field: getattr(current_schedule, field) for field in ScheduleCreate.model_fields}
+        merged.update(changes)
+        await self.ensure_no_conflicts([merged], exclude_ids=[schedule_id])
+        try:
+            schedule = await super().update(schedule_id, schedule_data)
+        except IntegrityError:
+            raise HTTPException(status_code=409, detail="Schedule slot was booked concurrently, please retry")
+        if schedule is not None:
+            availability_indexes.record(self.tenant_id, schedule)
+        return schedule
+
+    async def delete(self, schedule_id: UUID):
+        schedule = await super().delete(schedule_id)
+        if schedule is not None:
+            availability_indexes.forget(self.tenant_id, schedule_id)
+        return schedule
+
+
+def _empty_grid(periods: int) -> dict:
+    return {day.value: {str(period): None for period in range(1, periods + 1)} for day in DayOfWeekEnum}
+
+def _cell(schedule: Schedule, period_times: dict, **extra) -> dict:
+    cell = {**ScheduleResponse.model_validate(schedule).model_dump(), **extra}
+    period_time = period_times.get(str(schedule.period_number))
+    if period_time:
+        cell["start_time"], cell["end_time"] = period_time.get("start_time"), period_time.get("end_time")
+    return cell
+
+def _teachers(entry: dict) -> List[UUID]:
+    return list(dict.fromkeys(entry[role] for role in TEACHER_ROLES if entry.get(role)))
+
+def _clashes(idx: int, entry: dict, booked: dict, schedule_id=None, other_index=None) -> List[dict]:
+    """What `entry` shares with an entry booked in the same slot (`booked`: class_id, room, teachers)."""
+    found = []
+    if entry["class_id"] == booked["class_id"]:
+        found.append(("class", entry["class_id"]))
+    if entry.get("room") and entry.get("room") == booked["room"]:
+        found.append(("room", entry["room"]))
+    found.extend(("teacher", teacher) for teacher in _teachers(entry) if teacher in booked["teachers"])
+    return [
+        {
+            "index": idx, "kind": kind, "resource": str(resource),
+            "day_of_week": entry["day_of_week"], "period_number": entry["period_number"],
+            "schedule_id": schedule_id, "other_index": other_index,
+        }
+        for kind, resource in found
+    ]
@@ -1,20 +1,51 @@
-from services.base_service import BaseService
-from models.model import Student, Parent, StudentParent, PersonAddress, Address
+from typing import Iterator, List, Tuple
+from services.base_service import AsyncBaseService
+from services.address_service import resolve_addresses
+from models.model import Student, Parent, StudentParent, PersonAddress
+from schemas.common_schemas import AddressBase
 from schemas.student import StudentCreate, StudentUpdate
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session, joinedload, selectinload
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from sqlalchemy.exc import IntegrityError
+from core.config import STUDENT_IMPORT_CHUNK_SIZE
+from utils.address_utils import address_dedup_key
 
-class StudentService(BaseService[Student, StudentCreate]):
+# StudentResponse (detail and list rows): parents with their addresses, medical and transport details.
+# Relative options, so other graphs can nest them under a Student relationship.
+STUDENT_RESPONSE_GRAPH = (
+    selectinload(Student.parent_associations)
+    .joinedload(StudentParent.parent)
+    .selectinload(Parent.addresses)
+    .joinedload(PersonAddress.address),
+    selectinload(Student.medical_details),
+    selectinload(Student.transport_details),
+)
+
+# Import sheet columns besides the StudentCreate fields (snake_case or camelCase headers):
+#   parents       "12:Father; 13:Mother" (existing parent ids with the relationship)
+#   address_type  plus address_house_no, address_street_address, address_landmark, address_city,
+#                 address_state, address_zip_code, address_country for one address per student
+ADDRESS_FIELDS = tuple(AddressBase.model_fields)
+ADDRESS_COLUMNS = {f"address_{field}": field for field in ADDRESS_FIELDS}
+
+class StudentService(AsyncBaseService[Student, StudentCreate]):
+    detail_options = STUDENT_RESPONSE_GRAPH
+    list_options = STUDENT_RESPONSE_GRAPH
+    filterable_fields = ("grade", "section", "gender", "house", "caste_category", "medium_of_instruction", "roll_number", "student_id")
+    sortable_fields = ("first_name",)
 
     def __init__(self, tenant_id: str):
         super().__init__(Student, tenant_id)
 
-    def get_by_id(self, student_id: int):
+    async def get_by_id(self, student_id: int):
         try:
-            with self.sessionmaker() as session:
-                student = (
-                    session.query(Student)
+            async with self.sessionmaker() as session:
+                student = (await session.scalars(
+                    select(Student)
+                    .options(*STUDENT_RESPONSE_GRAPH)
                     # .options(joinedload(Student.parent_associations).joinedload(StudentParent.parent))
                     # .options(
                     #     joinedload(Student.parent_associations).joinedload(StudentParent.parent),
@@ -23,9 +54,8 @@ class StudentService(BaseService[Student, StudentCreate]):
                     #     joinedload(Student.transport_details),
                     #     joinedload(Student.student_class_associations)
                     # )
-                    .filter(Student.id == student_id)
-                    .first()
-                )
+                    .where(Student.id == student_id)
+                )).first()
                 
                 if not student:
                     raise HTTPException(status_code=404, detail="Student not found")
@@ -35,18 +65,18 @@ class StudentService(BaseService[Student, StudentCreate]):
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
-    def create(self, obj_in: StudentCreate):
+    async def create(self, obj_in: StudentCreate):
         try:
             # Validate email before proceeding
-            self.validate_email(obj_in.email)
+            await self.validate_email(obj_in.email)
             
-            with self.sessionmaker() as session:
+            async with self.sessionmaker() as session:
                 # Extract parent IDs & relationships from the payload
                 parent_relationships = {p.id: p.relationship for p in obj_in.parent_data}
                 parent_ids = list(parent_relationships.keys())  
 
                 # Fetch existing parents
-                existing_parents = session.query(Parent).filter(Parent.id.in_(parent_ids)).all()
+                existing_parents = (await session.scalars(select(Parent).where(Parent.id.in_(parent_ids)))).all()
                 if len(existing_parents) != len(parent_ids):
                     raise HTTPException(status_code=400, detail="Some parent IDs do not exist.")
 
@@ -61,41 +91,18 @@ class StudentService(BaseService[Student, StudentCreate]):
                 ]
                 student.parent_associations.extend(associations)
 
-                # Handle Addresses
-                addresses = []
-                if obj_in.address_data:
-                    for address_entry in obj_in.address_data:
-                        address_details = address_entry.address
-
-                        # Check if address already exists
-                        address = session.query(Address).filter_by(
-                            house_no=address_details.house_no,
-                            street_address=address_details.street_address,
-                            city=address_details.city,
-                            state=address_details.state,
-                            zip_code=address_details.zip_code,
-                            country=address_details.country
-                        ).first()
-
-                        if not address:
-                            address_data = address_details.model_dump()
-                            address = Address(**address_data)
-                            session.add(address)
-                            session.flush()
-
-                        # Create StudentAddress relationship
-                        student_address = PersonAddress(
-                            student=student,
-                            address=address,
-                            address_type=address_entry.address_type
-                        )
-                        addresses.append(student_address)
-
+                # Handle Addresses: resolved (or inserted) together through the dedup-key index
+                address_data = obj_in.address_data or []
+                address_ids = await resolve_addresses(session, [entry.address for entry in address_data])
+                addresses = [
+                    PersonAddress(address_id=address_ids[address_dedup_key(entry.address)], address_type=entry.address_type)
+                    for entry in address_data
+                ]
                 student.addresses.extend(addresses)
 
                 session.add(student)
-                session.commit()
-                session.refresh(student)
+                await session.commit()
+                await session.refresh(student)
 
                 # # Reload the student with eager loading
                 # student = (
@@ -118,10 +125,14 @@ class StudentService(BaseService[Student, StudentCreate]):
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
-    def update(self, student_id: int, obj_in: StudentUpdate):
+    async def update(self, student_id: int, obj_in: StudentUpdate):
         try:
-            with self.sessionmaker() as session:
-                db_student = session.query(Student).filter(Student.id == student_id).first()
+            async with self.sessionmaker() as session:
+                db_student = (await session.scalars(
+                    select(Student)
+                    .options(selectinload(Student.parent_associations))
+                    .where(Student.id == student_id)
+                )).first()
                 
                 if not db_student:
                     raise HTTPException(status_code=404, detail="Student not found")
@@ -131,7 +142,7 @@ class StudentService(BaseService[Student, StudentCreate]):
                 
                 # If email is being updated, validate it
                 if "email" in update_data:
-                    self.validate_email(update_data["email"], exclude_id=student_id)
+                    await self.validate_email(update_data["email"], exclude_id=student_id)
 
                 # Update student fields except parent_data
                 for key, value in update_data.items():
@@ -143,23 +154,165 @@ class StudentService(BaseService[Student, StudentCreate]):
                     new_parent_ids = set(new_parent_relationships.keys())
 
                     # Fetch existing parents
-                    existing_parents = session.query(Parent).filter(Parent.id.in_(new_parent_ids)).all()
+                    existing_parents = (await session.scalars(select(Parent).where(Parent.id.in_(new_parent_ids)))).all()
                     if len(existing_parents) != len(new_parent_ids):
                         raise HTTPException(status_code=400, detail="Some parent IDs do not exist.")
 
                     # Clear old relationships and set new ones
-                    session.query(StudentParent).filter(StudentParent.student_id == student_id).delete()
+                    await session.execute(delete(StudentParent).where(StudentParent.student_id == student_id))
                     new_associations = [
                         StudentParent(parent_id=parent.id, relationship_type=new_parent_relationships[parent.id])
                         for parent in existing_parents
                     ]
                     db_student.parent_associations.extend(new_associations)
 
-                session.commit()
-                session.refresh(db_student)
-                return db_student
+                await session.commit()
+                return await self.load(session, student_id, STUDENT_RESPONSE_GRAPH)
 
         except IntegrityError:
             raise HTTPException(status_code=400, detail="Database integrity error.")
         except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def bulk_import(self, rows: Iterator[Tuple[int, dict]], dry_run: bool = False,
+                          chunk_size: int = STUDENT_IMPORT_CHUNK_SIZE) -> dict:
+        """
+        Import students from parsed sheet rows (see utils.file_utils.iter_table_rows).
+
+        Rows are read and validated `chunk_size` at a time. Per chunk, emails and parent ids are
+        checked and addresses resolved with one query each, then students, parent links and
+        address links are inserted as multi-row INSERTs in a single transaction. If the chunk
+        hits a constraint, its rows are retried one savepoint each so only the offending rows
+        fail. Returns a report with the errors of every rejected row; `dry_run` rolls back.
+        """
+        report = {"total_rows": 0, "created": 0, "failed": 0, "dry_run": dry_run, "errors": []}
+        seen_emails = set()
+        while True:
+            chunk = await run_in_threadpool(_read_chunk, rows, chunk_size)
+            if not chunk:
+                break
+            report["total_rows"] += len(chunk)
+            valid = []
+            for row_number, student, errors in chunk:
+                if errors:
+                    _reject(report, row_number, errors)
+                else:
+                    valid.append((row_number, student))
+
+            async with self.sessionmaker() as session:
+                valid = await self._check_import_rows(session, valid, seen_emails, report)
+                if not valid:
+                    continue
+                try:
+                    await self._insert_import_rows(session, valid)
+                    created = len(valid)
+                except IntegrityError:
+                    await session.rollback()
+                    created = 0
+                    for row_number, student in valid:
+                        try:
+                            async with session.begin_nested():
+                                await self._insert_import_rows(session, [(row_number, student)])
+                            created += 1
+                        except IntegrityError as e:
+                            _reject(report, row_number, [f"Database integrity error: {e.orig}"])
+                if dry_run:
+                    await session.rollback()
+                else:
+                    await session.commit()
+                report["created"] += created
+        report["errors"].sort(key=lambda error: error["row"])
+        return report
+
+    async def _check_import_rows(self, session, rows: List[Tuple[int, StudentCreate]], seen_emails: set,
+                                 report: dict) -> List[Tuple[int, StudentCreate]]:
+        """Set-based email and parent checks for one chunk; returns the rows that pass."""
+        emails = {student.email for _, student in rows if student.email}
+        registered = set()
+        if emails:
+            registered = set((await session.scalars(select(Student.email).where(Student.email.in_(emails)))).all())
+        parent_ids = {p.id for _, student in rows for p in student.parent_data or []}
+        known_parents = set()
+        if parent_ids:
+            known_parents = set((await session.scalars(select(Parent.id).where(Parent.id.in_(parent_ids)))).all())
+
+        passed = []
+        for row_number, student in rows:
+            errors = []
+            if student.email in registered:
+                errors.append(f"email: {student.email} is already registered")
+            elif student.email and student.email in seen_emails:
+                errors.append(f"email: {student.email} appears more than once in the file")
+            missing = sorted({p.id for p in student.parent_data or []} - known_parents)
+            if missing:
+                errors.append(f"parents: unknown parent ids {', '.join(map(str, missing))}")
+            if errors:
+                _reject(report, row_number, errors)
+                continue
+            if student.email:
+                seen_emails.add(student.email)
+            passed.append((row_number, student))
+        return passed
+
+    async def _insert_import_rows(self, session, rows: List[Tuple[int, StudentCreate]]):
+        address_ids = await resolve_addresses(
+            session, [entry.address for _, student in rows for entry in student.address_data or []]
+        )
+        student_ids = (await session.scalars(
+            insert(Student).returning(Student.id, sort_by_parameter_order=True),
+            [student.model_dump(exclude={"parent_data", "address_data"}) for _, student in rows],
+        )).all()
+
+        parent_links = [
+            {"student_id": student_id, "parent_id": p.id, "relationship_type": p.relationship}
+            for student_id, (_, student) in zip(student_ids, rows) for p in student.parent_data or []
+        ]
+        address_links = [
+            {"student_id": student_id, "address_id": address_ids[address_dedup_key(entry.address)], "address_type": entry.address_type}
+            for student_id, (_, student) in zip(student_ids, rows) for entry in student.address_data or []
+        ]
+        if parent_links:
+            await session.execute(insert(StudentParent), parent_links)
+        if address_links:
+            await session.execute(insert(PersonAddress), address_links)
+
+
+def _reject(report: dict, row_number: int, errors: List[str]):
+    report["failed"] += 1
+    report["errors"].append({"row": row_number, "errors": errors})
+
+def _read_chunk(rows: Iterator[Tuple[int, dict]], size: int) -> list:
+    """Pull up to `size` rows from the sheet and validate them (runs in a worker thread)."""
+    chunk = []
+    for row_number, row in rows:
+        try:
+            chunk.append((row_number, StudentCreate.model_validate(_row_to_payload(row)), None))
+        except ValidationError as e:
+            errors = [f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()]
+            chunk.append((row_number, None, errors))
+        if len(chunk) >= size:
+            break
+    return chunk
+
+def _row_to_payload(row: dict) -> dict:
+    """Turn flat sheet columns into the StudentCreate shape (parents and address columns nested)."""
+    payload, address = {}, {}
+    for column, value in row.items():
+        name = _snake_case(column)
+        if name == "parents":
+            payload["parent_data"] = [_parse_parent(part) for part in value.split(";") if part.strip()]
+        elif name in ADDRESS_COLUMNS:
+            address[ADDRESS_COLUMNS[name]] = value
+        elif name != "address_type":
+            payload[column] = value
+    if address:
+        payload["address_data"] = [{"address_type": row.get("address_type") or row.get("addressType"), "address": address}]
+    return payload
+
+def _parse_parent(value: str) -> dict:
+    parent_id, _, relationship = value.partition(":")
+    return {"id": parent_id.strip(), "relationship": relationship.strip() or None}
+
+def _snake_case(name: str) -> str:
+    return "".join(f"_{ch.lower()}" if ch.isupper() else ch for ch in name).lstrip("_")
+
@@ -1,63 +1,54 @@
 from typing import List
 from uuid import UUID
-from models.model import Subject, SubjectTeacher
+from models.model import Subject, SubjectTeacher, Teacher
 from schemas.class_subject_schemas import SubjectCreate, SubjectTeacherCreate
-from services.base_service import BaseService
-from fastapi import HTTPException
-from sqlalchemy.exc import IntegrityError
+from services.base_service import AsyncBaseService
+from services.teacher_service import TEACHER_RESPONSE_GRAPH
+from sqlalchemy.orm import joinedload
 
-class SubjectService(BaseService[Subject, SubjectCreate]):
+# SubjectTeacherResponse: the subject and the full TeacherResponse of each teacher
+SUBJECT_TEACHER_RESPONSE_GRAPH = (
+    joinedload(SubjectTeacher.subject),
+    joinedload(SubjectTeacher.teacher).options(*TEACHER_RESPONSE_GRAPH),
+)
+
+class SubjectService(AsyncBaseService[Subject, SubjectCreate]):
     """
     Service layer for Subject entity and its teacher associations, with multi-tenancy support.
-    Inherits CRUD from BaseService.
+    Inherits CRUD from AsyncBaseService.
     """
+    filterable_fields = ("code", "department", "subject_type", "language", "is_elective", "is_active")
+    sortable_fields = ("name", "created_at", "updated_at")
+
     def __init__(self, tenant_id: str):
         super().__init__(Subject, tenant_id)
 
-    def assign_teachers(self, subject_id: UUID, teachers: List[SubjectTeacherCreate]) -> List[SubjectTeacher]:
+    async def assign_teachers(self, subject_id: UUID, teachers: List[SubjectTeacherCreate]) -> List[SubjectTeacher]:
         """
-        Assign teachers to a subject. Avoids duplicates. Returns all SubjectTeacher associations for the subject.
+        Assign teachers to a subject with one INSERT ... ON CONFLICT DO NOTHING.
+        Returns only the newly created SubjectTeacher associations.
         """
-        try:
-            with self.sessionmaker() as session:
-                subject = session.query(Subject).filter(Subject.id == subject_id).first()
-                if not subject:
-                    raise HTTPException(status_code=404, detail="Subject not found")
-                for teacher_in in teachers:
-                    exists = session.query(SubjectTeacher).filter(
-                        SubjectTeacher.subject_id == subject_id,
-                        SubjectTeacher.teacher_id == teacher_in.teacher_id
-                    ).first()
-                    if not exists:
-                        assoc = SubjectTeacher(
-                            subject_id=subject_id,
-                            teacher_id=teacher_in.teacher_id,
-                            assigned_date=teacher_in.assigned_date,
-                            is_primary=teacher_in.is_primary,
-                            is_active=teacher_in.is_active
-                        )
-                        session.add(assoc)
-                session.commit()
-                return session.query(SubjectTeacher).filter(SubjectTeacher.subject_id == subject_id).all()
-        except IntegrityError:
-            raise HTTPException(status_code=400, detail="Database integrity error.")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+        rows = {
+            teacher_in.teacher_id: {
+                "subject_id": subject_id,
+                "teacher_id": teacher_in.teacher_id,
+                "assigned_date": teacher_in.assigned_date,
+                "is_primary": teacher_in.is_primary,
+                "is_active": teacher_in.is_active,
+            }
+            for teacher_in in teachers
+        }
+        return await self.add_links(
+            subject_id, SubjectTeacher, list(rows.values()), ("subject_id", "teacher_id"),
+            Teacher, "teacher", SUBJECT_TEACHER_RESPONSE_GRAPH,
+        )
 
-    def remove_teacher(self, subject_id: UUID, teacher_id: UUID) -> bool:
+    async def remove_teacher(self, subject_id: UUID, teacher_id: UUID) -> bool:
         """
         Remove a teacher from a subject. Returns True if removed, False if not found.
         """
-        try:
-            with self.sessionmaker() as session:
-                assoc = session.query(SubjectTeacher).filter(
-                    SubjectTeacher.subject_id == subject_id,
-                    SubjectTeacher.teacher_id == teacher_id
-                ).first()
-                if not assoc:
-                    return False
-                session.delete(assoc)
-                session.commit()
-                return True
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        return bool(await self.remove_teachers(subject_id, [teacher_id]))
+
+    async def remove_teachers(self, subject_id: UUID, teacher_ids: List[UUID]) -> List[UUID]:
+        """Remove several teachers from a subject in one statement. Returns the ids that were assigned."""
+        return await self.remove_links(SubjectTeacher, SubjectTeacher.subject_id == subject_id, SubjectTeacher.teacher_id, teacher_ids)
@@ -0,0 +1,166 @@
+from collections import defaultdict
+from datetime import date
+from typing import List
+from uuid import UUID
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from models.model import Schedule, ScheduleSubstitution, SubjectTeacher
+from schemas.schedule import ScheduleCreate, SubstitutePlanRequest
+from services.availability_service import DAY_INDEX, PERIOD_BITS, availability_indexes, slot_bit
+from services.base_service import AsyncBaseService
+from services.schedule_service import ScheduleService
+from utils.constants import DayOfWeekEnum
+
+DAY_MASK = (1 << PERIOD_BITS) - 1
+
+
+class SubstituteService(AsyncBaseService[Schedule, ScheduleCreate]):
+    """
+    Fills the periods of absent teachers on one date with substitutes. Assignments are
+    ScheduleSubstitution rows for that date; the weekly Schedule entries, and so the
+    availability index and timetables, are not changed. Candidates must be free in the slot
+    (per the availability index, and not already substituting in it that date); they are
+    ranked by whether they teach the subject (SubjectTeacher), then by how many periods they
+    already have that day and week. The hardest periods (fewest candidates) are filled first,
+    and a teacher takes at most one period per slot.
+    """
+    def __init__(self, tenant_id: str):
+        super().__init__(Schedule, tenant_id)
+
+    async def plan(self, request: SubstitutePlanRequest) -> dict:
+        day = request.day_of_week or (DayOfWeekEnum(request.date.strftime("%A")) if request.date else None)
+        if day is None:
+            raise HTTPException(status_code=400, detail="Either date or day_of_week is required")
+        if request.date is None and not request.dry_run:
+            raise HTTPException(status_code=400, detail="A date is required to assign substitutes")
+        absent = set(request.absent_teacher_ids)
+        index = await availability_indexes.get(self.tenant_id, self.sessionmaker)
+
+        async with self.sessionmaker() as session:
+            affected = (await session.scalars(
+                select(Schedule).where(Schedule.teacher_id.in_(absent), Schedule.day_of_week == day, Schedule.is_active.is_(True))
+                .order_by(Schedule.period_number, Schedule.class_id)
+            )).all()
+            # Rows stored before period_number was bounded have no slot in the availability index
+            out_of_range = [schedule for schedule in affected if not 1 <= schedule.period_number <= PERIOD_BITS]
+            affected = [schedule for schedule in affected if 1 <= schedule.period_number <= PERIOD_BITS]
+            affected_ids = {schedule.id for schedule in affected}
+            # Substitutions already made for the date: they cover their periods and keep their substitutes busy
+            booked = (await session.execute(
+                select(ScheduleSubstitution.schedule_id, ScheduleSubstitution.period_number, ScheduleSubstitution.teacher_id)
+                .where(ScheduleSubstitution.date == request.date)
+            )).all() if request.date else []
+            covered = {row.schedule_id for row in booked if row.schedule_id in affected_ids}
+            if not request.overwrite:
+                affected = [
+                    schedule for schedule in affected
+                    if schedule.id not in covered
+                    # A standing substitute (Schedule.substitute_teacher_id) who is not absent covers it too
+                    and (schedule.substitute_teacher_id is None or schedule.substitute_teacher_id in absent)
+                ]
+                affected_ids = {schedule.id for schedule in affected}
+            qualified = defaultdict(set)
+            if affected:
+                for subject_id, teacher_id in await session.execute(
+                    select(SubjectTeacher.subject_id, SubjectTeacher.teacher_id).where(
+                        SubjectTeacher.subject_id.in_({schedule.subject_id for schedule in affected}),
+                        SubjectTeacher.is_active.is_(True),
+                    )
+                ):
+                    qualified[subject_id].add(teacher_id)
+
+            candidates = [teacher for teacher in index.teacher_ids if teacher not in absent]
+            shift = DAY_INDEX[day] * PERIOD_BITS
+            day_load = {teacher: (index.busy_mask("teacher", teacher) >> shift & DAY_MASK).bit_count() for teacher in candidates}
+            week_load = {teacher: index.busy_mask("teacher", teacher).bit_count() for teacher in candidates}
+            taken = defaultdict(set)  # period_number -> teachers substituting in it on the date
+            for row in booked:
+                if row.schedule_id not in affected_ids and row.teacher_id in day_load:  # re-planned ones are replaced
+                    taken[row.period_number].add(row.teacher_id)
+                    day_load[row.teacher_id] += 1
+
+            def eligible(schedule):
+                bit = slot_bit(day, schedule.period_number)
+                return [
+                    teacher for teacher in candidates
+                    if teacher not in taken[schedule.period_number] and (
+                        not index.busy_mask("teacher", teacher) & bit
+                        # Replacing a standing substitute: they are busy in the slot only because of this entry
+                        or teacher == schedule.substitute_teacher_id
+                    )
+                ]
+
+            assignments, unfilled = [], [_entry(schedule, None, False) for schedule in out_of_range]
+            for schedule in sorted(affected, key=lambda schedule: (len(eligible(schedule)), schedule.period_number)):
+                options = eligible(schedule)
+                if not options:
+                    unfilled.append(_entry(schedule, None, False))
+                    continue
+                substitute = min(options, key=lambda teacher: (
+                    teacher not in qualified[schedule.subject_id], day_load[teacher], week_load[teacher],
+                ))
+                taken[schedule.period_number].add(substitute)
+                day_load[substitute] += 1
+                week_load[substitute] += 1
+                assignments.append(_entry(schedule, substitute, substitute in qualified[schedule.subject_id]))
+
+            written = 0
+            if assignments and not request.dry_run:
+                by_id = {schedule.id: schedule for schedule in affected}
+                entries = [
+                    {**{field: getattr(by_id[a["schedule_id"]], field) for field in ScheduleCreate.model_fields},
+                     "substitute_teacher_id": a["substitute_teacher_id"]}
+                    for a in assignments
+                ]
+                # The index may lag writes of other workers: re-check the substitutes' weekly slots in the database
+                await ScheduleService(self.tenant_id).ensure_no_conflicts(entries, exclude_ids=list(by_id), session=session)
+                try:
+                    # Replaced substitutions go first, so a substitute can move between periods in one plan
+                    await session.execute(delete(ScheduleSubstitution).where(
+                        ScheduleSubstitution.schedule_id.in_(list(by_id)), ScheduleSubstitution.date == request.date,
+                    ))
+                    await session.execute(insert(ScheduleSubstitution), [
+                        {"schedule_id": a["schedule_id"], "date": request.date, "period_number": a["period_number"],
+                         "teacher_id": a["substitute_teacher_id"]}
+                        for a in assignments
+                    ])
+                    await session.commit()
+                except IntegrityError:
+                    raise HTTPException(status_code=409, detail="Substitutes changed while they were planned, please retry")
+                written = len(assignments)
+
+        assignments.sort(key=lambda a: (a["period_number"], str(a["class_id"])))
+        return {"date": request.date, "day_of_week": day, "dry_run": request.dry_run, "written": written,
+                "assignments": assignments, "unfilled": unfilled}
+
+    async def list_for_date(self, on: date) -> List[dict]:
+        async with self.sessionmaker() as session:
+            rows = (await session.execute(
+                select(ScheduleSubstitution, Schedule.class_id, Schedule.subject_id, Schedule.teacher_id)
+                .join(Schedule, Schedule.id == ScheduleSubstitution.schedule_id)
+                .where(ScheduleSubstitution.date == on)
+                .order_by(ScheduleSubstitution.period_number, Schedule.class_id)
+            )).all()
+        return [
+            {"id": substitution.id, "schedule_id": substitution.schedule_id, "date": substitution.date,
+             "period_number": substitution.period_number, "class_id": class_id, "subject_id": subject_id,
+             "absent_teacher_id": teacher_id, "substitute_teacher_id": substitution.teacher_id}
+            for substitution, class_id, subject_id, teacher_id in rows
+        ]
+
+    async def remove(self, substitution_id: UUID) -> bool:
+        async with self.sessionmaker() as session:
+            removed = await session.scalar(
+                delete(ScheduleSubstitution).where(ScheduleSubstitution.id == substitution_id).returning(ScheduleSubstitution.id)
+            )
+            await session.commit()
+        return removed is not None
+
+
+def _entry(schedule, substitute_id, subject_match: bool) -> dict:
+    return {
+        "schedule_id": schedule.id, "class_id": schedule.class_id, "period_number": schedule.period_number,
+        "subject_id": schedule.subject_id, "absent_teacher_id": schedule.teacher_id,
+        "substitute_teacher_id": substitute_id, "subject_match": subject_match,
+    }
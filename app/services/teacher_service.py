@@ -3,75 +3,46 @@ from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import and_
 from fastapi import HTTPException
 from sqlalchemy.exc import IntegrityError
-from services.base_service import BaseService
-from models.model import Teacher, PersonAddress, Address
+from services.base_service import AsyncBaseService
+from services.address_service import resolve_addresses
+from models.model import Teacher, PersonAddress
 from schemas.teacher_schemas import TeacherCreate, TeacherUpdate
 from pydantic import EmailStr
+from utils.address_utils import address_dedup_key
+
+# TeacherResponse: the teacher's addresses with their Address rows
+TEACHER_RESPONSE_GRAPH = (
+    selectinload(Teacher.addresses).joinedload(PersonAddress.address),
+)
+
+class TeacherService(AsyncBaseService[Teacher, TeacherCreate]):
+    detail_options = TEACHER_RESPONSE_GRAPH
+    list_options = TEACHER_RESPONSE_GRAPH
+    filterable_fields = ("department", "designation", "employee_id", "gender", "is_active", "is_deleted")
+    sortable_fields = ("first_name", "employee_id", "joining_date")
 
-class TeacherService(BaseService[Teacher, TeacherCreate]):
     def __init__(self, tenant_id: str):
         super().__init__(Teacher, tenant_id)
 
-    def create(self, obj_in: TeacherCreate):
+    async def create(self, obj_in: TeacherCreate):
         try:
             # Validate email before proceeding
-            self.validate_email(obj_in.email)
+            await self.validate_email(obj_in.email)
             
-            with self.sessionmaker() as session:
-                # Extract addresses from input
-                address_data = obj_in.addresses
-                
-                new_addresses = []
-                teacher_address_associations = []
-
-                if address_data:
-                    for addr_data in address_data:
-                        address_type = addr_data.address_type
-                        addr = addr_data.address
-
-                        # Check if the same address exists
-                        existing_address = (
-                            session.query(Address)
-                            .filter(
-                                Address.house_no == addr.house_no,
-                                Address.street_address == addr.street_address,
-                                Address.landmark == addr.landmark,
-                                Address.city == addr.city,
-                                Address.state == addr.state,
-                                Address.zip_code == addr.zip_code,
-                                Address.country == addr.country,
-                            )
-                            .first()
-                        )
-
-                        if existing_address:
-                            address = existing_address
-                        else:
-                            address = Address(**addr.model_dump())
-                            session.add(address)
-                            new_addresses.append(address)
-
-                        session.flush()  # Make sure address has an ID
+            async with self.sessionmaker() as session:
+                address_data = obj_in.addresses or []
+                # One round trip for all addresses, deduplicated by their hashed key
+                address_ids = await resolve_addresses(session, [addr_data.address for addr_data in address_data])
 
-                        # Create PersonAddress entry
-                        teacher_address = PersonAddress(
-                            address_id=address.id,
-                            address_type=address_type,
-                        )
-                        teacher_address_associations.append(teacher_address)
-
-                # Create teacher without addresses
                 teacher = Teacher(**obj_in.model_dump(exclude={"addresses"}))
+                teacher.addresses = [
+                    PersonAddress(address_id=address_ids[address_dedup_key(addr_data.address)], address_type=addr_data.address_type)
+                    for addr_data in address_data
+                ]
                 session.add(teacher)
-                session.flush()
-
-                # Link addresses
-                for ta in teacher_address_associations:
-                    ta.teacher_id = teacher.id
-                    session.add(ta)
 
-                session.commit()    
-                session.refresh(teacher)
+                await session.commit()    
+                await session.refresh(teacher)
                 return teacher
 
         # except IntegrityError:
@@ -79,10 +50,10 @@ class TeacherService(BaseService[Teacher, TeacherCreate]):
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
-    def update(self, teacher_id: str, obj_in: TeacherUpdate):
+    async def update(self, teacher_id: str, obj_in: TeacherUpdate):
         try:
-            with self.sessionmaker() as session:
-                teacher = session.query(Teacher).filter(Teacher.id == teacher_id).first()
+            async with self.sessionmaker() as session:
+                teacher = await self.load(session, teacher_id, TEACHER_RESPONSE_GRAPH)
                 if not teacher:
                     raise HTTPException(status_code=404, detail="Teacher not found")
 
@@ -91,37 +62,27 @@ class TeacherService(BaseService[Teacher, TeacherCreate]):
                 
                 # If email is being updated, validate it
                 if "email" in update_data:
-                    self.validate_email(update_data["email"], exclude_id=teacher_id)
+                    await self.validate_email(update_data["email"], exclude_id=teacher_id)
 
                 # Update teacher fields except addresses
                 for key, value in update_data.items():
                     setattr(teacher, key, value)
 
-                # Handle address updates if present
+                # Handle address updates if present. Addresses are shared between people, so a
+                # changed address re-points this teacher's link instead of editing the shared row.
                 if obj_in.addresses:
-                    # existing_addresses keyed by address_type for quick lookup
-                    existing_addresses = {pa.address_type: pa.address for pa in teacher.addresses}
+                    existing_links = {pa.address_type: pa for pa in teacher.addresses}
+                    address_ids = await resolve_addresses(session, [addr_data.address for addr_data in obj_in.addresses])
 
                     for addr_data in obj_in.addresses:
-                        address_type = addr_data.address_type
-                        new_address_data = addr_data.address
-
-                        if address_type in existing_addresses:
-                            existing_address = existing_addresses[address_type]
-                            for field, new_value in new_address_data.model_dump().items():
-                                setattr(existing_address, field, new_value)
+                        address_id = address_ids[address_dedup_key(addr_data.address)]
+                        if addr_data.address_type in existing_links:
+                            existing_links[addr_data.address_type].address_id = address_id
                         else:
-                            # Create new address and association
-                            new_address = Address(**new_address_data.model_dump())
-                            session.add(new_address)
-                            session.flush()  # Get new_address.id
+                            session.add(PersonAddress(teacher_id=teacher.id, address_id=address_id, address_type=addr_data.address_type))
 
-                            new_ta = PersonAddress(teacher_id=teacher.id, address_id=new_address.id, address_type=address_type)
-                            session.add(new_ta)
-
-                session.commit()
-                session.refresh(teacher)
-                return teacher
+                await session.commit()
+                return await self.load(session, teacher_id, TEACHER_RESPONSE_GRAPH)
 
         except IntegrityError:
             raise HTTPException(status_code=400, detail="Database integrity error.")
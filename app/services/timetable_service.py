@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from typing import Dict, List, Optional
+from uuid import UUID
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from core.config import TIMETABLE_DAYS, TIMETABLE_MAX_SECONDS, TIMETABLE_WORKERS
+from models.model import Class, ClassSubject, Schedule, SubjectTeacher, Teacher, TimetableGenerationJob
+from schemas.schedule import ScheduleCreate, TimetableGenerateRequest
+from services.base_service import AsyncBaseService
+from services.availability_service import TEACHER_ROLES, availability_indexes
+from services.schedule_service import ScheduleService
+from services.timetable_solver import Lesson, Requirement, TimetableProblem, assign_teachers, init_worker, solve_job
+from utils.constants import DayOfWeekEnum
+
+logger = logging.getLogger(__name__)
+
+JOB_HEARTBEAT_SECONDS = 1  # how often a running job's row is refreshed with its progress
+JOB_STALE_SECONDS = 30  # a running job not refreshed for this long lost its worker (restart, crash)
+JOB_RETENTION = timedelta(days=1)
+
+_running_tasks = set()
+# Solver processes, shared by every tenant. They put (job_id, Progress) on _progress_queue; a
+# thread keeps the latest per job in _progress for the job's task to write to its row.
+_pool: Optional[ProcessPoolExecutor] = None
+_progress_queue = None
+_progress: Dict[str, dict] = {}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _progress_queue
+    if _pool is None:
+        context = multiprocessing.get_context("spawn")  # workers import only the solver module
+        _progress_queue = context.Queue()
+        threading.Thread(target=_collect_progress, args=(_progress_queue,), daemon=True).start()
+        _pool = ProcessPoolExecutor(TIMETABLE_WORKERS, mp_context=context, initializer=init_worker, initargs=(_progress_queue,))
+    return _pool
+
+
+def _collect_progress(queue):
+    while (item := queue.get()) is not None:
+        job_id, progress = item
+        _progress[job_id] = {"placed": progress.placed, "total": progress.total,
+                             "iterations": progress.iterations, "elapsed_seconds": round(progress.elapsed, 3)}
+
+
+def shutdown_pool():
+    global _pool, _progress_queue
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _progress_queue.put(None)
+        _pool, _progress_queue = None, None
+
+
+class TimetableService(AsyncBaseService[Schedule, ScheduleCreate]):
+    """
+    Generates a clash-free weekly timetable for a set of classes from their ClassSubject
+    quotas, the SubjectTeacher pool and Class.total_periods / room_number. Schedules of
+    other classes stay as they are and block their teachers and rooms. The solver runs as a
+    background job in a process pool, tracked in a timetable_jobs row so any worker can report
+    it; a complete result replaces the classes' schedules in one transaction.
+    """
+    def __init__(self, tenant_id: str):
+        super().__init__(Schedule, tenant_id)
+
+    async def start(self, request: TimetableGenerateRequest) -> dict:
+        """Validate the input, then solve in the background. Returns the job to poll."""
+        days = [DayOfWeekEnum(day) for day in (request.days or TIMETABLE_DAYS)]
+        problem = await self.build_problem(request, days)
+        async with self.sessionmaker() as session:
+            await session.execute(delete(TimetableGenerationJob).where(TimetableGenerationJob.created_at < func.now() - JOB_RETENTION))
+            job = TimetableGenerationJob(
+                id=uuid.uuid4(), status="running", seed=request.seed, dry_run=request.dry_run,
+                progress={"total": sum(lesson.periods for lesson in problem.lessons)}, result=None, error=None,
+            )
+            session.add(job)
+            await session.commit()
+        task = asyncio.create_task(self._run(job.id, problem, days, request))
+        _running_tasks.add(task)
+        task.add_done_callback(_running_tasks.discard)
+        return _job_state(job)
+
+    async def get_job(self, job_id: UUID) -> dict:
+        """The job's state, from whichever worker runs it. A job whose worker went away is failed."""
+        async with self.sessionmaker() as session:
+            row = (await session.execute(
+                select(TimetableGenerationJob, func.localtimestamp()).where(TimetableGenerationJob.id == job_id)
+            )).first()
+            if row is None:
+                raise HTTPException(status_code=404, detail="Timetable job not found")
+            job, now = row
+            if job.status == "running" and now - job.updated_at > timedelta(seconds=JOB_STALE_SECONDS):
+                job = await session.scalar(
+                    update(TimetableGenerationJob)
+                    .where(TimetableGenerationJob.id == job_id, TimetableGenerationJob.updated_at == job.updated_at)
+                    .values(status="failed", error="The worker running this job stopped before it finished")
+                    .returning(TimetableGenerationJob)
+                    .execution_options(populate_existing=True)
+                ) or await session.get(TimetableGenerationJob, job_id, populate_existing=True)
+                await session.commit()
+        return _job_state(job)
+
+    async def build_problem(self, request: TimetableGenerateRequest, days: List[DayOfWeekEnum]) -> TimetableProblem:
+        """Read classes, quotas, teachers and the bookings of other classes (four statements)."""
+        async with self.sessionmaker() as session:
+            query = select(Class.id, Class.total_periods, Class.room_number).where(Class.is_active.is_(True))
+            if request.class_ids:
+                query = query.where(Class.id.in_(request.class_ids))
+            classes = (await session.execute(query.order_by(Class.id))).all()
+            missing = set(request.class_ids or ()) - {klass.id for klass in classes}
+            if missing:
+                raise HTTPException(status_code=400, detail=f"Some class IDs do not exist or are inactive: {sorted(map(str, missing))}")
+            if not classes:
+                raise HTTPException(status_code=400, detail="No active classes to schedule")
+            class_ids = [klass.id for klass in classes]
+
+            links = (await session.execute(
+                select(ClassSubject.class_id, ClassSubject.subject_id, ClassSubject.periods_per_week)
+                .where(ClassSubject.class_id.in_(class_ids), ClassSubject.is_active.is_(True))
+                .order_by(ClassSubject.id)
+            )).all()
+            pool = (await session.execute(
+                select(SubjectTeacher.subject_id, SubjectTeacher.teacher_id, SubjectTeacher.is_primary)
+                .join(Teacher, Teacher.id == SubjectTeacher.teacher_id)
+                .where(
+                    SubjectTeacher.subject_id.in_({link.subject_id for link in links}),
+                    SubjectTeacher.is_active.is_(True), Teacher.is_active.is_(True), Teacher.is_deleted.is_not(True),
+                )
+                .order_by(SubjectTeacher.id)
+            )).all()
+            booked = (await session.execute(
+                select(Schedule.day_of_week, Schedule.period_number, Schedule.room, *[getattr(Schedule, role) for role in TEACHER_ROLES])
+                .where(Schedule.is_active.is_(True), Schedule.class_id.not_in(class_ids), Schedule.day_of_week.in_(days))
+            )).all()
+
+        class_periods = {klass.id: klass.total_periods for klass in classes}
+        rooms = {klass.id: klass.room_number for klass in classes}
+        periods_per_day = max(class_periods.values())
+        day_index = {day: index for index, day in enumerate(days)}
+        busy = defaultdict(set)
+        for row in booked:
+            if not 1 <= row.period_number <= periods_per_day:
+                continue
+            slot = (day_index[row.day_of_week], row.period_number - 1)
+            if row.room:
+                busy[("room", row.room)].add(slot)
+            for role in TEACHER_ROLES:
+                if getattr(row, role):
+                    busy[("teacher", getattr(row, role))].add(slot)
+
+        candidates, primaries = defaultdict(list), defaultdict(list)
+        for row in pool:
+            candidates[row.subject_id].append(row.teacher_id)
+            if row.is_primary:
+                primaries[row.subject_id].append(row.teacher_id)
+        by_class = defaultdict(list)
+        for link in links:
+            by_class[link.class_id].append(link)
+        requirements = [
+            Requirement(class_id, subject_id, periods, candidates[subject_id], primaries[subject_id])
+            for class_id, class_links in by_class.items()
+            for subject_id, periods in _quotas(class_links, request.periods_per_week, len(days) * class_periods[class_id]).items()
+            if periods > 0
+        ]
+        if not requirements:
+            raise HTTPException(status_code=400, detail="The selected classes have no subjects to schedule")
+
+        capacity = defaultdict(lambda: len(days) * periods_per_day)
+        for (kind, teacher_id), slots in busy.items():
+            if kind == "teacher":
+                capacity[teacher_id] -= len(slots)
+        staffed, unstaffed = assign_teachers(requirements, capacity, seed=request.seed)
+        if unstaffed:
+            raise HTTPException(status_code=400, detail={
+                "message": "Some class subjects have no active teacher assigned to the subject",
+                "unstaffed": [{"class_id": str(req.class_id), "subject_id": str(req.subject_id)} for req in unstaffed],
+            })
+
+        lessons = [Lesson(req.class_id, req.subject_id, teacher_id, rooms[req.class_id], req.periods) for req, teacher_id in staffed]
+        # Solver input order decides the result for a seed, so keep it independent of assignment order
+        lessons.sort(key=lambda lesson: (str(lesson.class_id), str(lesson.subject_id)))
+        problem = TimetableProblem(days, class_periods, lessons, busy)
+        overloaded = problem.overloaded()
+        if overloaded:
+            raise HTTPException(status_code=400, detail={
+                "message": "More periods are required than there are free slots",
+                "overloaded": [{**item, "resource": str(item["resource"])} for item in overloaded],
+            })
+        unplaceable = problem.unplaceable()
+        if unplaceable:
+            raise HTTPException(status_code=400, detail={
+                "message": "Some lessons have fewer slots where their class, teacher and room are all free than periods",
+                "unplaceable": [
+                    {**item, **{key: str(item[key]) for key in ("class_id", "subject_id", "teacher_id")}}
+                    for item in unplaceable
+                ],
+            })
+        return problem
+
+    async def save(self, class_ids: List[UUID], entries: List[dict]) -> int:
+        """Replace the schedules of `class_ids` with `entries` in one transaction."""
+        async with self.sessionmaker() as session:
+            try:
+                async with session.begin():
+                    await session.execute(delete(Schedule).where(Schedule.class_id.in_(class_ids)))
+                    # Other classes may have been edited while the solver ran
+                    await ScheduleService(self.tenant_id).ensure_no_conflicts(entries, session=session)
+                    await session.execute(insert(Schedule), entries)
+            except IntegrityError:
+                raise HTTPException(status_code=409, detail="Schedules changed while the timetable was generated, please retry")
+        availability_indexes.invalidate(self.tenant_id)
+        return len(entries)
+
+    async def _run(self, job_id: UUID, problem: TimetableProblem, days: List[DayOfWeekEnum], request: TimetableGenerateRequest):
+        try:
+            time_limit = min(request.time_limit_seconds, TIMETABLE_MAX_SECONDS)
+            # The solver is CPU-bound Python: in a process it holds neither this event loop nor its GIL
+            solving = asyncio.get_running_loop().run_in_executor(
+                _get_pool(), solve_job, str(job_id), problem, request.seed, time_limit,
+            )
+            while True:
+                done, _ = await asyncio.wait({solving}, timeout=JOB_HEARTBEAT_SECONDS)
+                if done:
+                    break
+                progress = _progress.pop(str(job_id), None)
+                await self._update_job(job_id, **({"progress": progress} if progress else {}))
+            result = solving.result()
+            entries = [
+                {
+                    "class_id": problem.lessons[index].class_id, "subject_id": problem.lessons[index].subject_id,
+                    "teacher_id": problem.lessons[index].teacher_id, "room": problem.lessons[index].room,
+                    "day_of_week": days[day], "period_number": period + 1,
+                }
+                for index, day, period in sorted(result.placements, key=lambda placement: (placement[1], placement[2], placement[0]))
+            ]
+            written = 0
+            if result.complete and not request.dry_run:
+                written = await self.save(list(problem.class_periods), entries)
+            status = "completed" if result.complete else "incomplete"
+            await self._update_job(
+                job_id, status=status, progress=_progress.pop(str(job_id), None) or {},
+                result=jsonable_encoder({
+                    "complete": result.complete, "soft_cost": result.soft_cost, "written": written,
+                    "unplaced": [
+                        {"class_id": problem.lessons[index].class_id, "subject_id": problem.lessons[index].subject_id,
+                         "teacher_id": problem.lessons[index].teacher_id, "periods": periods}
+                        for index, periods in result.unplaced.items()
+                    ],
+                    "entries": entries if request.dry_run else None,
+                }),
+            )
+            logger.info("Timetable job %s: %s, %d iterations in %.1fs", job_id, status, result.iterations, result.elapsed)
+        except HTTPException as e:
+            await self._update_job(job_id, status="failed", error=jsonable_encoder(e.detail))
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                shutdown_pool()  # a solver process died: start a fresh pool for the next job
+            logger.exception("Timetable job %s failed", job_id)
+            await self._update_job(job_id, status="failed", error="Timetable generation failed")
+        finally:
+            _progress.pop(str(job_id), None)
+
+    async def _update_job(self, job_id: UUID, **values):
+        async with self.sessionmaker() as session:
+            await session.execute(
+                update(TimetableGenerationJob).where(TimetableGenerationJob.id == job_id).values(**values, updated_at=func.now())
+            )
+            await session.commit()
+
+
+def _job_state(job: TimetableGenerationJob) -> dict:
+    return {
+        "job_id": job.id, "status": job.status, "seed": job.seed, "dry_run": job.dry_run,
+        "progress": job.progress, "result": job.result, "error": job.error,
+    }
+
+
+def _quotas(links, overrides: Dict[UUID, int], slots: int) -> Dict[UUID, int]:
+    """
+    Weekly periods per subject of one class: the request override, else ClassSubject.periods_per_week;
+    subjects with neither share the class's remaining slots evenly.
+    """
+    quotas, open_subjects = {}, []
+    for link in links:
+        quota = overrides.get(link.subject_id, link.periods_per_week)
+        if quota is None:
+            open_subjects.append(link.subject_id)
+        else:
+            quotas[link.subject_id] = quota
+    if open_subjects:
+        base, extra = divmod(max(0, slots - sum(quotas.values())), len(open_subjects))
+        for position, subject_id in enumerate(open_subjects):
+            quotas[subject_id] = base + (position < extra)
+    return quotas
@@ -0,0 +1,410 @@
+"""
+Timetable solver: places weekly lessons into (day, period) slots so that no class, teacher
+or room is booked twice in a slot.
+
+Database-free and deterministic for a given seed (as long as the time limit is not what
+stops the search). services/timetable_service.py builds the problem from ClassSubject,
+SubjectTeacher and Class rows and writes the result back.
+
+The engine works in two phases:
+  1. Construction: lessons are placed most-constrained first (busiest teacher, fewest free
+     slots), each period into the free slot that best spreads the subject over the week.
+  2. Repair: while periods are left over, one is forced into the slot that evicts the fewest
+     other periods (min-conflicts with ejection chains). A tabu list stops evicted periods
+     from bouncing straight back, and a little random noise escapes plateaus.
+A last pass moves periods to free slots where they spread the subject more evenly.
+"""
+import random
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+# Search tuning
+TABU_TENURE = 12  # iterations an evicted period may not return to the slot it was evicted from
+NOISE = 0.02  # chance of a random (rather than the best) slot during repair
+PROGRESS_EVERY = 0.5  # seconds between progress callbacks
+
+
+class Requirement(NamedTuple):
+    """A class needs `periods` periods a week of a subject; any of `teacher_ids` can teach it."""
+    class_id: Hashable
+    subject_id: Hashable
+    periods: int
+    teacher_ids: Sequence[Hashable]
+    primary_teacher_ids: Sequence[Hashable] = ()
+
+
+class Lesson(NamedTuple):
+    """`periods` weekly periods of one subject for one class, taught by one teacher in one room."""
+    class_id: Hashable
+    subject_id: Hashable
+    teacher_id: Hashable
+    room: Optional[str]
+    periods: int
+
+
+class Progress(NamedTuple):
+    placed: int
+    total: int
+    iterations: int
+    elapsed: float
+
+
+class TimetableProblem:
+    """
+    `days` are the labels of the school days, `class_periods` maps class id to its periods per
+    day (Class.total_periods). `busy` maps a resource (("teacher", id) or ("room", name)) to
+    the (day_index, period_index) slots already taken by schedules outside the problem.
+    """
+    def __init__(self, days: Sequence[str], class_periods: Dict[Hashable, int], lessons: List[Lesson],
+                 busy: Optional[Dict[Tuple[str, Hashable], Set[Tuple[int, int]]]] = None):
+        self.days = list(days)
+        self.class_periods = dict(class_periods)
+        self.lessons = [lesson for lesson in lessons if lesson.periods > 0]
+        self.busy = busy or {}
+        self.periods_per_day = max(self.class_periods.values(), default=0)
+
+    @property
+    def slot_count(self) -> int:
+        return len(self.days) * self.periods_per_day
+
+    def slot(self, index: int) -> Tuple[int, int]:
+        """(day_index, period_index) of a slot index."""
+        return divmod(index, self.periods_per_day)
+
+    def resources(self, lesson: Lesson) -> List[Tuple[str, Hashable]]:
+        found = [("class", lesson.class_id), ("teacher", lesson.teacher_id)]
+        if lesson.room:
+            found.append(("room", lesson.room))
+        return found
+
+    def allowed_slots(self, lesson: Lesson) -> List[int]:
+        """Slots within the class's day length that none of the lesson's resources has booked already."""
+        taken = set()
+        for resource in self.resources(lesson):
+            taken |= self.busy.get(resource, set())
+        limit = self.class_periods[lesson.class_id]
+        return [
+            day * self.periods_per_day + period
+            for day in range(len(self.days)) for period in range(limit)
+            if (day, period) not in taken
+        ]
+
+    def overloaded(self) -> List[dict]:
+        """Resources asked for more periods than they have free slots: no timetable can exist."""
+        demand, periods = defaultdict(int), defaultdict(int)
+        for lesson in self.lessons:
+            for resource in self.resources(lesson):
+                demand[resource] += lesson.periods
+                periods[resource] = max(periods[resource], self.class_periods[lesson.class_id])
+        found = []
+        for resource, needed in demand.items():
+            taken = sum(1 for _, period in self.busy.get(resource, ()) if period < periods[resource])
+            free = len(self.days) * periods[resource] - taken
+            if needed > free:
+                found.append({"kind": resource[0], "resource": resource[1], "periods": needed, "free_slots": free})
+        return found
+
+    def unplaceable(self) -> List[dict]:
+        """
+        Lessons with fewer slots free for all of their resources at once than periods: overloaded()
+        checks each resource on its own, so it passes when their free slots do not line up.
+        """
+        found = []
+        for lesson in self.lessons:
+            free = len(self.allowed_slots(lesson))
+            if free < lesson.periods:
+                found.append({"class_id": lesson.class_id, "subject_id": lesson.subject_id,
+                              "teacher_id": lesson.teacher_id, "periods": lesson.periods, "free_slots": free})
+        return found
+
+
+class TimetableResult(NamedTuple):
+    placements: List[Tuple[int, int, int]]  # (lesson index, day index, period index)
+    unplaced: Dict[int, int]  # lesson index -> periods that could not be placed
+    soft_cost: int  # how unevenly subjects are spread over the week (0 = ideal)
+    iterations: int
+    elapsed: float
+
+    @property
+    def complete(self) -> bool:
+        return not self.unplaced
+
+
+def assign_teachers(requirements: Sequence[Requirement], capacity: Dict[Hashable, int],
+                    seed: int = 0) -> Tuple[List[Tuple[Requirement, Hashable]], List[Requirement]]:
+    """
+    Pick one teacher per requirement, balancing load: primary teachers first while they have
+    capacity, otherwise the least loaded candidate. Requirements with few candidates are
+    staffed first. Returns (staffed, unstaffed) requirements.
+    """
+    rng = random.Random(seed)
+    order = list(requirements)
+    rng.shuffle(order)
+    order.sort(key=lambda req: (len(req.teacher_ids), -req.periods))
+    load = defaultdict(int)
+    staffed, unstaffed = [], []
+    for req in order:
+        if not req.teacher_ids:
+            unstaffed.append(req)
+            continue
+        primary = set(req.primary_teacher_ids)
+        teacher = min(req.teacher_ids, key=lambda t: (
+            load[t] + req.periods > capacity.get(t, 0), t not in primary, load[t], rng.random(),
+        ))
+        load[teacher] += req.periods
+        staffed.append((req, teacher))
+    return staffed, unstaffed
+
+
+# Process-pool entry points: services/timetable_service.py runs solve() in worker processes,
+# which report progress as (job_id, Progress) on the queue they were started with.
+_progress_queue = None
+
+
+def init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def solve_job(job_id: str, problem: TimetableProblem, seed: int, time_limit: float) -> TimetableResult:
+    def report(progress: Progress):
+        _progress_queue.put((job_id, progress))
+
+    return solve(problem, seed, time_limit, report if _progress_queue is not None else None)
+
+
+def solve(problem: TimetableProblem, seed: int = 0, time_limit: float = 55.0,
+          progress: Optional[Callable[[Progress], None]] = None) -> TimetableResult:
+    """Place every period of every lesson, or as many as possible within `time_limit` seconds."""
+    return _Search(problem, seed, time_limit, progress).run()
+
+
+class _Search:
+    def __init__(self, problem: TimetableProblem, seed: int, time_limit: float, progress):
+        self.problem = problem
+        self.rng = random.Random(seed)
+        self.started = time.monotonic()
+        self.deadline = self.started + time_limit
+        self.progress = progress
+        self.last_report = self.started
+        self.iterations = 0
+
+        lessons = problem.lessons
+        days = len(problem.days)
+        self.per_day = problem.periods_per_day
+        # Resources and units (single periods) as integers, occupancy as one row per resource
+        resource_ids = {}
+        self.lesson_resources = [
+            [resource_ids.setdefault(resource, len(resource_ids)) for resource in problem.resources(lesson)]
+            for lesson in lessons
+        ]
+        self.occupied = [[-1] * problem.slot_count for _ in resource_ids]
+        self.allowed = [problem.allowed_slots(lesson) for lesson in lessons]
+        self.allowed_set = [set(slots) for slots in self.allowed]
+        self.unit_lesson = [index for index, lesson in enumerate(lessons) for _ in range(lesson.periods)]
+        self.unit_slot = [-1] * len(self.unit_lesson)
+        self.day_count = [[0] * days for _ in lessons]
+        # Ideal most periods of one subject per day, e.g. 6 periods over 5 days -> 2
+        self.day_cap = [-(-lesson.periods // days) if days else 0 for lesson in lessons]
+        self.tabu = {}
+
+    # --- bookkeeping ---
+
+    def place(self, unit: int, slot: int):
+        lesson = self.unit_lesson[unit]
+        for resource in self.lesson_resources[lesson]:
+            self.occupied[resource][slot] = unit
+        self.unit_slot[unit] = slot
+        self.day_count[lesson][slot // self.per_day] += 1
+
+    def remove(self, unit: int):
+        lesson, slot = self.unit_lesson[unit], self.unit_slot[unit]
+        for resource in self.lesson_resources[lesson]:
+            self.occupied[resource][slot] = -1
+        self.unit_slot[unit] = -1
+        self.day_count[lesson][slot // self.per_day] -= 1
+
+    def occupants(self, lesson: int, slot: int) -> Set[int]:
+        return {self.occupied[resource][slot] for resource in self.lesson_resources[lesson]} - {-1}
+
+    def spread_cost(self, lesson: int, slot: int) -> int:
+        """1 if another period of the subject on that slot's day would exceed its ideal, else 0."""
+        return int(self.day_count[lesson][slot // self.per_day] >= self.day_cap[lesson])
+
+    def day_load(self, lesson: int, slot: int) -> int:
+        return self.day_count[lesson][slot // self.per_day]
+
+    def total_spread_cost(self) -> int:
+        return sum(
+            max(0, count - self.day_cap[lesson])
+            for lesson, counts in enumerate(self.day_count) for count in counts
+        )
+
+    def report(self, unplaced: int, force: bool = False):
+        now = time.monotonic()
+        if self.progress and (force or now - self.last_report >= PROGRESS_EVERY):
+            self.last_report = now
+            total = len(self.unit_lesson)
+            self.progress(Progress(total - unplaced, total, self.iterations, now - self.started))
+
+    # --- phases ---
+
+    def run(self) -> TimetableResult:
+        unplaced = self.construct()
+        unplaced = self.repair(unplaced)
+        if not unplaced:
+            self.improve()
+        self.report(len(unplaced), force=True)
+
+        placements = [
+            (self.unit_lesson[unit], *self.problem.slot(slot))
+            for unit, slot in enumerate(self.unit_slot) if slot >= 0
+        ]
+        missing = defaultdict(int)
+        for unit in unplaced:
+            missing[self.unit_lesson[unit]] += 1
+        return TimetableResult(placements, dict(missing), self.total_spread_cost(), self.iterations,
+                               time.monotonic() - self.started)
+
+    def construct(self) -> List[int]:
+        """Greedy placement, hardest lessons first. Returns the units left unplaced."""
+        teacher_load = defaultdict(int)
+        for index, lesson in enumerate(self.problem.lessons):
+            teacher_load[lesson.teacher_id] += lesson.periods
+        order = list(range(len(self.problem.lessons)))
+        self.rng.shuffle(order)
+        order.sort(key=lambda index: (
+            len(self.allowed[index]) - teacher_load[self.problem.lessons[index].teacher_id],
+            len(self.allowed[index]),
+        ))
+        first_unit, unit = {}, 0
+        for index, lesson in enumerate(self.problem.lessons):
+            first_unit[index] = unit
+            unit += lesson.periods
+
+        unplaced = []
+        for lesson in order:
+            for unit in range(first_unit[lesson], first_unit[lesson] + self.problem.lessons[lesson].periods):
+                best, best_key = -1, None
+                for slot in self.allowed[lesson]:
+                    if self.occupants(lesson, slot):
+                        continue
+                    key = (self.spread_cost(lesson, slot), self.day_load(lesson, slot), self.rng.random())
+                    if best_key is None or key < best_key:
+                        best, best_key = slot, key
+                if best < 0:
+                    unplaced.append(unit)
+                else:
+                    self.place(unit, best)
+            self.report(len(unplaced))
+        return unplaced
+
+    def repair(self, unplaced: List[int]) -> List[int]:
+        """Min-conflicts with ejection chains until every unit is placed or time runs out."""
+        # Periods beyond a lesson's allowed slots can never be placed (unplaceable() reports them
+        # before solving): set them aside, so they neither end the search nor evict their siblings
+        surplus = {
+            lesson: self.problem.lessons[lesson].periods - len(slots)
+            for lesson, slots in enumerate(self.allowed) if len(slots) < self.problem.lessons[lesson].periods
+        }
+        impossible = []
+        for unit in list(unplaced):
+            lesson = self.unit_lesson[unit]
+            if surplus.get(lesson, 0) > 0:
+                surplus[lesson] -= 1
+                unplaced.remove(unit)
+                impossible.append(unit)
+
+        best_unplaced, best_slots = len(unplaced), None
+        while unplaced and time.monotonic() < self.deadline:
+            self.iterations += 1
+            unit = unplaced.pop(self.rng.randrange(len(unplaced)))
+            lesson = self.unit_lesson[unit]
+            slots = self.allowed[lesson]
+
+            if self.rng.random() < NOISE:
+                target = self.rng.choice(slots)
+            else:
+                target, best_key = -1, None
+                for slot in slots:
+                    if self.tabu.get((lesson, slot), 0) > self.iterations:
+                        continue
+                    key = (len(self.occupants(lesson, slot)), self.spread_cost(lesson, slot), self.day_load(lesson, slot), self.rng.random())
+                    if best_key is None or key < best_key:
+                        target, best_key = slot, key
+                if target < 0:
+                    target = self.rng.choice(slots)
+
+            for victim in self.occupants(lesson, target):
+                self.remove(victim)
+                self.tabu[(self.unit_lesson[victim], target)] = self.iterations + TABU_TENURE
+                unplaced.append(victim)
+            self.place(unit, target)
+
+            if len(unplaced) < best_unplaced:
+                # Fewer units left over than ever: remember the assignment in case time runs out
+                best_unplaced, best_slots = len(unplaced), list(self.unit_slot)
+            self.report(len(unplaced))
+
+        if unplaced and best_slots is not None and len(unplaced) > best_unplaced:
+            return self._restore(best_slots)  # every unit without a slot, the impossible ones included
+        return unplaced + impossible
+
+    def improve(self):
+        """
+        Move periods to free slots, or swap them with another period of the same class, where
+        that spreads subjects more evenly over the week; repeat until nothing improves.
+        """
+        class_resource = [resources[0] for resources in self.lesson_resources]
+        improved = True
+        while improved:
+            improved = False
+            for unit in range(len(self.unit_slot)):
+                if time.monotonic() >= self.deadline:
+                    return
+                lesson, slot = self.unit_lesson[unit], self.unit_slot[unit]
+                self.remove(unit)
+                if self.spread_cost(lesson, slot) == 0:
+                    self.place(unit, slot)
+                    continue
+                improved = self._move_or_swap(unit, lesson, slot, class_resource[lesson]) or improved
+
+    def _move_or_swap(self, unit: int, lesson: int, slot: int, class_row: int) -> bool:
+        # `unit` is removed on entry and placed again on return
+        current = self.spread_cost(lesson, slot)
+        for candidate in self.allowed[lesson]:
+            other = self.occupied[class_row][candidate]
+            if candidate == slot or (self.occupants(lesson, candidate) - {other}):
+                continue
+            if other < 0:
+                if self.spread_cost(lesson, candidate) < current:
+                    self.place(unit, candidate)
+                    return True
+                continue
+            other_lesson = self.unit_lesson[other]
+            if other_lesson == lesson or slot not in self.allowed_set[other_lesson]:
+                continue
+            self.remove(other)
+            if not self.occupants(other_lesson, slot):
+                before = current + self.spread_cost(other_lesson, candidate)
+                after = self.spread_cost(lesson, candidate) + self.spread_cost(other_lesson, slot)
+                if after < before:
+                    self.place(unit, candidate)
+                    self.place(other, slot)
+                    return True
+            self.place(other, candidate)
+        self.place(unit, slot)
+        return False
+
+    def _restore(self, slots: List[int]) -> List[int]:
+        for unit, slot in enumerate(self.unit_slot):
+            if slot >= 0:
+                self.remove(unit)
+        unplaced = []
+        for unit, slot in enumerate(slots):
+            if slot >= 0:
+                self.place(unit, slot)
+            else:
+                unplaced.append(unit)
+        return unplaced
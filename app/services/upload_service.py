@@ -1,24 +1,127 @@
-from sqlalchemy.orm import Session
+import asyncio
+from collections import Counter
+from typing import Dict, List, NamedTuple
+from uuid import UUID
 from schemas.upload import UploadCreate
-from services.base_service import BaseService
-from models.model import Upload
+from services.base_service import AsyncBaseService
+from models.model import Upload, UploadBlob
+from core.config import VIRUS_SCAN_ENABLED
+from core.storage import get_storage
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException
+from utils.constants import VirusScanStatusEnum
+from utils.file_utils import derivative_keys, place_blobs, remove_stored_files
 
-class UploadService(BaseService[Upload, UploadCreate]):
+
+class DownloadEntry(NamedTuple):
+    storage_path: str
+    checksum: str
+    content_type: str
+    original_filename: str
+    is_private: bool
+    virus_scan_status: VirusScanStatusEnum
+
+
+class UploadService(AsyncBaseService[Upload, UploadCreate]):
     def __init__(self, tenant_id: str):
         super().__init__(Upload, tenant_id)
-        
-    def create_upload_record(self, obj_in: UploadCreate):
+
+    async def create_upload_records(self, objs_in: List[UploadCreate], staged: Dict[str, str]) -> List[Upload]:
+        """
+        Insert the Upload rows of one request and reference their blobs in one transaction: one
+        upsert adds the request's references to every checksum, the staging files
+        ({staging_path: storage_path}) of content not stored yet are handed to the storage driver
+        while those blob rows are locked, and one INSERT ... RETURNING writes the Upload rows.
+        New content is queued for the virus scan worker (when VIRUS_SCAN_ENABLED); known content
+        gives its Upload rows the blob's verdict right away.
+        """
+        new_status = VirusScanStatusEnum.pending if VIRUS_SCAN_ENABLED else VirusScanStatusEnum.skipped
+        refs = Counter(obj_in.checksum for obj_in in objs_in)
+        sizes = {obj_in.checksum: (obj_in.storage_path, obj_in.file_size) for obj_in in objs_in}
         try:
-            with self.sessionmaker() as session:
-                file_record = Upload(**obj_in.model_dump())
-                session.add(file_record)
-                session.commit()
-                session.refresh(file_record)
-                return file_record
+            async with self.sessionmaker() as session:
+                async with session.begin():
+                    # Sorted, so concurrent requests lock shared blob rows in the same order
+                    upsert = pg_insert(UploadBlob).values([
+                        {"checksum": checksum, "storage_path": sizes[checksum][0], "file_size": sizes[checksum][1],
+                         "ref_count": refs[checksum], "scan_status": new_status}
+                        for checksum in sorted(refs)
+                    ])
+                    scan_status = dict((await session.execute(upsert.on_conflict_do_update(
+                        index_elements=[UploadBlob.checksum],
+                        set_={"ref_count": UploadBlob.__table__.c.ref_count + upsert.excluded.ref_count},
+                    ).returning(UploadBlob.checksum, UploadBlob.scan_status))).all())
+                    created = await place_blobs(staged)
+                    try:
+                        records = (await session.scalars(
+                            insert(Upload).returning(Upload, sort_by_parameter_order=True),
+                            [{**obj_in.model_dump(), "virus_scan_status": scan_status[obj_in.checksum]} for obj_in in objs_in],
+                        )).all()
+                    except SQLAlchemyError:
+                        # Still holding the blob row locks, so nobody else can rely on these blobs yet
+                        await asyncio.gather(*(get_storage().delete(key) for key in created))
+                        raise
+                return records
         except SQLAlchemyError as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"Error creating upload record: {str(e)}"
-            ) 
\ No newline at end of file
+            )
+
+    async def resolve_download(self, document_id: UUID) -> DownloadEntry:
+        """
+        The stored file of an active upload. Read on every request (one lookup on the unique
+        document_id index), so a delete, privacy change or scan verdict made by any worker
+        applies to the next download at once.
+        """
+        async with self.sessionmaker() as session:
+            row = (await session.execute(
+                select(Upload.storage_path, Upload.checksum, Upload.content_type, Upload.original_filename,
+                       Upload.is_private, Upload.virus_scan_status)
+                .where(Upload.document_id == document_id, Upload.is_active.is_(True), Upload.is_deleted.is_not(True))
+            )).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        return DownloadEntry(*row)
+
+    async def delete_upload(self, document_id: UUID) -> bool:
+        """
+        Delete an Upload row and release its blob. When the last reference goes, the blob is
+        moved aside while its row is locked and removed, with its previews, once the delete is committed: a
+        concurrent upload of the same content waits on the row and then stores the blob again.
+        """
+        storage = get_storage()
+        set_aside, orphan = None, None
+        try:
+            async with self.sessionmaker() as session:
+                async with session.begin():
+                    upload = (await session.execute(
+                        delete(Upload).where(Upload.document_id == document_id).returning(Upload.checksum, Upload.storage_path)
+                    )).first()
+                    if upload is None:
+                        return False
+                    blob = (await session.execute(
+                        update(UploadBlob)
+                        .where(UploadBlob.checksum == upload.checksum, UploadBlob.storage_path == upload.storage_path)
+                        .values(ref_count=UploadBlob.ref_count - 1)
+                        .returning(UploadBlob.ref_count, UploadBlob.storage_path)
+                    )).first()
+                    if blob is None:
+                        orphan = upload.storage_path  # stored before the blob store: one file per upload
+                    elif blob.ref_count <= 0:
+                        await session.execute(delete(UploadBlob).where(UploadBlob.checksum == upload.checksum))
+                        if await storage.exists(blob.storage_path):
+                            await storage.move(blob.storage_path, f"{blob.storage_path}.{document_id}.deleted")
+                            set_aside = f"{blob.storage_path}.{document_id}.deleted"
+        except BaseException:
+            if set_aside:
+                await storage.move(set_aside, blob.storage_path)
+            raise
+        if set_aside:
+            await storage.delete(set_aside)
+            await asyncio.gather(*(storage.delete(key) for key in derivative_keys(blob.storage_path)))
+        if orphan:
+            remove_stored_files([orphan])  # uploads from before the blob store are always on local disk
+        return True
@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator
+from uuid import UUID
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, or_, select, update
+from core.config import NODE_ID, UPLOAD_CHUNK_SIZE, UPLOAD_SESSION_PURGE_SECONDS, UPLOAD_SESSION_TTL_SECONDS
+from models.model import Upload, UploadSession
+from schemas.upload import UploadCreate, UploadSessionCreate
+from services.base_service import AsyncBaseService
+from services.upload_service import UploadService
+from utils.cache import TTLCache
+from utils.constants import FileExtensionEnum
+from utils.file_utils import blob_path, hash_file, open_staging_file, remove_stored_files, staging_path, write_at
+
+logger = logging.getLogger(__name__)
+
+# SHA-256 state of the sessions this process received chunks for: session id -> (offset, hasher)
+_hashers = TTLCache(maxsize=1024, ttl_seconds=UPLOAD_SESSION_TTL_SECONDS)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class UploadSessionService(AsyncBaseService[UploadSession, UploadSessionCreate]):
+    """
+    Resumable uploads. A session reserves a staging file; numbered chunks are written into it at
+    their offsets, and completing the session moves the staging file into the blob store and
+    creates the Upload row through UploadService, without copying the file again. The SHA-256
+    state follows the chunks in memory, so a session resumed on another worker is hashed from
+    disk once, when it completes. The staging file lives on the node (NODE_ID) that created the
+    session, so chunks, completion and abort are only accepted there. Sessions idle for
+    UPLOAD_SESSION_TTL_SECONDS are removed by run_purger() on their node.
+    """
+    def __init__(self, tenant_id: str):
+        super().__init__(UploadSession, tenant_id)
+
+    async def create_session(self, obj_in: UploadSessionCreate, user_id: UUID) -> dict:
+        ext = Path(obj_in.filename).suffix.lower().lstrip(".")
+        if ext not in FileExtensionEnum.__members__:
+            raise HTTPException(status_code=400, detail=f"Unsupported file extension: {ext or 'none'}")
+        async with self.sessionmaker() as session:
+            upload_session = UploadSession(
+                original_filename=obj_in.filename, file_extension=ext, content_type=obj_in.content_type.value,
+                file_category=obj_in.file_category, related_entity_id=obj_in.related_entity_id,
+                file_size=obj_in.file_size, chunk_size=UPLOAD_CHUNK_SIZE, received=0, finalizing=False,
+                created_by_id=user_id, expires_at=_utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS),
+                node_id=NODE_ID,
+            )
+            session.add(upload_session)
+            await session.commit()
+            return _state(upload_session)
+
+    async def get_state(self, session_id: UUID, user_id: UUID) -> dict:
+        return _state(await self.get_session(session_id, user_id))
+
+    async def get_session(self, session_id: UUID, user_id: UUID, local: bool = False) -> UploadSession:
+        """The caller's open session, or 404 (also once it expired or completed); 409 if `local` and on another node."""
+        async with self.sessionmaker() as session:
+            upload_session = await session.scalar(select(UploadSession).where(
+                UploadSession.id == session_id, UploadSession.created_by_id == user_id,
+                UploadSession.expires_at > _utcnow(),
+            ))
+        if upload_session is None:
+            raise HTTPException(status_code=404, detail="Upload session not found or expired")
+        if local and upload_session.node_id not in (None, NODE_ID):
+            raise HTTPException(status_code=409, detail="Upload session is held by another server, send its requests there")
+        return upload_session
+
+    async def put_chunk(self, session_id: UUID, index: int, user_id: UUID, body: AsyncIterator[bytes]) -> dict:
+        """
+        Store chunk `index`, covering bytes [index * chunk_size, (index + 1) * chunk_size). Chunks
+        are accepted in order; re-sending a stored chunk is a no-op, so clients can retry blindly.
+        The body is written to the staging file piece by piece as it arrives.
+        """
+        upload_session = await self.get_session(session_id, user_id, local=True)
+        start = index * upload_session.chunk_size
+        if index < 0 or start >= upload_session.file_size:
+            raise HTTPException(status_code=400, detail="Chunk index out of range")
+        end = min(start + upload_session.chunk_size, upload_session.file_size)
+        if end <= upload_session.received:
+            return _state(upload_session)
+        if start != upload_session.received or upload_session.finalizing:
+            raise _out_of_order(upload_session)
+
+        key = (str(self.tenant_id), str(session_id))
+        cached = _hashers.get(key)
+        # A copy: the cached state stays valid if this chunk turns out short or too long
+        hasher = hashlib.sha256() if start == 0 else (cached[1].copy() if cached and cached[0] == start else None)
+        # Bytes past `received` are not part of the file yet, so a failed chunk is simply overwritten by its retry
+        fd = await run_in_threadpool(open_staging_file, staging_path(session_id))
+        try:
+            offset = start
+            async for piece in body:
+                if offset + len(piece) > end:
+                    offset = None  # too long
+                    break
+                await run_in_threadpool(write_at, fd, offset, piece, hasher)
+                offset += len(piece)
+        finally:
+            os.close(fd)
+        if offset != end:
+            raise HTTPException(status_code=400, detail=f"Chunk {index} must be exactly {end - start} bytes")
+
+        async with self.sessionmaker() as session:
+            # Only one request may move `received` past this chunk
+            updated = await session.scalar(
+                update(UploadSession)
+                .where(UploadSession.id == session_id, UploadSession.received == start, UploadSession.finalizing.is_(False))
+                .values(received=end, expires_at=_utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS))
+                .returning(UploadSession)
+            )
+            await session.commit()
+        if updated is None:
+            upload_session = await self.get_session(session_id, user_id)
+            if end <= upload_session.received:
+                return _state(upload_session)
+            raise _out_of_order(upload_session)
+        if hasher is not None:
+            _hashers.set(key, (end, hasher))
+        else:
+            _hashers.pop(key)
+        return _state(updated)
+
+    async def complete(self, session_id: UUID, user_id: UUID) -> Upload:
+        async with self.sessionmaker() as session:
+            upload_session = await session.scalar(
+                update(UploadSession)
+                .where(
+                    UploadSession.id == session_id, UploadSession.created_by_id == user_id,
+                    UploadSession.expires_at > _utcnow(), UploadSession.finalizing.is_(False),
+                    UploadSession.received == UploadSession.file_size,
+                    or_(UploadSession.node_id.is_(None), UploadSession.node_id == NODE_ID),
+                )
+                .values(finalizing=True)
+                .returning(UploadSession)
+            )
+            await session.commit()
+        if upload_session is None:
+            upload_session = await self.get_session(session_id, user_id, local=True)
+            if upload_session.finalizing:
+                raise HTTPException(status_code=409, detail="Upload session is already being completed")
+            raise HTTPException(status_code=409, detail={
+                "message": "Not every chunk has been received",
+                "received": upload_session.received, "next_chunk": _state(upload_session)["next_chunk"],
+            })
+
+        path = staging_path(session_id)
+        key = (str(self.tenant_id), str(session_id))
+        try:
+            cached = _hashers.pop(key)
+            if cached and cached[0] == upload_session.file_size:
+                checksum = cached[1].hexdigest()
+            else:
+                checksum = await run_in_threadpool(hash_file, path)
+            storage_path = blob_path(self.tenant_id, checksum)
+            upload = UploadCreate(
+                document_id=upload_session.id,
+                original_filename=upload_session.original_filename,
+                file_extension=upload_session.file_extension,
+                content_type=upload_session.content_type,
+                file_size=upload_session.file_size,
+                checksum=checksum,
+                storage_path=storage_path,
+                file_category=upload_session.file_category,
+                related_entity_id=upload_session.related_entity_id,
+                is_active=True,
+            )
+            record = (await UploadService(self.tenant_id).create_upload_records([upload], {str(path): storage_path}))[0]
+        except BaseException:
+            # Completion can be retried as long as the received file is still there
+            await self._end_session(session_id, keep=path.exists())
+            raise
+        await self._end_session(session_id)
+        return record
+
+    async def abort(self, session_id: UUID, user_id: UUID):
+        await self.get_session(session_id, user_id, local=True)
+        await self._end_session(session_id)
+
+    async def purge_expired(self):
+        """Remove the tenant's expired sessions held by this node, with their staging files."""
+        async with self.sessionmaker() as session:
+            expired = (await session.scalars(
+                delete(UploadSession)
+                .where(
+                    UploadSession.expires_at <= _utcnow(),
+                    # Other nodes' staging files are out of reach: their own sweep removes those sessions
+                    or_(UploadSession.node_id.is_(None), UploadSession.node_id == NODE_ID),
+                )
+                .returning(UploadSession.id)
+            )).all()
+            await session.commit()
+        for session_id in expired:
+            _hashers.pop((str(self.tenant_id), str(session_id)))
+        remove_stored_files([staging_path(session_id) for session_id in expired])
+
+    async def _end_session(self, session_id: UUID, keep: bool = False):
+        async with self.sessionmaker() as session:
+            if keep:
+                await session.execute(update(UploadSession).where(UploadSession.id == session_id).values(finalizing=False))
+            else:
+                await session.execute(delete(UploadSession).where(UploadSession.id == session_id))
+            await session.commit()
+        if not keep:
+            _hashers.pop((str(self.tenant_id), str(session_id)))
+            remove_stored_files([staging_path(session_id)])
+
+
+async def run_purger(stop: asyncio.Event):
+    """Sweep every tenant's expired sessions every UPLOAD_SESSION_PURGE_SECONDS until `stop` is set."""
+    from core.tenant_directory import tenant_directory
+
+    while not stop.is_set():
+        for tenant_id in tenant_directory.tenant_ids():
+            try:
+                await UploadSessionService(tenant_id).purge_expired()
+            except Exception:
+                logger.exception("Upload session sweep failed for tenant %s", tenant_id)
+        try:
+            await asyncio.wait_for(stop.wait(), UPLOAD_SESSION_PURGE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _state(upload_session: UploadSession) -> dict:
+    chunk_count = -(-upload_session.file_size // upload_session.chunk_size)
+    complete = upload_session.received >= upload_session.file_size
+    return {
+        "id": upload_session.id,
+        "original_filename": upload_session.original_filename,
+        "file_size": upload_session.file_size,
+        "chunk_size": upload_session.chunk_size,
+        "chunk_count": chunk_count,
+        "received": upload_session.received,
+        "next_chunk": None if complete else upload_session.received // upload_session.chunk_size,
+        "expires_at": upload_session.expires_at,
+    }
+
+
+def _out_of_order(upload_session: UploadSession) -> HTTPException:
+    return HTTPException(status_code=409, detail={
+        "message": "Chunks must be sent in order",
+        "received": upload_session.received, "next_chunk": _state(upload_session)["next_chunk"],
+    })
@@ -0,0 +1,168 @@
+"""
+Background virus scanning of uploaded blobs. Upload requests only queue work: a new blob starts
+with scan_status "pending", and worker processes claim pending blobs in batches, stream them from
+storage to clamd, and write a batch's results in one transaction. Run the workers with:
+
+    python -m services.virus_scan_service --processes 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+from datetime import timedelta
+from typing import List
+from sqlalchemy import Interval, bindparam, func, select, update
+from core.config import (
+    CLAMD_HOST, CLAMD_PORT, CLAMD_SOCKET, CLAMD_TIMEOUT_SECONDS, VIRUS_SCAN_BATCH_SIZE, VIRUS_SCAN_CONCURRENCY,
+    VIRUS_SCAN_LEASE_SECONDS, VIRUS_SCAN_MAX_ATTEMPTS, VIRUS_SCAN_POLL_SECONDS,
+)
+from core.storage import get_storage
+from models.model import Upload, UploadBlob
+from schemas.upload import UploadCreate
+from services.base_service import AsyncBaseService
+from utils.clamd import ClamdClient, ClamdError
+from utils.constants import VirusScanStatusEnum
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_SECONDS = 30
+
+
+class VirusScanService(AsyncBaseService[UploadBlob, UploadCreate]):
+    """
+    One tenant's scan queue. Blobs are claimed with FOR UPDATE SKIP LOCKED and a lease
+    (scan_claimed_until), so any number of workers can share the queue and a blob held by a
+    crashed worker is picked up again once its lease runs out.
+    """
+    def __init__(self, tenant_id: str):
+        super().__init__(UploadBlob, tenant_id)
+
+    async def claim(self, limit: int = VIRUS_SCAN_BATCH_SIZE) -> list:
+        async with self.sessionmaker() as session:
+            queued = (
+                select(UploadBlob.checksum)
+                .where(
+                    UploadBlob.scan_status == VirusScanStatusEnum.pending,
+                    UploadBlob.scan_available_at <= func.now(),
+                    (UploadBlob.scan_claimed_until.is_(None)) | (UploadBlob.scan_claimed_until < func.now()),
+                )
+                .order_by(UploadBlob.scan_available_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            claimed = (await session.execute(
+                update(UploadBlob)
+                .where(UploadBlob.checksum.in_(queued.scalar_subquery()))
+                .values(scan_claimed_until=func.now() + timedelta(seconds=VIRUS_SCAN_LEASE_SECONDS))
+                .returning(UploadBlob.checksum, UploadBlob.storage_path, UploadBlob.scan_attempts)
+            )).all()
+            await session.commit()
+            return claimed
+
+    async def scan_batch(self, client: ClamdClient, concurrency: int = VIRUS_SCAN_CONCURRENCY) -> int:
+        """Claim, scan and record one batch. Returns the number of blobs processed."""
+        claimed = await self.claim()
+        if not claimed:
+            return 0
+        storage = get_storage()
+        limit = asyncio.Semaphore(concurrency)
+
+        async def scan(blob) -> dict:
+            async with limit:
+                try:
+                    infected, signature = await client.scan(storage.iter_bytes(blob.storage_path))
+                    status = VirusScanStatusEnum.infected if infected else VirusScanStatusEnum.clean
+                    return {"blob_checksum": blob.checksum, "blob_path": blob.storage_path,
+                            "verdict": status, "result": signature,
+                            "attempts": blob.scan_attempts + 1, "retry_delay": timedelta(0)}
+                except Exception as e:
+                    # Storage errors too (boto, missing file): every claimed blob needs a result, or it
+                    # stays leased and its attempts are never counted
+                    attempts = blob.scan_attempts + 1
+                    final = attempts >= VIRUS_SCAN_MAX_ATTEMPTS
+                    logger.warning("Scan of blob %s failed (attempt %d): %s", blob.checksum, attempts, e,
+                                   exc_info=not isinstance(e, (ClamdError, OSError)))
+                    return {"blob_checksum": blob.checksum, "blob_path": blob.storage_path,
+                            "verdict": VirusScanStatusEnum.failed if final else VirusScanStatusEnum.pending,
+                            "result": str(e)[:500], "attempts": attempts,
+                            "retry_delay": timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (attempts - 1))}
+
+        results = await asyncio.gather(*(scan(blob) for blob in claimed))
+        await self.record(results)
+        return len(results)
+
+    async def record(self, results: List[dict]):
+        """
+        Write a batch of results in one transaction: the blobs first (retries go back to the
+        queue with a backoff), then every pending Upload row of the blobs that got a verdict.
+        """
+        blobs = UploadBlob.__table__
+        verdicts = [r for r in results if r["verdict"] != VirusScanStatusEnum.pending]
+        async with self.sessionmaker() as session:
+            await session.execute(
+                update(blobs).where(blobs.c.checksum == bindparam("blob_checksum")).values(
+                    scan_status=bindparam("verdict"), scan_result=bindparam("result"),
+                    scan_attempts=bindparam("attempts"), scan_claimed_until=None,
+                    scan_available_at=func.now() + bindparam("retry_delay", type_=Interval()),
+                ),
+                [{key: r[key] for key in ("blob_checksum", "verdict", "result", "attempts", "retry_delay")} for r in results],
+            )
+            if verdicts:
+                uploads = Upload.__table__
+                await session.execute(
+                    update(uploads)
+                    .where(
+                        uploads.c.checksum == bindparam("blob_checksum"),
+                        uploads.c.storage_path == bindparam("blob_path"),
+                        uploads.c.virus_scan_status == VirusScanStatusEnum.pending,
+                    )
+                    .values(virus_scan_status=bindparam("verdict")),
+                    [{key: r[key] for key in ("blob_checksum", "blob_path", "verdict")} for r in verdicts],
+                )
+            await session.commit()
+
+
+async def run_worker(stop: asyncio.Event):
+    """Drain every tenant's queue, then poll every VIRUS_SCAN_POLL_SECONDS, until `stop` is set."""
+    from core.tenant_directory import tenant_directory
+
+    client = ClamdClient(CLAMD_HOST, CLAMD_PORT, CLAMD_SOCKET, CLAMD_TIMEOUT_SECONDS)
+    while not stop.is_set():
+        processed = 0
+        for tenant_id in tenant_directory.tenant_ids():
+            try:
+                processed += await VirusScanService(tenant_id).scan_batch(client)
+            except Exception:
+                logger.exception("Virus scan batch failed for tenant %s", tenant_id)
+        if not processed:
+            try:
+                await asyncio.wait_for(stop.wait(), VIRUS_SCAN_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+def _worker_process():
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        await run_worker(stop)
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan uploaded files with clamd")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes (each scans VIRUS_SCAN_CONCURRENCY files at a time)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.processes == 1:
+        _worker_process()
+    else:
+        workers = [multiprocessing.Process(target=_worker_process) for _ in range(args.processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
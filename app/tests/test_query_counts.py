@@ -0,0 +1,82 @@
+"""
+Statements each read endpoint runs against the tenant database. The load graphs declared by the
+services (detail_options / list_options, relationships are lazy="raise") keep these constant in
+the number of rows returned; a change here means a graph or a route gained or lost a query.
+"""
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ADDRESS = {"houseNo": "1", "streetAddress": "Main Road", "landmark": "Park", "city": "Pune",
+           "state": "MH", "zipCode": "411001", "country": "India"}
+ROWS = 3  # rows per list, so an N+1 load shows up as extra statements
+
+EXPECTED = {
+    "GET /students/": 5,
+    "GET /students/{id}": 5,
+    "GET /parents/": 2,
+    "GET /parents/{id}": 2,
+    "GET /teachers/": 2,
+    "GET /teachers/{id}": 2,
+    "GET /classes/": 1,
+    "GET /classes/{id}": 1,
+    "GET /subjects/": 1,
+    "GET /subjects/{id}": 1,
+    "GET /schedules/": 1,
+    "GET /schedules/{id}": 1,
+}
+
+
+class StatementCounter:
+    def __init__(self, database: str):
+        self.database = database
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.engine.url.database == self.database:
+            self.count += 1
+
+
+@pytest.fixture(scope="module")
+def seeded(client):
+    def post(url, json):
+        response = client.post(url, json=json)
+        assert response.status_code in (200, 201), response.text
+        return response.json()["id"]
+
+    parents = [post("/parents/", {"firstName": f"Parent {i}", "email": f"parent{i}@example.com",
+                                  "addresses": [{"address_type": "home", "address": ADDRESS}]}) for i in range(ROWS)]
+    students = [post("/students/", {"firstName": f"Student {i}", "casteCategory": "general", "email": f"student{i}@example.com",
+                                    "parentData": [{"id": parents[i], "relationship": "Father"}],
+                                    "addressData": [{"addressType": "home", "address": ADDRESS}]}) for i in range(ROWS)]
+    teachers = [post("/teachers/", {"firstName": f"Teacher {i}", "email": f"teacher{i}@example.com", "employeeId": f"E{i}",
+                                    "joiningDate": "2024-06-01", "qualifications": ["B.Ed"],
+                                    "addresses": [{"addressType": "home", "address": ADDRESS}]}) for i in range(ROWS)]
+    classes = [post("/classes/", {"name": f"Class {i}"}) for i in range(ROWS)]
+    subjects = [post("/subjects/", {"name": f"Subject {i}"}) for i in range(ROWS)]
+    for i in range(ROWS):
+        client.post(f"/classes/{classes[i]}/students/", json=[{"classId": classes[i], "studentId": s} for s in students])
+        client.post(f"/classes/{classes[i]}/subjects/", json=[{"classId": classes[i], "subjectId": s} for s in subjects])
+        client.post(f"/subjects/{subjects[i]}/teachers/", json=[{"subjectId": subjects[i], "teacherId": t} for t in teachers])
+    schedules = [post("/schedules/", {"class_id": classes[i], "day_of_week": "Monday", "period_number": 1,
+                                      "subject_id": subjects[i], "teacher_id": teachers[i]}) for i in range(ROWS)]
+    return {"students": students, "parents": parents, "teachers": teachers, "classes": classes,
+            "subjects": subjects, "schedules": schedules}
+
+
+@pytest.mark.parametrize("endpoint", list(EXPECTED))
+def test_statements_per_endpoint(client, databases, seeded, endpoint):
+    method, path = endpoint.split(" ")
+    collection = path.strip("/").split("/")[0]
+    url = path.replace("{id}", str(seeded[collection][0]))
+    counter = StatementCounter(databases["tenant_db"])
+    client.get(url)  # the signed-in user is cached (central database) after the first request
+    event.listen(Engine, "before_cursor_execute", counter)
+    try:
+        response = client.request(method, url)
+    finally:
+        event.remove(Engine, "before_cursor_execute", counter)
+    assert response.status_code == 200, response.text
+    if path.endswith("/"):
+        assert len(response.json()["items"] if isinstance(response.json(), dict) else response.json()) == ROWS
+    assert counter.count == EXPECTED[endpoint], f"{endpoint} ran {counter.count} statements"
@@ -0,0 +1,39 @@
+"""The solver on its own: no database needed."""
+from services.timetable_solver import Lesson, TimetableProblem, solve
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+PERIODS = 6
+
+
+def _tight_problem(classes: int) -> TimetableProblem:
+    """
+    Every class full, taught by teachers i and i+1 so every teacher is fully booked (construction
+    alone leaves periods over), plus one lesson whose teacher is free only on Monday period 1,
+    when its room is taken.
+    """
+    lessons = []
+    for i in range(classes):
+        lessons.append(Lesson(f"class{i}", "maths", f"teacher{i}", f"room{i}", 15))
+        lessons.append(Lesson(f"class{i}", "english", f"teacher{(i + 1) % classes}", f"room{i}", 15))
+    lessons.append(Lesson("extra", "music", "visitor", "hall", 1))
+    class_periods = {**{f"class{i}": PERIODS for i in range(classes)}, "extra": PERIODS}
+    busy = {
+        ("teacher", "visitor"): {(day, period) for day in range(len(DAYS)) for period in range(PERIODS)} - {(0, 0)},
+        ("room", "hall"): {(0, 0)},
+    }
+    return TimetableProblem(DAYS, class_periods, lessons, busy)
+
+
+def test_unplaceable_lesson_is_reported_before_solving():
+    problem = _tight_problem(4)
+    assert problem.overloaded() == []  # each resource on its own has room
+    assert problem.unplaceable() == [
+        {"class_id": "extra", "subject_id": "music", "teacher_id": "visitor", "periods": 1, "free_slots": 0}
+    ]
+
+
+def test_unplaceable_lesson_does_not_stop_the_repair():
+    problem = _tight_problem(30)
+    result = solve(problem, seed=1, time_limit=30)
+    assert result.unplaced == {len(problem.lessons) - 1: 1}  # only the impossible period is left over
+    assert len(result.placements) == 30 * 30
@@ -0,0 +1,29 @@
+"""Cached users are evicted when a change to their row commits, not when it is flushed."""
+from sqlalchemy.orm import Session
+
+
+def test_user_evicted_on_commit_only(databases):
+    from api.dependencies import user_cache
+    from core.database import get_central_db
+    from models.model import UserMaster
+
+    admin_id = databases["admin_id"]
+    key = (str(admin_id), "test-token")
+    with Session(get_central_db()) as session:
+        user = session.get(UserMaster, admin_id)
+        user_cache.set(key, "cached")
+
+        user.failed_login_attempts += 1
+        session.flush()
+        assert user_cache.get(key) == "cached"  # not committed yet: a reader still sees the old row
+        session.rollback()
+        assert user_cache.get(key) == "cached"  # nothing changed
+
+        user = session.get(UserMaster, admin_id)
+        user.failed_login_attempts += 1
+        session.commit()
+        assert user_cache.get(key) is None
+
+        user = session.get(UserMaster, admin_id)
+        user.failed_login_attempts = 0
+        session.commit()
@@ -0,0 +1,178 @@
+"""
+The scan queue against a clamd stub: a thread speaking the INSTREAM protocol on a local port,
+which finds the EICAR test string and answers ERROR for files containing b"ERROR".
+"""
+import hashlib
+import os
+import socketserver
+import struct
+import threading
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, insert, select, update
+
+EICAR = b"X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"
+
+
+class ClamdStub(socketserver.BaseRequestHandler):
+    def handle(self):
+        stream = self.request.makefile("rb")
+        assert stream.read(10) == b"zINSTREAM\0"
+        data = b""
+        while size := struct.unpack("!L", stream.read(4))[0]:
+            data += stream.read(size)
+        if EICAR in data:
+            reply = b"stream: Eicar-Test-Signature FOUND\0"
+        elif b"ERROR" in data:
+            reply = b"INSTREAM size limit exceeded. ERROR\0"
+        else:
+            reply = b"stream: OK\0"
+        self.request.sendall(reply)
+
+
+@pytest.fixture(scope="module")
+def clamd():
+    from utils.clamd import ClamdClient
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), ClamdStub)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield ClamdClient("127.0.0.1", server.server_address[1], timeout=5)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    import core.storage
+
+    class FlakyStorage(core.storage.LocalStorage):
+        """Fails like a remote store (e.g. a botocore ClientError) for keys ending in "flaky"."""
+        async def iter_bytes(self, key, chunk_size=core.storage.READ_CHUNK_SIZE):
+            if key.endswith("flaky"):
+                raise RuntimeError("An error occurred (SlowDown) when calling the GetObject operation")
+            async for chunk in super().iter_bytes(key, chunk_size):
+                yield chunk
+
+    storage = FlakyStorage(str(tmp_path))
+    monkeypatch.setattr(core.storage, "_storage", storage)
+    return storage
+
+
+@pytest.fixture
+def tenant_db(databases):
+    engine = create_engine(os.environ["DATABASE_URL"])  # the tenant database, set up by conftest
+    yield engine
+    engine.dispose()
+
+
+def _queue(tenant_db, storage, contents: dict) -> dict:
+    """Store `contents` ({name: bytes, or None for no file}) as pending blobs with one Upload each."""
+    from models.model import Upload, UploadBlob
+
+    checksums = {}
+    with tenant_db.begin() as conn:
+        for name, content in contents.items():
+            checksum = hashlib.sha256(name.encode() + uuid.uuid4().bytes).hexdigest()
+            key = f"uploads/blobs/test/{checksum}.{name}"
+            if content is not None:
+                path = storage.path(key)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(content)
+            conn.execute(insert(UploadBlob.__table__).values(
+                checksum=checksum, storage_path=key, file_size=len(content or b""), ref_count=1,
+            ))
+            conn.execute(insert(Upload.__table__).values(
+                document_id=uuid.uuid4(), original_filename=name, checksum=checksum, storage_path=key,
+            ))
+            checksums[name] = checksum
+    return checksums
+
+
+def _scan_state(tenant_db, checksum: str):
+    from models.model import Upload, UploadBlob
+
+    with tenant_db.connect() as conn:
+        blob = conn.execute(select(UploadBlob).where(UploadBlob.checksum == checksum)).one()
+        upload_status = conn.execute(select(Upload.virus_scan_status).where(Upload.checksum == checksum)).scalar_one()
+    return blob, upload_status
+
+
+def test_scan_batch_records_a_result_for_every_blob(client, databases, tenant_db, storage, clamd):
+    from services.virus_scan_service import VirusScanService
+    from utils.constants import VirusScanStatusEnum as Status
+
+    checksums = _queue(tenant_db, storage, {
+        "clean": b"hello", "infected": EICAR, "error": b"ERROR", "missing": None, "flaky": b"hello again",
+    })
+    processed = client.portal.call(VirusScanService(databases["tenant_id"]).scan_batch, clamd)
+    assert processed == len(checksums)
+
+    expected = {"clean": Status.clean, "infected": Status.infected,
+                "error": Status.pending, "missing": Status.pending, "flaky": Status.pending}
+    for name, status in expected.items():
+        blob, upload_status = _scan_state(tenant_db, checksums[name])
+        assert (blob.scan_status, upload_status) == (status, status), name
+        assert blob.scan_attempts == 1, name
+        assert blob.scan_claimed_until is None, name  # the lease is released whatever happened
+    assert _scan_state(tenant_db, checksums["infected"])[0].scan_result == "Eicar-Test-Signature"
+    assert "SlowDown" in _scan_state(tenant_db, checksums["flaky"])[0].scan_result
+
+
+def test_scan_gives_up_after_max_attempts(client, databases, tenant_db, storage, clamd):
+    from core.config import VIRUS_SCAN_MAX_ATTEMPTS
+    from models.model import UploadBlob
+    from services.virus_scan_service import VirusScanService
+    from utils.constants import VirusScanStatusEnum as Status
+
+    checksum = _queue(tenant_db, storage, {"flaky": b"never readable"})["flaky"]
+    with tenant_db.begin() as conn:
+        # Every other pending blob out of the way, and this one due for its last attempt now
+        conn.execute(update(UploadBlob).where(UploadBlob.checksum != checksum).values(scan_status=Status.skipped))
+        conn.execute(update(UploadBlob).where(UploadBlob.checksum == checksum).values(scan_attempts=VIRUS_SCAN_MAX_ATTEMPTS - 1))
+
+    assert client.portal.call(VirusScanService(databases["tenant_id"]).scan_batch, clamd) == 1
+    blob, upload_status = _scan_state(tenant_db, checksum)
+    assert (blob.scan_status, upload_status) == (Status.failed, Status.failed)
+    assert client.portal.call(VirusScanService(databases["tenant_id"]).scan_batch, clamd) == 0
+
+
+def test_legacy_upload_is_scanned_and_served_after_migration(client, databases, tenant_db, storage, clamd, tmp_path, monkeypatch):
+    import api.routes.upload
+    import core.config
+    from core.migrations import migrate_legacy_uploads
+    from models.model import Upload
+    from services.virus_scan_service import VirusScanService
+    from utils.constants import VirusScanStatusEnum as Status
+
+    # Stored before the blob store: a path relative to the working directory and no blob row
+    monkeypatch.chdir(tmp_path)
+    for module in (core.config, api.routes.upload):
+        monkeypatch.setattr(module, "VIRUS_SCAN_ENABLED", True)
+    content = b"legacy " + uuid.uuid4().bytes
+    legacy = {"kept": f"uploads/documents/{uuid.uuid4()}.txt", "lost": f"uploads/documents/{uuid.uuid4()}.txt"}
+    (tmp_path / "uploads" / "documents").mkdir(parents=True)
+    (tmp_path / legacy["kept"]).write_bytes(content)
+    document_ids = {name: uuid.uuid4() for name in legacy}
+    with tenant_db.begin() as conn:
+        for name, path in legacy.items():
+            conn.execute(insert(Upload.__table__).values(
+                document_id=document_ids[name], original_filename=f"{name}.txt", storage_path=path, is_active=True,
+                checksum=hashlib.sha256(content).hexdigest() if name == "kept" else None,
+            ))
+
+    migrate_legacy_uploads(tenant_db, databases["tenant_id"])
+    with tenant_db.connect() as conn:
+        status = dict(conn.execute(select(Upload.document_id, Upload.virus_scan_status)
+                                   .where(Upload.document_id.in_(document_ids.values()))).all())
+    assert status[document_ids["lost"]] == Status.failed  # nothing left to scan
+    assert status[document_ids["kept"]] == Status.pending
+    assert not (tmp_path / legacy["kept"]).exists()
+    assert client.get(f"/upload/{document_ids['kept']}").status_code == 409
+
+    client.portal.call(VirusScanService(databases["tenant_id"]).scan_batch, clamd)
+    response = client.get(f"/upload/{document_ids['kept']}")
+    assert response.status_code == 200
+    assert response.content == content
@@ -0,0 +1,25 @@
+import hashlib
+import re
+from typing import Any
+
+# Order matters: it is part of the hashed key
+ADDRESS_KEY_FIELDS = ("house_no", "street_address", "landmark", "city", "state", "zip_code", "country")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def canonical_address_part(value: Any) -> str:
+    """Trim, collapse internal whitespace and casefold; None and blank are the same."""
+    if value is None:
+        return ""
+    return _WHITESPACE.sub(" ", str(value)).strip().casefold()
+
+
+def address_dedup_key(address: Any) -> str:
+    """
+    SHA-256 (hex) of the canonicalized address fields, used as the unique dedup key of
+    `addresses`. Accepts an Address row, an AddressBase schema or a dict.
+    """
+    get = address.get if isinstance(address, dict) else lambda field: getattr(address, field, None)
+    canonical = "\x1f".join(canonical_address_part(get(field)) for field in ADDRESS_KEY_FIELDS)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
@@ -0,0 +1,55 @@
+import asyncio
+import struct
+from typing import AsyncIterator, Optional, Tuple
+
+INSTREAM_CHUNK_SIZE = 256 * 1024
+
+
+class ClamdError(Exception):
+    """The scan did not produce a verdict (daemon unreachable, timeout, size limit, ERROR reply)."""
+
+
+class ClamdClient:
+    """
+    Minimal async client for clamd's INSTREAM command: the file is streamed to the daemon in
+    length-prefixed chunks, so it never has to be readable by the clamd host.
+    """
+    def __init__(self, host: str = "localhost", port: int = 3310, socket_path: Optional[str] = None, timeout: float = 60):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    async def scan(self, chunks: AsyncIterator[bytes]) -> Tuple[bool, Optional[str]]:
+        """Return (infected, signature). Raises ClamdError when there is no verdict."""
+        try:
+            return await asyncio.wait_for(self._scan(chunks), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            raise ClamdError(f"{type(e).__name__}: {e}") from e
+
+    async def _scan(self, chunks: AsyncIterator[bytes]) -> Tuple[bool, Optional[str]]:
+        if self.socket_path:
+            reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(b"zINSTREAM\0")
+            try:
+                async for chunk in chunks:
+                    for start in range(0, len(chunk), INSTREAM_CHUNK_SIZE):
+                        piece = chunk[start:start + INSTREAM_CHUNK_SIZE]
+                        writer.write(struct.pack("!L", len(piece)))
+                        writer.write(piece)
+                        await writer.drain()
+                writer.write(struct.pack("!L", 0))
+                await writer.drain()
+            except ConnectionError:
+                pass  # clamd hangs up early on a size-limit error; its reply says why
+            reply = (await reader.readuntil(b"\0")).rstrip(b"\0").decode(errors="replace").strip()
+        finally:
+            writer.close()
+        if reply.endswith(" OK"):
+            return False, None
+        if reply.endswith(" FOUND"):
+            return True, reply.removeprefix("stream:").removesuffix(" FOUND").strip()
+        raise ClamdError(reply or "Empty reply from clamd")
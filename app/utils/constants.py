@@ -113,6 +113,8 @@ class RoleEnum(str, Enum):
     teacher = "teacher"
     student = "student"
 
+MAX_PERIOD_NUMBER = 32  # highest Schedule.period_number: the availability index keeps one bit per period of a day
+
 class DayOfWeekEnum(str, Enum):
     monday = "Monday"
     tuesday = "Tuesday"
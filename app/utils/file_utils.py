@@ -1,32 +1,171 @@
-import aiofiles
+import asyncio
+import csv
 import hashlib
+import io
+import os
+from datetime import date, datetime
 from pathlib import Path
-from fastapi import UploadFile
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from core.config import DERIVATIVE_SIZES
+from core.storage import get_storage
 import uuid
 
 UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
 
-async def save_and_get_metadata(file: UploadFile, subdir: str = "", algorithm: str = "sha256"):
-    ext = Path(file.filename).suffix.lower().lstrip(".")
-    unique_name = f"{uuid.uuid4()}.{ext}"
-    folder = UPLOAD_DIR / subdir
-    folder.mkdir(parents=True, exist_ok=True)
-    file_path = folder / unique_name
+BLOB_DIR = UPLOAD_DIR / "blobs"  # storage keys of the content-addressed blobs: blobs/<tenant>/<sha256[:2]>/<sha256>
+STAGING_DIR = UPLOAD_DIR / "staging"  # local files of uploads being received, handed to the storage driver once hashed
 
-    size = 0
-    hash_func = getattr(hashlib, algorithm)()
+COPY_CHUNK_SIZE = 1024 * 1024
 
-    async with aiofiles.open(file_path, "wb") as buffer:
-        while chunk := await file.read(1024 * 1024):
-            size += len(chunk)
-            hash_func.update(chunk)
-            await buffer.write(chunk)
+def blob_path(tenant_id: str, checksum: str) -> str:
+    """Storage key of a blob (see core/storage.py)."""
+    return (BLOB_DIR / str(tenant_id) / checksum[:2] / checksum).as_posix()
+
+# Previews of a blob are stored next to it, keyed by the blob's key, size and format
+DERIVATIVE_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+def derivative_key(blob_key: str, size: int, fmt: str) -> str:
+    return f"{blob_key}.{size}.{fmt}"
+
+def derivative_keys(blob_key: str) -> List[str]:
+    """Every preview key a blob can have, for removing them with it."""
+    return [derivative_key(blob_key, size, fmt) for size in DERIVATIVE_SIZES for fmt in DERIVATIVE_FORMATS]
 
+async def save_and_get_metadata(file: UploadFile, tenant_id: str):
+    """
+    Stream an upload into a staging file while hashing it and return its size, SHA-256 checksum,
+    the staging path and the blob path its content belongs at. The copy and the hashing run in a
+    worker thread (file I/O and hashlib release the GIL), so several uploads can be received at
+    once without blocking the event loop. The staging file is moved into place by place_blobs.
+    """
+    ext = Path(file.filename).suffix.lower().lstrip(".")
+    staging_path = STAGING_DIR / f"{uuid.uuid4()}.part"
+    size, checksum = await run_in_threadpool(_copy_and_hash, file.file, staging_path)
     await file.seek(0)
     return {
         "file_extension": ext,
-        "storage_path": str(file_path),
+        "staging_path": str(staging_path),
+        "storage_path": blob_path(tenant_id, checksum),
         "file_size": size,
-        "checksum": hash_func.hexdigest(),
+        "checksum": checksum,
     }
+
+def _copy_and_hash(source: BinaryIO, file_path: Path) -> Tuple[int, str]:
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    hash_func = hashlib.sha256()
+    size = 0
+    source.seek(0)
+    with open(file_path, "wb") as buffer:
+        while chunk := source.read(COPY_CHUNK_SIZE):
+            size += len(chunk)
+            hash_func.update(chunk)
+            buffer.write(chunk)
+    return size, hash_func.hexdigest()
+
+def staging_path(name) -> Path:
+    return STAGING_DIR / f"{name}.part"
+
+def open_staging_file(file_path: Path) -> int:
+    """Open a staging file for write_at(), creating it; the caller closes the descriptor."""
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    return os.open(file_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+def write_at(fd: int, offset: int, data: bytes, hasher=None):
+    """Write `data` at `offset` of an open file and feed it to `hasher` if one is given."""
+    view = memoryview(data)
+    while view:
+        view = view[os.pwrite(fd, view, offset + len(data) - len(view)):]
+    if hasher is not None:
+        hasher.update(data)
+
+def hash_file(file_path: Path) -> str:
+    hash_func = hashlib.sha256()
+    with open(file_path, "rb") as source:
+        while chunk := source.read(COPY_CHUNK_SIZE):
+            hash_func.update(chunk)
+    return hash_func.hexdigest()
+
+async def place_blobs(staged: Dict[str, str]) -> List[str]:
+    """
+    Hand staging files ({staging_path: storage key}) to the storage driver. Content that is
+    already stored keeps its blob and the duplicate staging file is dropped, so identical
+    content is written to storage once. Returns the keys created by this call.
+    """
+    storage = get_storage()
+    by_key = {}
+    for staging_path, key in staged.items():
+        by_key.setdefault(key, []).append(staging_path)
+
+    async def place(key: str, staging_paths: List[str]) -> bool:
+        if await storage.exists(key):
+            remove_stored_files(staging_paths)
+            return False
+        await storage.put_file(key, staging_paths[0])
+        remove_stored_files(staging_paths[1:])
+        return True
+
+    placed = await asyncio.gather(*(place(key, paths) for key, paths in by_key.items()))
+    return [key for key, created in zip(by_key, placed) if created]
+
+def remove_stored_files(paths):
+    """Best-effort cleanup of files stored for a request that failed."""
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
+
+def iter_table_rows(fileobj: BinaryIO, filename: str) -> Iterator[Tuple[int, dict]]:
+    """
+    Stream the rows of a .csv or .xlsx file as (row_number, {header: value}) without loading
+    the whole sheet. Row 1 is the header; blank cells are omitted and every value is a string
+    (dates as ISO strings), so both formats validate the same way.
+    """
+    ext = Path(filename or "").suffix.lower()
+    if ext == ".csv":
+        return _iter_csv_rows(fileobj)
+    if ext == ".xlsx":
+        return _iter_xlsx_rows(fileobj)
+    raise HTTPException(status_code=400, detail="Only .csv and .xlsx files can be imported")
+
+def _iter_csv_rows(fileobj: BinaryIO) -> Iterator[Tuple[int, dict]]:
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        header = [name.strip() for name in next(reader, [])]
+        for row_number, values in enumerate(reader, start=2):
+            row = {name: value.strip() for name, value in zip(header, values) if name and value.strip()}
+            if row:
+                yield row_number, row
+    finally:
+        text.detach()  # leave the upload's file open for its owner
+
+def _iter_xlsx_rows(fileobj: BinaryIO) -> Iterator[Tuple[int, dict]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise HTTPException(status_code=400, detail="XLSX import requires openpyxl; upload a CSV instead")
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else "" for name in next(rows, ())]
+        for row_number, values in enumerate(rows, start=2):
+            row = {}
+            for name, value in zip(header, values):
+                value = _cell_to_str(value)
+                if name and value:
+                    row[name] = value
+            if row:
+                yield row_number, row
+    finally:
+        workbook.close()
+
+def _cell_to_str(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == datetime.min.time() else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))  # phone numbers, roll numbers, ids typed as numbers
+    return str(value).strip()
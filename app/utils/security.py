@@ -1,8 +1,11 @@
 from passlib.context import CryptContext
-from jose import JWTError, jwt, ExpiredSignatureError
-from datetime import datetime, timedelta
-from typing import Optional
+from jose import JWTError, jwt, jwk, ExpiredSignatureError
+from jose.exceptions import JWTClaimsError
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Optional
 from fastapi import HTTPException, status
+from core.config import JWT_SECRET_KEY, JWT_ALGORITHM, JWT_PUBLIC_KEY_DIR, JWT_PRIVATE_KEY_PATH, JWT_SIGNING_KID
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -13,39 +16,75 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 # JWT token secret key and algorithm
-SECRET_KEY = "your-secret-key"
-ALGORITHM = "HS256"
+SECRET_KEY = JWT_SECRET_KEY
+ALGORITHM = JWT_ALGORITHM
+
+
+class TokenVerifier:
+    """
+    Verifies access tokens against signing keys that are parsed once and cached.
+
+    HS256 uses the shared `secret_key`. RS256 uses a key set indexed by the token's `kid`
+    header (`public_keys` maps kid -> PEM), so any node holding only public keys can verify.
+    """
+    def __init__(self, algorithm: str = ALGORITHM, secret_key: Optional[str] = SECRET_KEY,
+                 public_keys: Optional[Dict[str, str]] = None):
+        self.algorithm = algorithm
+        self._keys = {}
+        if algorithm.startswith("HS"):
+            self._keys[None] = jwk.construct(secret_key, algorithm)
+        for kid, pem in (public_keys or {}).items():
+            self._keys[kid] = jwk.construct(pem, algorithm)
+
+    @classmethod
+    def from_key_dir(cls, algorithm: str, key_dir: str) -> "TokenVerifier":
+        """Load `<kid>.pem` public keys from a directory."""
+        public_keys = {path.stem: path.read_text() for path in sorted(Path(key_dir).glob("*.pem"))}
+        return cls(algorithm=algorithm, secret_key=None, public_keys=public_keys)
+
+    def add_key(self, kid: str, pem: str):
+        """Register a new public key (e.g. during key rotation) without a restart."""
+        self._keys[kid] = jwk.construct(pem, self.algorithm)
+
+    def verify(self, token: str) -> dict:
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except JWTError as e:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Malformed token") from e
+
+        # HS tokens verify with the shared secret whatever their header; RS tokens need a known kid
+        key = self._keys.get(kid) or self._keys.get(None)
+        if key is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unknown signing key")
+
+        try:
+            # python-jose validates exp/nbf/iat itself
+            return jwt.decode(token, key, algorithms=[self.algorithm])
+        except ExpiredSignatureError as e:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired") from e
+        except JWTClaimsError as e:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token claims") from e
+        except JWTError as e:
+            # Catch JWT-specific exceptions (e.g., invalid signature)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate token") from e
+
+
+if JWT_PUBLIC_KEY_DIR:
+    token_verifier = TokenVerifier.from_key_dir(ALGORITHM, JWT_PUBLIC_KEY_DIR)
+else:
+    token_verifier = TokenVerifier()
+
+_signing_key = Path(JWT_PRIVATE_KEY_PATH).read_text() if JWT_PRIVATE_KEY_PATH else SECRET_KEY
+
+def create_access_token(claims: dict, expires_delta: timedelta = timedelta(minutes=30)) -> str:
+    """Sign an access token; include `role`, `tenant_id` and `username` for claims-only authorization."""
+    payload = dict(claims)
+    now = datetime.now(timezone.utc)
+    payload.setdefault("iat", now)
+    payload["exp"] = now + expires_delta
+    headers = {"kid": JWT_SIGNING_KID} if JWT_SIGNING_KID else None
+    return jwt.encode(payload, _signing_key, algorithm=ALGORITHM, headers=headers)
 
 def verify_access_token(token: str) -> Optional[dict]:
     """Verify access token."""
-    try:
-        # Decode the token and validate it
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        
-        # Validate expiration time
-        if payload.get("exp") and datetime.utcfromtimestamp(payload["exp"]) < datetime.utcnow():
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token has expired",
-            )
-        
-        # Return payload if the token is valid
-        return payload
-    
-    except ExpiredSignatureError as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired"
-        ) from e
-    except JWTError as e:
-        # Catch JWT-specific exceptions (e.g., invalid signature)
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate token",
-        ) from e
-    except Exception as e:
-        # Catch general errors, such as key errors or expired tokens
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token",
-        ) from e
+    return token_verifier.verify(token)
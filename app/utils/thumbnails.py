@@ -0,0 +1,36 @@
+"""
+Rendering of upload previews. Runs in the derivative process pool (services/derivative_service.py),
+so it imports nothing from the app. Pillow (and pypdfium2 for PDFs) are needed only here.
+"""
+PREVIEW_QUALITY = 80
+
+
+def render_derivative(source_path: str, content_type: str, size: int, fmt: str, target_path: str):
+    """
+    Write a `fmt` ("webp" or "jpeg") image of at most size x size pixels to `target_path`: the
+    image itself, or the first page of a PDF. Images are never enlarged.
+    """
+    from PIL import Image, ImageOps
+
+    if content_type == "application/pdf":
+        import pypdfium2
+
+        pdf = pypdfium2.PdfDocument(source_path)
+        try:
+            page = pdf[0]
+            image = page.render(scale=size / max(page.get_size())).to_pil()  # page size is in points (1/72 in)
+        finally:
+            pdf.close()
+    else:
+        image = Image.open(source_path)
+        image.draft("RGB", (size, size))  # JPEG: decode at a reduced scale when possible
+        image = ImageOps.exif_transpose(image)
+    image.thumbnail((size, size))
+
+    if fmt == "jpeg" and ("A" in image.getbands() or "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        image = Image.new("RGB", rgba.size, "white")
+        image.paste(rgba, mask=rgba.getchannel("A"))
+    elif image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA" if fmt == "webp" else "RGB")
+    image.save(target_path, format=fmt.upper(), quality=PREVIEW_QUALITY)